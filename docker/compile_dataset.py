@@ -0,0 +1,41 @@
+"""Compile a dataset to memory-mapped stores, for faster sampling.
+
+Run inside the docker container:
+
+    python /app/docker/compile_dataset.py dataset_name output_folder
+
+Then point a dataset's path at the output folder.
+"""
+
+import logging
+import sys
+
+sys.path.append("/app/")
+from opentopodata import arraystore, config
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) != 3:
+        logging.error("Usage: compile_dataset.py dataset_name output_folder")
+        sys.exit(1)
+    name, out_dir = sys.argv[1:]
+
+    try:
+        datasets = config.load_datasets()
+    except config.ConfigError as e:
+        logging.error("Invalid config: {}".format(str(e)))
+        sys.exit(1)
+
+    dataset = datasets.get(name)
+    source_types = (
+        config.SingleFileDataset,
+        config.TiledDataset,
+        config.IndexedDataset,
+    )
+    if not isinstance(dataset, source_types):
+        logging.error(f"Dataset '{name}' can't be compiled.")
+        sys.exit(1)
+
+    arraystore.compile_dataset(dataset, out_dir)
+    logging.info(f"{name}: compiled to '{out_dir}'.")
@@ -28,8 +28,8 @@ handler.setFormatter(formatter)
 logger.addHandler(handler)
 
 
-def run_cmd(cmd, shell=False):
-    r = subprocess.run(cmd, shell=shell, capture_output=True)
+def run_cmd(cmd, shell=False, **kwargs):
+    r = subprocess.run(cmd, shell=shell, capture_output=True, **kwargs)
     is_error = r.returncode != 0
     stdout = r.stdout.decode("utf-8")
     if is_error:
@@ -49,17 +49,32 @@ def run_cmd(cmd, shell=False):
 def reload_config():
     global LAST_INVOCATION_TIME
     LAST_INVOCATION_TIME = time.time()
-    logger.info("Restarting OTD due to config change.")
-    run_cmd(["supervisorctl", "-c", "/app/docker/supervisord.conf", "stop", "uwsgi"])
-    run_cmd(
-        ["supervisorctl", "-c", "/app/docker/supervisord.conf", "restart", "memcached"]
-    )
-    run_cmd(["supervisorctl", "-c", "/app/docker/supervisord.conf", "start", "uwsgi"])
+    logger.info("Reloading OTD due to config change.")
+
+    # The new config is published to the running workers, which switch to it
+    # between requests. Publishing runs in a new process, as the web user, so
+    # the files it writes (like dataset indexes) are readable by the workers.
+    try:
+        run_cmd(
+            [sys.executable, __file__, "--publish"], user="www-data", group="www-data"
+        )
+    except ValueError:
+        logger.error("Unable to load the new config, still using the old one.")
+        LAST_INVOCATION_TIME = time.time()
+        return
+
+    # Dataset folders may have changed.
     run_cmd(
-        ["supervisorctl", "-c", "/app/docker/supervisord.conf", "start", "warm_cache"]
+        [
+            "supervisorctl",
+            "-c",
+            "/app/docker/supervisord.conf",
+            "restart",
+            "watch_datasets",
+        ]
     )
     LAST_INVOCATION_TIME = time.time()
-    logger.info("Restarted OTD due to config change.")
+    logger.info("Reloaded OTD due to config change.")
 
 
 class Handler(FileSystemEventHandler):
@@ -97,6 +112,14 @@ class Handler(FileSystemEventHandler):
 
 if __name__ == "__main__":
 
+    # Publishing, run by reload_config().
+    if sys.argv[1:] == ["--publish"]:
+        sys.path.append("/app/")
+        from opentopodata import api
+
+        api.publish_config()
+        sys.exit(0)
+
     event_handler = Handler()
     observer = Observer()
     observer.schedule(event_handler, CONFIG_DIR, recursive=False)
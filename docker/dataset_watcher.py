@@ -0,0 +1,145 @@
+import json
+import logging
+import os
+from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
+
+sys.path.append("/app/")
+from opentopodata import config
+
+
+# A dataset is published once its folder has been quiet for this long, so a
+# batch of tiles being copied in becomes a single new version.
+SETTLE_S = 10
+
+EVENT_TYPES = {"created", "deleted", "modified", "moved"}
+
+
+# Logger setup.
+logger = logging.getLogger("datasetwatcher")
+LOG_FORMAT = "%(asctime)s %(levelname)-8s %(message)s"
+formatter = logging.Formatter(LOG_FORMAT)
+logger.setLevel(logging.INFO)
+handler = logging.StreamHandler(sys.stdout)
+handler.setLevel(logging.INFO)
+handler.setFormatter(formatter)
+logger.addHandler(handler)
+
+
+# Changed files waiting to be published, as {name: (last_event_time, paths)}.
+PENDING = {}
+PENDING_LOCK = threading.Lock()
+
+
+def publish(name, paths):
+    """Build and publish a dataset in a new process.
+
+    Building a large dataset uses memory that shouldn't be kept by this long
+    running process.
+    """
+    logger.info(f"Publishing dataset '{name}' with {len(paths)} changed files.")
+    r = subprocess.run(
+        [sys.executable, __file__, "--publish", name],
+        input=json.dumps(sorted(paths)).encode("utf-8"),
+        capture_output=True,
+    )
+    if r.returncode != 0:
+        logger.error(f"Unable to publish dataset '{name}', keeping the old version.")
+        logger.error(r.stderr.decode("utf-8"))
+        return
+    logger.info(f"Published dataset '{name}' version {r.stdout.decode().strip()}.")
+
+
+class Handler(FileSystemEventHandler):
+    def __init__(self, name, dataset_path):
+        self.name = name
+        self.dataset_path = dataset_path
+
+    def _dataset_file_path(self, path):
+        """Path as listed by datasetindex.DatasetIndex, or None if hidden."""
+        rel_path = os.path.relpath(path, self.dataset_path)
+        if any(part.startswith(".") for part in Path(rel_path).parts):
+            return None
+        return os.path.join(self.dataset_path, rel_path)
+
+    def on_any_event(self, event):
+        # Filter unwanted events.
+        if event.event_type not in EVENT_TYPES:
+            return
+        if event.is_directory:
+            return
+        paths = [event.src_path]
+        if event.event_type == "moved":
+            paths.append(event.dest_path)
+        paths = [self._dataset_file_path(p) for p in paths]
+        paths = [p for p in paths if p is not None]
+        if not paths:
+            logger.debug(f"Dropping event for hidden path {event.src_path=}")
+            return
+
+        with PENDING_LOCK:
+            _, pending_paths = PENDING.get(self.name, (None, set()))
+            PENDING[self.name] = (time.time(), pending_paths | set(paths))
+
+
+def watched_datasets():
+    """Names and folders of datasets with local files.
+
+    Returns:
+        List of (name, path) tuples.
+    """
+    datasets = []
+    for d in config.load_config()["datasets"]:
+        if "child_datasets" in d:
+            continue
+        if urlparse(d["path"]).scheme in ("http", "https"):
+            continue
+        if not os.path.isdir(d["path"]):
+            continue
+        datasets.append((d["name"], d["path"]))
+    return datasets
+
+
+if __name__ == "__main__":
+
+    # Publishing, run by publish().
+    if len(sys.argv) == 3 and sys.argv[1] == "--publish":
+        from opentopodata import api
+
+        version = api.publish_dataset(sys.argv[2], json.load(sys.stdin))
+        print(version)
+        sys.exit(0)
+
+    # The watcher is restarted by config_watcher.py when a new config is
+    # published, so until then an invalid config just means nothing is watched.
+    try:
+        datasets = watched_datasets()
+    except config.ConfigError as e:
+        logger.error(f"Invalid config, not watching datasets: {e}")
+        datasets = []
+
+    observer = Observer()
+    for name, path in datasets:
+        observer.schedule(Handler(name, path), path, recursive=True)
+        logger.info(f"Watching dataset '{name}' at {path}.")
+    observer.start()
+
+    try:
+        while True:
+            time.sleep(1)
+            with PENDING_LOCK:
+                now = time.time()
+                settled = [n for n, (t, _) in PENDING.items() if now - t >= SETTLE_S]
+                batches = [(n, PENDING.pop(n)[1]) for n in settled]
+            for name, paths in batches:
+                publish(name, paths)
+    finally:
+        observer.stop()
+        observer.join()
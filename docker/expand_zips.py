@@ -0,0 +1,57 @@
+"""Expand every zipped tile into its dataset's unzip cache.
+
+Run inside the docker container:
+
+    python /app/docker/expand_zips.py [dataset_name ...]
+
+With no names, all datasets with an unzip_cache_path are expanded.
+"""
+
+import logging
+import sys
+
+sys.path.append("/app/")
+from opentopodata import config, tilecache
+
+
+# Warn if the cache ends up fuller than this, as tiles may have been evicted.
+FULL_CACHE_FRACTION = 0.9
+
+
+def _dataset_paths(dataset):
+    if isinstance(dataset, (config.TiledDataset, config.IndexedDataset)):
+        return dataset.tile_paths
+    return [dataset.tile_path]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    names = sys.argv[1:]
+
+    try:
+        datasets = config.load_datasets()
+    except config.ConfigError as e:
+        logging.error("Invalid config: {}".format(str(e)))
+        sys.exit(1)
+
+    for name, dataset in datasets.items():
+        if names and name not in names:
+            continue
+        cache = getattr(dataset, "tile_cache", None)
+        if not isinstance(cache, tilecache.UnzipCache):
+            if names:
+                logging.warning(f"Dataset '{name}' has no unzip_cache_path.")
+            continue
+
+        zip_paths = [p for p in _dataset_paths(dataset) if p.lower().endswith(".zip")]
+        for i, path in enumerate(zip_paths):
+            cache.local_path(path)
+            if (i + 1) % 100 == 0:
+                logging.info(f"{name}: expanded {i + 1}/{len(zip_paths)} tiles.")
+        logging.info(f"{name}: expanded {len(zip_paths)} tiles.")
+
+        if cache.size() > FULL_CACHE_FRACTION * cache.max_bytes:
+            logging.warning(
+                f"{name}: the unzip cache is nearly full, so some tiles may have"
+                " been deleted again. Increase unzip_cache_size_gb to keep them all."
+            )
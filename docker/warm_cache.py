@@ -20,8 +20,11 @@ if __name__ == "__main__":
         from opentopodata import api, config
 
         try:
-            api._load_config()
-            api._load_datasets()
+            # Datasets are built on first use unless preload_datasets is set,
+            # in which case they're built into memcache here for every worker.
+            config_dict = api._load_config()
+            if config_dict["preload_datasets"]:
+                api._load_datasets()
         except config.ConfigError as e:
             logging.error("Invalid config: {}".format(str(e)))
             logging.error(
@@ -1,11 +1,18 @@
+import contextlib
+import fcntl
+import hashlib
 import logging
+import math
 import os
+import threading
+import time
+import uuid
 
 from flask import Flask, jsonify, request, Response
 from flask_caching import Cache
 import polyline
 
-from opentopodata import backend, config, utils
+from opentopodata import backend, config, inmemory, utils
 
 
 app = Flask(__name__)
@@ -21,6 +28,30 @@ LON_MAX = 180
 VERSION_PATH = "VERSION"
 DEFAULT_FORMAT_VALUE = "json"
 
+# Set by uwsgi.ini, so in_memory rasters are loaded by the uWSGI master but not
+# by other processes that import the app, like scripts and tests.
+PRELOAD_IN_MEMORY_ENV = "PRELOAD_IN_MEMORY_DATASETS"
+
+# The config and datasets are published to workers as a "generation": a
+# config version and a version for each dataset, kept in one memcache entry so
+# workers switch over atomically. docker/config_watcher.py publishes a new
+# generation when the config changes, and docker/dataset_watcher.py when the
+# files in a dataset folder change. Workers look for new generations at most
+# this often, and switch to them between requests.
+GENERATION_KEY = "_generation"
+GENERATION_CHECK_INTERVAL_S = 1
+
+# Versions are random ids rather than counters, and workers switch whenever
+# theirs differs from the published one: memcache loses the generation if it
+# restarts or evicts it, and counting again from the start would look older
+# than the versions workers already have.
+INITIAL_VERSION = "initial"
+INITIAL_GENERATION = {"config_version": INITIAL_VERSION, "dataset_versions": {}}
+
+# Publishers in different processes take turns, so one can't overwrite the
+# generation another has just published.
+PUBLISH_LOCK_PATH = "/tmp/opentopodata-publish.lock"
+
 
 # Memcache is used to store the latlon -> filename lookups, which can take a
 # while to compute for datasets made up of many files. Memcache needs to be
@@ -48,21 +79,148 @@ cache.init_app(app)
 # memcached cache object.
 _SIMPLE_CACHE = {}
 
+# Datasets are built the first time they're used, so a request only waits for
+# the datasets it needs. Each dataset has a lock, so it's only built once.
+_DATASET_LOCKS = {}
+_DATASET_LOCKS_LOCK = threading.Lock()
+
+# Process and config version of the last background preload, if any. Threads
+# don't survive forking, so each uWSGI worker starts its own.
+_PRELOADED = None
+
+# Datasets the background preload couldn't build, as {name: error message}.
+# They make /health fail until they're built successfully.
+_PRELOAD_ERRORS = {}
+
 
 def _load_config():
-    """Config file as a dict.
+    """Config file as a dict, from the latest published generation.
 
     Returns:
         Config dict.
     """
-    if os.environ.get("DISABLE_MEMCACHE") or "config" not in _SIMPLE_CACHE:
-        _SIMPLE_CACHE["config"] = _load_config_memcache()
-    return _SIMPLE_CACHE["config"]
+    # Stored as a (version, config) tuple, so it's swapped atomically.
+    version = _published_generation()["config_version"]
+    entry = _SIMPLE_CACHE.get("config")
+    if os.environ.get("DISABLE_MEMCACHE") or entry is None or entry[0] != version:
+        config_dict = _load_config_memcache(version)
+        _configure_backend(config_dict)
+
+        # Datasets dropped from the config can't be requested any more.
+        names = set(d["name"] for d in config_dict["datasets"])
+        datasets = _SIMPLE_CACHE.get("datasets", {})
+        for name in set(datasets) - names:
+            datasets.pop(name, None)
+
+        entry = (version, config_dict)
+        _SIMPLE_CACHE["config"] = entry
+        if config_dict["preload_datasets"]:
+            _start_preload(version)
+    return entry[1]
+
+
+def _configure_backend(config_dict):
+    """Size the backend's per-process caches from the config."""
+    backend.resize_open_file_caches(config_dict["max_open_files"])
+    backend.BLOCK_CACHE.resize(int(config_dict["block_cache_size_mb"] * 1024**2))
+    backend.SHARED_BLOCK_CACHE.configure(
+        config_dict["shared_block_cache_path"],
+        int(config_dict["shared_block_cache_size_mb"] * 1024**2),
+    )
+
+
+def _load_config_memcache(version):
+    key = _cache_key("config", version)
+    config_dict = cache.get(key)
+    if config_dict is None:
+        config_dict = config.load_config()
+        cache.set(key, config_dict)
+    return config_dict
+
+
+def _cache_key(*parts):
+    """Memcache key for a versioned value.
+
+    Dataset names can have characters that aren't allowed in memcache keys,
+    so keys are hashed.
+    """
+    text = "\0".join(str(p) for p in parts)
+    return "_" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _published_generation():
+    """Latest published config and dataset versions.
+
+    Memcache is only checked once every GENERATION_CHECK_INTERVAL_S.
+
+    Returns:
+        Dict with the config_version, and dataset_versions as a dict of
+            {dataset_name: version}. Datasets missing from dataset_versions
+            are at INITIAL_VERSION.
+    """
+    now = time.monotonic()
+    checked_at = _SIMPLE_CACHE.get("generation_checked_at", -math.inf)
+    if now - checked_at >= GENERATION_CHECK_INTERVAL_S:
+        generation = cache.get(GENERATION_KEY) or INITIAL_GENERATION
+        _SIMPLE_CACHE["generation"] = generation
+        _SIMPLE_CACHE["generation_checked_at"] = now
+    return _SIMPLE_CACHE["generation"]
+
+
+def _preload_in_memory_datasets():
+    """Load in_memory datasets into this process.
+
+    This runs when uWSGI's master process imports the app, before the workers
+    are forked, so the workers share one copy-on-write copy of each raster.
+    Rasters not loaded here are loaded by each worker on first use.
+
+    Only runs with the PRELOAD_IN_MEMORY_ENV environment variable set.
+    """
+    n_bytes = 0
+    try:
+        config_dict = config.load_config()
+        for d in config_dict["datasets"]:
+            if not d.get("in_memory"):
+                continue
+            dataset = config.Dataset.from_config(**d)
+            raster = inmemory.load(dataset.tile_path, dataset.in_memory_overview)
+            n_bytes += raster.z.nbytes
+    except config.ConfigError:
+        # Config errors are reported on each request instead.
+        pass
 
+    # Shared pages still count toward each worker's resident memory once
+    # they're read.
+    max_rss_bytes = _uwsgi_reload_on_rss_bytes()
+    if max_rss_bytes is not None and n_bytes >= max_rss_bytes:
+        logging.warning(
+            f"In-memory datasets use {n_bytes // 1024**2}MB, over uWSGI's"
+            f" reload-on-rss of {max_rss_bytes // 1024**2}MB: workers will be"
+            " restarted after every request. Raise reload-on-rss in uwsgi.ini."
+        )
+
+
+def _uwsgi_reload_on_rss_bytes():
+    """uWSGI's reload-on-rss limit, or None if it isn't set or is disabled.
+
+    Returns:
+        Integer bytes, or None.
+    """
+    try:
+        import uwsgi
+    except ImportError:
+        return None
+    value = uwsgi.opt.get("reload-on-rss")
+    if isinstance(value, list):
+        value = value[-1]
+    try:
+        return int(value) * 1024**2 or None
+    except (TypeError, ValueError):
+        return None
 
-@cache.cached(key_prefix="_load_config")
-def _load_config_memcache():
-    return config.load_config()
+
+if os.environ.get(PRELOAD_IN_MEMORY_ENV):
+    _preload_in_memory_datasets()
 
 
 @app.before_request
@@ -402,20 +560,188 @@ def _parse_latlon_locations(locations, max_n_locations):
     return lats, lons
 
 
+def _load_dataset(name):
+    """Load a dataset defined in config, building it on first use.
+
+    If a new version of the dataset has been published, it replaces the one
+    in use, and this process's handles and blocks of the changed files are
+    dropped.
+
+    Args:
+        name: Dataset name string, from the config.
+
+    Returns:
+        config.Dataset or config.MultiDataset object.
+    """
+    # Stored as (version, dataset) tuples, so they're swapped atomically.
+    datasets = _SIMPLE_CACHE.setdefault("datasets", {})
+    use_cache = not os.environ.get("DISABLE_MEMCACHE")
+    version = _published_generation()["dataset_versions"].get(name, INITIAL_VERSION)
+    entry = datasets.get(name)
+    if use_cache and entry is not None and entry[0] == version:
+        return entry[1]
+
+    with _DATASET_LOCKS_LOCK:
+        lock = _DATASET_LOCKS.setdefault(name, threading.Lock())
+    with lock:
+        entry = datasets.get(name)
+        if not use_cache or entry is None or entry[0] != version:
+            dataset = _load_dataset_memcache(name, version)
+            if entry is not None and entry[0] != version:
+                _discard_changed_paths(name, version, dataset)
+            entry = (version, dataset)
+            datasets[name] = entry
+            _PRELOAD_ERRORS.pop(name, None)
+        return entry[1]
+
+
+def _load_dataset_memcache(name, version):
+    key = _cache_key("dataset", name, version)
+    dataset = cache.get(key)
+    if dataset is None:
+        dataset = config.load_dataset(name, _load_config())
+        cache.set(key, dataset)
+    return dataset
+
+
+def _discard_changed_paths(name, version, dataset):
+    """Drop handles and blocks of the files changed in a dataset version.
+
+    If versions were skipped, or memcache lost the list of changed files,
+    files changed only in those versions aren't dropped here. Their stale
+    entries are never used though, see backend.discard_paths().
+    """
+    paths = cache.get(_cache_key("changed_paths", name, version)) or []
+    tile_cache = getattr(dataset, "tile_cache", None)
+    if tile_cache is not None:
+        paths = paths + [tile_cache.cached_path(p) for p in paths]
+    backend.discard_paths(paths)
+
+
+@contextlib.contextmanager
+def _publish_lock():
+    """Hold the lock shared by publishers in every process on the host."""
+    with open(PUBLISH_LOCK_PATH, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish_dataset(name, changed_paths):
+    """Build a dataset again, and switch every worker over to it.
+
+    The dataset is built and cached under a new version before the new
+    generation is published, so workers go straight from the old dataset to
+    the complete new one. Requests already using the old dataset finish with
+    it.
+
+    Args:
+        name: Dataset name string, from the config.
+        changed_paths: List of files in the dataset folder that were added,
+            replaced, or removed.
+
+    Returns:
+        The new version id of the dataset.
+
+    Raises:
+        ConfigError: If the dataset can't be built. Nothing is published, and
+            the old version stays in use.
+    """
+    with _publish_lock():
+        generation = cache.get(GENERATION_KEY) or INITIAL_GENERATION
+        config_dict = _load_config_memcache(generation["config_version"])
+        version = uuid.uuid4().hex
+        dataset = config.load_dataset(name, config_dict)
+
+        # Local copies of changed files are shared by all workers on the host.
+        tile_cache = getattr(dataset, "tile_cache", None)
+        if tile_cache is not None:
+            for path in changed_paths:
+                tile_cache.discard(path)
+
+        cache.set(_cache_key("dataset", name, version), dataset)
+        cache.set(_cache_key("changed_paths", name, version), list(changed_paths))
+        dataset_versions = {**generation["dataset_versions"], name: version}
+        cache.set(GENERATION_KEY, {**generation, "dataset_versions": dataset_versions})
+        return version
+
+
+def publish_config():
+    """Load the config file again, and switch every worker over to it.
+
+    New datasets, and datasets whose options changed, are built and cached
+    under a new version before the new generation is published, so a config
+    is only published once everything in it loads. Datasets whose options
+    didn't change keep their version, so workers keep using them, along with
+    their open files and cached blocks.
+
+    Returns:
+        The new generation dict.
+
+    Raises:
+        ConfigError: If the config or a changed dataset is invalid. Nothing is
+            published, and the old generation stays in use.
+    """
+    with _publish_lock():
+        generation = cache.get(GENERATION_KEY) or INITIAL_GENERATION
+        old_config = cache.get(_cache_key("config", generation["config_version"]))
+        new_config = config.load_config()
+
+        # Without the old config, every dataset is treated as changed.
+        old_options = config.dataset_options(old_config) if old_config else {}
+        new_options = config.dataset_options(new_config)
+        dataset_versions = dict(generation["dataset_versions"])
+        new_datasets = {}
+        for name, options in new_options.items():
+            if options != old_options.get(name):
+                version = uuid.uuid4().hex
+                new_datasets[name, version] = config.load_dataset(name, new_config)
+                dataset_versions[name] = version
+
+        for (name, version), dataset in new_datasets.items():
+            cache.set(_cache_key("dataset", name, version), dataset)
+        config_version = uuid.uuid4().hex
+        cache.set(_cache_key("config", config_version), new_config)
+        generation = {
+            "config_version": config_version,
+            "dataset_versions": dataset_versions,
+        }
+        cache.set(GENERATION_KEY, generation)
+        return generation
+
+
 def _load_datasets():
-    """Load datasets defined in config.
+    """Load all datasets defined in config.
 
     Returns:
         Dict of {dataset_name: config.Dataset object} items.
     """
-    if os.environ.get("DISABLE_MEMCACHE") or "datasets" not in _SIMPLE_CACHE:
-        _SIMPLE_CACHE["datasets"] = _load_datasets_memcache()
-    return _SIMPLE_CACHE["datasets"]
+    names = [d["name"] for d in _load_config()["datasets"]]
+    return {name: _load_dataset(name) for name in names}
+
+
+def _preload_datasets():
+    """Build every dataset that hasn't been used yet."""
+    _PRELOAD_ERRORS.clear()
+    for d in _load_config()["datasets"]:
+        try:
+            _load_dataset(d["name"])
+        except Exception as e:
+            # The error is reported again when the dataset is requested.
+            logging.error(f"Unable to preload dataset '{d['name']}': {e}")
+            _PRELOAD_ERRORS[d["name"]] = str(e)
 
 
-@cache.cached(key_prefix="_load_datasets")
-def _load_datasets_memcache():
-    return config.load_datasets()
+def _start_preload(config_version):
+    """Preload datasets in a background thread, once per process and config."""
+    global _PRELOADED
+    if _PRELOADED == (os.getpid(), config_version):
+        return
+    _PRELOADED = (os.getpid(), config_version)
+    thread = threading.Thread(target=_preload_datasets, daemon=True)
+    thread.start()
 
 
 def _get_datasets(name):
@@ -433,7 +759,7 @@ def _get_datasets(name):
         ClientError: If the name isn't defined in the config.
     """
 
-    all_datasets = _load_datasets()
+    all_names = set(d["name"] for d in _load_config()["datasets"])
 
     # Multiple datasets are separated by a comma.
     names = name.strip(",").split(",")
@@ -445,7 +771,7 @@ def _get_datasets(name):
         raise ClientError("Duplicate dataset names provided.")
 
     # Check all names exist.
-    unfound_names = [n for n in names if n not in all_datasets]
+    unfound_names = [n for n in names if n not in all_names]
     if len(unfound_names) == 1:
         raise ClientError(f"Dataset '{unfound_names[0]}' not in config.")
     elif len(unfound_names) > 1:
@@ -454,9 +780,9 @@ def _get_datasets(name):
     # Turn names into datasets.
     datasets = []
     for dataset_name in names:
-        dataset = all_datasets[dataset_name]
+        dataset = _load_dataset(dataset_name)
         if isinstance(dataset, config.MultiDataset):
-            datasets += [all_datasets[d] for d in dataset.child_dataset_names]
+            datasets += [_load_dataset(d) for d in dataset.child_dataset_names]
         else:
             datasets.append(dataset)
 
@@ -479,13 +805,30 @@ def get_help_message():
 
 @app.route("/health", methods=["GET", "HEAD"])
 def get_health_status():
-    """Status endpoint for e.g., uptime check or load balancing."""
+    """Status endpoint for e.g., uptime check or load balancing.
+
+    Datasets are built when they're first used, so only the ones this process
+    has already built are checked, along with errors from the background
+    preload. With ?deep=1 every dataset in the config is built and checked.
+    """
     try:
-        _load_config()
-        _load_datasets()
+        config_dict = _load_config()
+        if request.args.get("deep") == "1":
+            names = [d["name"] for d in config_dict["datasets"]]
+        else:
+            names = list(_SIMPLE_CACHE.get("datasets", {}))
+        for name in names:
+            _load_dataset(name)
+
+        config_names = set(d["name"] for d in config_dict["datasets"])
+        failed_names = sorted(config_names & set(_PRELOAD_ERRORS))
+        if failed_names:
+            raise config.ConfigError(f"Unable to preload datasets {failed_names}.")
+
         data = {"status": "OK"}
         return jsonify(data)
-    except Exception:
+    except Exception as e:
+        app.logger.error(e)
         data = {"status": "SERVER_ERROR"}
         return jsonify(data), 500
 
@@ -494,15 +837,11 @@ def get_health_status():
 def get_datasets_info():
     """List of datasets on the server."""
     try:
-        all_datasets = _load_datasets()
         results = []
-        for dataset in all_datasets.values():
+        for dataset in _load_config()["datasets"]:
             d = {}
-            d["name"] = dataset.name
-            if isinstance(dataset, config.MultiDataset):
-                d["child_datasets"] = dataset.child_dataset_names
-            else:
-                d["child_datasets"] = []
+            d["name"] = dataset["name"]
+            d["child_datasets"] = dataset.get("child_datasets", [])
             results.append(d)
         results.sort(key=lambda x: x["name"])
         return jsonify({"results": results, "status": "OK"})
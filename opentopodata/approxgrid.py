@@ -0,0 +1,153 @@
+import numpy as np
+import rasterio.warp
+
+from opentopodata import utils
+
+
+# Grids are refined by doubling the cells per side, up to this many. Rasters
+# that still aren't approximated closely enough are located exactly.
+MAX_GRID_CELLS = 256
+
+
+class ApproxGrid:
+    """Approximate latlon to pixel conversion for a projected raster.
+
+    Like GDAL's approximate transformer: exact pixel coordinates are found
+    for a regular grid of latlons over the raster, and pixel coordinates of
+    other locations are bilinearly interpolated from the grid. The grid is
+    refined until the interpolated pixel coordinates at the middle of each
+    cell and cell edge, where the error is largest, are within max_error_px
+    of exact.
+    """
+
+    def __init__(self, west, south, east, north, rows, cols):
+        """
+        Args:
+            west, south, east, north: Latlon extent of the grid.
+            rows, cols: 2D arrays of exact pixel coordinates at the grid
+                nodes, with the first axis going north.
+        """
+        self.west = west
+        self.south = south
+        self.east = east
+        self.north = north
+        self.rows = rows
+        self.cols = cols
+
+    @classmethod
+    def build(cls, crs, transformer, inv_transform, bounds, max_error_px):
+        """Build a grid for a raster.
+
+        Args:
+            crs: Raster crs from catalog.read_raster_info().
+            transformer: From utils.latlon_transformer(), for the raster crs.
+            inv_transform: Inverse of the raster's affine transform.
+            bounds: Raster bounds, in the raster crs.
+            max_error_px: Maximum interpolation error, in pixels.
+
+        Returns:
+            ApproxGrid, or None if the raster can't be approximated closely
+                enough.
+        """
+        if transformer is None:
+            return None
+
+        # Latlon footprint.
+        src_crs = f"EPSG:{crs}" if isinstance(crs, int) else crs
+        try:
+            west, south, east, north = rasterio.warp.transform_bounds(
+                src_crs, f"EPSG:{utils.WGS84_LATLON_EPSG}", *bounds, densify_pts=21
+            )
+        except Exception:
+            return None
+        if not np.all(np.isfinite([west, south, east, north])) or west > east:
+            return None
+        pad_x = (east - west) * utils.FOOTPRINT_PADDING_FRACTION
+        pad_y = (north - south) * utils.FOOTPRINT_PADDING_FRACTION
+        west, east = max(west - pad_x, -180), min(east + pad_x, 180)
+        south, north = max(south - pad_y, -90), min(north + pad_y, 90)
+
+        # Same arithmetic as backend._pixel_coords().
+        def exact(lats, lons):
+            xs, ys = transformer.transform(lons, lats)
+            xs = np.asarray(xs, dtype=float)
+            ys = np.asarray(ys, dtype=float)
+            inv = inv_transform
+            return xs * inv.d + ys * inv.e + inv.f, xs * inv.a + ys * inv.b + inv.c
+
+        n_cells = 1
+        while n_cells <= MAX_GRID_CELLS:
+            node_lats = np.linspace(south, north, n_cells + 1)
+            node_lons = np.linspace(west, east, n_cells + 1)
+            grid_lons, grid_lats = np.meshgrid(node_lons, node_lats)
+            rows, cols = exact(grid_lats.ravel(), grid_lons.ravel())
+            grid = cls(
+                west,
+                south,
+                east,
+                north,
+                rows.reshape(grid_lats.shape),
+                cols.reshape(grid_lats.shape),
+            )
+
+            # Check the nodes of the next finer grid that aren't nodes of this
+            # one: the middle of each cell and each cell edge.
+            check_lats = np.linspace(south, north, 2 * n_cells + 1)
+            check_lons = np.linspace(west, east, 2 * n_cells + 1)
+            check_lons, check_lats = np.meshgrid(check_lons, check_lats)
+            is_node = np.zeros(check_lats.shape, dtype=bool)
+            is_node[::2, ::2] = True
+            check_lats = check_lats[~is_node]
+            check_lons = check_lons[~is_node]
+            rows_exact, cols_exact = exact(check_lats, check_lons)
+            rows_approx, cols_approx, _ = grid.pixel_coords(check_lats, check_lons)
+            with np.errstate(invalid="ignore"):
+                error = np.maximum(
+                    np.abs(rows_approx - rows_exact), np.abs(cols_approx - cols_exact)
+                )
+            if np.all(np.isfinite(grid.rows)) and np.all(np.isfinite(grid.cols)):
+                if np.all(error <= max_error_px):
+                    return grid
+            n_cells *= 2
+        return None
+
+    def pixel_coords(self, lats, lons):
+        """Approximate fractional pixel coordinates of locations.
+
+        Args:
+            lats, lons: Arrays of latitudes/longitudes.
+
+        Returns:
+            rows, cols: Float arrays of pixel coordinates, like
+                backend._pixel_coords(). NaN for locations outside the grid.
+            is_covered: Boolean array, whether each location is in the grid.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=float))
+        lons = np.atleast_1d(np.asarray(lons, dtype=float))
+        n_rows, n_cols = self.rows.shape
+        with np.errstate(invalid="ignore"):
+            is_covered = (lats >= self.south) & (lats <= self.north)
+            is_covered &= (lons >= self.west) & (lons <= self.east)
+
+        # Position within the grid, as a cell and the offset inside it.
+        fy = (lats - self.south) * ((n_rows - 1) / (self.north - self.south))
+        fx = (lons - self.west) * ((n_cols - 1) / (self.east - self.west))
+        fy[~is_covered] = 0
+        fx[~is_covered] = 0
+        i = np.minimum(fy.astype(int), n_rows - 2)
+        j = np.minimum(fx.astype(int), n_cols - 2)
+        wy = fy - i
+        wx = fx - j
+        k = i * n_cols + j
+
+        def interpolate(values):
+            values = values.ravel()
+            bottom = values.take(k)
+            bottom += (values.take(k + 1) - bottom) * wx
+            top = values.take(k + n_cols)
+            top += (values.take(k + n_cols + 1) - top) * wx
+            z = bottom + (top - bottom) * wy
+            z[~is_covered] = np.nan
+            return z
+
+        return interpolate(self.rows), interpolate(self.cols), is_covered
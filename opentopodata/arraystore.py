@@ -0,0 +1,244 @@
+import json
+import os
+import shutil
+
+import numpy as np
+import rasterio
+
+from opentopodata import utils
+
+
+# A compiled dataset is a directory with a manifest, and a store directory
+# for each source raster.
+MANIFEST_FILENAME = "store.json"
+HEADER_FILENAME = "header.json"
+STORE_EXTENSION = ".npystore"
+STORE_VERSION = 1
+
+# Chunks are at least this many pixels square, rounded up to whole source
+# blocks.
+MIN_CHUNK_SIZE_PIXELS = 512
+
+# Open stores. They don't hold any files themselves: their chunks' memory maps
+# are kept in utils.MAPPED_FILES.
+MAX_OPEN_STORES = 1024
+_OPEN_STORES = utils.MtimeLRU(MAX_OPEN_STORES)
+
+
+def is_store(path):
+    """Whether a path is a compiled raster store."""
+    return path.endswith(STORE_EXTENSION)
+
+
+def _chunk_filename(chunk_row, chunk_col):
+    return f"{chunk_row}_{chunk_col}.npy"
+
+
+class StoreRaster:
+    """A raster compiled to uncompressed .npy chunks.
+
+    Chunks are memory mapped, so reads are just a copy from the page cache:
+    there's no decompression, no GDAL overhead, and the page cache is shared
+    between processes.
+
+    The store has the attributes of a rasterio dataset that the backend uses.
+    """
+
+    def __init__(self, path):
+        """Open a store.
+
+        Args:
+            path: Location of the store directory.
+        """
+        with open(os.path.join(path, HEADER_FILENAME)) as f:
+            header = json.load(f)
+            self._mtime = os.fstat(f.fileno()).st_mtime_ns
+        if header["version"] != STORE_VERSION:
+            raise ValueError(f"Unsupported store version in '{path}'.")
+
+        self.name = path
+        self.crs = rasterio.crs.CRS.from_string(header["crs"])
+        self.transform = rasterio.Affine(*header["transform"])
+        self.height = header["height"]
+        self.width = header["width"]
+        self.nodata = header["nodata"]
+        self.block_shapes = [tuple(header["chunk_shape"])]
+        self.res = (abs(self.transform.a), abs(self.transform.e))
+        self.bounds = rasterio.coords.BoundingBox(
+            *rasterio.transform.array_bounds(self.height, self.width, self.transform)
+        )
+
+    def _chunk(self, key):
+        """Memory map of a chunk, remapped if the store is recompiled."""
+        path = os.path.join(self.name, _chunk_filename(*key))
+        return utils.MAPPED_FILES.get(
+            path, self._mtime, lambda: np.load(path, mmap_mode="r")
+        )
+
+    def read_window(self, window):
+        """Read a window, like backend._read_window().
+
+        Args:
+            window: rasterio Window, within the raster.
+
+        Returns:
+            z: 2D float array of the window, with NODATA replaced by NaN.
+        """
+        z = utils.assemble_window(window, self.block_shapes[0], self._chunk)
+        if self.nodata is not None:
+            z[z == self.nodata] = np.nan
+        return z
+
+
+def open_raster(path):
+    """Open a store, reusing existing memory maps if possible.
+
+    The store is reopened if its header's mtime changes.
+
+    Args:
+        path: Location of the store directory.
+
+    Returns:
+        StoreRaster.
+    """
+    mtime = os.stat(os.path.join(path, HEADER_FILENAME)).st_mtime_ns
+    return _OPEN_STORES.get(path, mtime, lambda: StoreRaster(path))
+
+
+def read_manifest(path):
+    """Read a compiled dataset's manifest.
+
+    Args:
+        path: Compiled dataset directory.
+
+    Returns:
+        Manifest dict, or None if the directory isn't a compiled dataset.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILENAME)
+    if not os.path.isfile(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def read_unmasked(f, window=None):
+    """Read the first band of a raster, with masked pixels set to NODATA.
+
+    Pixels keep the raster's dtype to save space, unless the raster has a
+    mask but no NODATA value, in which case masked pixels become NaN.
+
+    Args:
+        f: Open rasterio dataset.
+        window: Optional rasterio Window, defaults to the whole raster.
+
+    Returns:
+        z: 2D array.
+        nodata: Value of masked pixels in z, or None if they're NaN.
+    """
+    dtype = np.dtype(f.dtypes[0])
+    nodata = f.nodata
+    has_mask = any(
+        flag.name not in ("all_valid", "nodata") for flag in f.mask_flag_enums[0]
+    )
+    if nodata is None and has_mask:
+        dtype = np.dtype(float)
+        nodata = np.nan
+
+    z = f.read(1, window=window, masked=True)
+    z = np.ma.filled(z.astype(dtype), 0 if nodata is None else nodata)
+    if nodata is not None and np.isnan(nodata):
+        nodata = None
+    return z, nodata
+
+
+def compile_raster(src_path, out_path):
+    """Convert a raster to a store of uncompressed .npy chunks.
+
+    Args:
+        src_path: GDAL supported raster location.
+        out_path: Store directory to create.
+    """
+    with rasterio.open(src_path) as f:
+        if f.crs is None:
+            raise ValueError(f"Raster '{src_path}' has no crs.")
+
+        # Chunks are aligned to the source blocks so each block is decoded once.
+        block_height, block_width = f.block_shapes[0]
+        chunk_height = block_height * -(-MIN_CHUNK_SIZE_PIXELS // block_height)
+        chunk_width = block_width * -(-MIN_CHUNK_SIZE_PIXELS // block_width)
+
+        tmp_path = out_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for chunk_row in range(-(-f.height // chunk_height)):
+            for chunk_col in range(-(-f.width // chunk_width)):
+                window = rasterio.windows.Window(
+                    chunk_col * chunk_width,
+                    chunk_row * chunk_height,
+                    min(chunk_width, f.width - chunk_col * chunk_width),
+                    min(chunk_height, f.height - chunk_row * chunk_height),
+                )
+                z, nodata = read_unmasked(f, window)
+                filename = _chunk_filename(chunk_row, chunk_col)
+                np.save(os.path.join(tmp_path, filename), z)
+
+        header = {
+            "version": STORE_VERSION,
+            "crs": f.crs.to_string(),
+            "transform": list(f.transform)[:6],
+            "height": f.height,
+            "width": f.width,
+            "chunk_shape": [chunk_height, chunk_width],
+            "dtype": z.dtype.str,
+            "nodata": nodata,
+        }
+
+    with open(os.path.join(tmp_path, HEADER_FILENAME), "w") as f:
+        json.dump(header, f)
+    shutil.rmtree(out_path, ignore_errors=True)
+    os.replace(tmp_path, out_path)
+
+
+def compile_dataset(dataset, out_dir):
+    """Convert a dataset to memory-mappable stores.
+
+    Args:
+        dataset: config.SingleFileDataset, config.TiledDataset or
+            config.IndexedDataset.
+        out_dir: Directory to write the compiled dataset to.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    # Multi-file datasets keep the tile paths within the dataset folder, so
+    # tiles can be found the same way as in the source, and tiles with the
+    # same filename in different subfolders get their own stores.
+    if hasattr(dataset, "filename_tile_size"):
+        src_paths = dataset.tile_paths
+        manifest = {
+            "type": "tiled",
+            "filename_epsg": dataset.filename_epsg,
+            "filename_tile_size": str(dataset.filename_tile_size),
+        }
+    elif hasattr(dataset, "tile_paths"):
+        src_paths = dataset.tile_paths
+        manifest = {"type": "indexed"}
+    else:
+        src_paths = [dataset.tile_path]
+        manifest = {"type": "single"}
+    root = dataset.path if hasattr(dataset, "tile_paths") else None
+
+    store_names = []
+    for src_path in src_paths:
+        if root is None:
+            store_name = os.path.basename(src_path) + STORE_EXTENSION
+        else:
+            store_name = os.path.relpath(src_path, root) + STORE_EXTENSION
+        compile_raster(src_path, os.path.join(out_dir, store_name))
+        store_names.append(store_name)
+
+    # The manifest is written last, so a partially compiled dataset won't load.
+    manifest["version"] = STORE_VERSION
+    manifest["source"] = dataset.name
+    manifest["stores"] = store_names
+    with open(os.path.join(out_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2)
@@ -1,23 +1,77 @@
 import collections
+import concurrent.futures
+import contextlib
+import os
+import threading
 
-from rasterio.enums import Resampling
 import numpy as np
 import rasterio
 
-from opentopodata import utils
+from opentopodata import arraystore, catalog, cog, hgt, inmemory, sharedcache, utils
 
-# Only a subset of rasterio's supported methods are currently activated. In
-# the future I might do interpolation in backend.py instead if relying on
-# gdal, and I don't want to commit to supporting an interpolation method that
-# would be a pain to do in python.
+
+def _kernel_bilinear(t):
+    """Linear interpolation weights for distance t in pixels."""
+    return np.clip(1 - np.abs(t), 0, None)
+
+
+def _kernel_cubic(t, a=-0.5):
+    """Cubic convolution weights (Keys, a=-0.5), as used by GDAL."""
+    t = np.abs(t)
+    near = ((a + 2) * t - (a + 3)) * t**2 + 1
+    far = ((a * t - 5 * a) * t + 8 * a) * t - 4 * a
+    return np.where(t <= 1, near, np.where(t < 2, far, 0))
+
+
+def _kernel_cubic_spline(t):
+    """Cubic B-spline weights, as used by GDAL."""
+    t = np.abs(t)
+    near = (3 * t**3 - 6 * t**2 + 4) / 6
+    far = (2 - t) ** 3 / 6
+    return np.where(t <= 1, near, np.where(t < 2, far, 0))
+
+
+def _kernel_lanczos(t, radius=3):
+    """Lanczos windowed sinc weights."""
+    return np.where(np.abs(t) < radius, np.sinc(t) * np.sinc(t / radius), 0)
+
+
+# Interpolation is done in numpy on a pre-read array of pixels. Each method
+# has a separable kernel, and a radius: how many pixels either side of the
+# location can have a nonzero weight. Nearest neighbour doesn't need a kernel.
 INTERPOLATION_METHODS = {
-    "nearest": Resampling.nearest,
-    "bilinear": Resampling.bilinear,
-    "cubic": Resampling.cubic,
-    # 'cubic_spline': Resampling.cubic_spline,
-    # 'lanczos': Resampling.lanczos,
+    "nearest": (None, 0),
+    "bilinear": (_kernel_bilinear, 1),
+    "cubic": (_kernel_cubic, 2),
+    "cubic_spline": (_kernel_cubic_spline, 2),
+    "lanczos": (_kernel_lanczos, 3),
 }
 
+# An interpolated value is NODATA if at least this fraction of the
+# (absolute) kernel weight falls on NODATA pixels. Otherwise the NODATA pixels
+# are dropped and the kernel is renormalised over the remaining ones. This
+# differs from the GDAL resampling used before: near NODATA areas, points can
+# get a value where they used to be NODATA, and values can differ. See
+# docs/api.md.
+NODATA_WEIGHT_THRESHOLD = 0.5
+
+
+# Cost model for planning window reads, in units of decoded pixels. Each
+# GDAL read call has an overhead roughly equal to decoding this many pixels.
+WINDOW_READ_OVERHEAD_PIXELS = 20_000
+
+# Smallest side length of the grid cells used to cluster points for reading.
+MIN_CLUSTER_SIZE_PIXELS = 256
+
+# Blocks wider than this, like the full-width strips of untiled geotiffs, are
+# split into cells MIN_CLUSTER_SIZE_PIXELS wide. Otherwise a single point would
+# read and cache hundreds of whole raster rows.
+MAX_CELL_WIDTH_PIXELS = 1024
+
+# Rasters sliced straight from memory or the page cache, which don't need the
+# block caches.
+_MEMORY_RASTERS = (hgt.HgtTile, arraystore.StoreRaster, inmemory.MemoryRaster)
+
 
 class InputError(ValueError):
     """Invalid input data.
@@ -26,6 +80,320 @@ class InputError(ValueError):
     """
 
 
+def _file_mtime(path):
+    """Modification time of a file, or None for non-local paths.
+
+    For http urls, a version token from cog.remote_version() is used instead.
+    """
+    if path.startswith(cog.VSICURL_PREFIX):
+        return cog.remote_version(path[len(cog.VSICURL_PREFIX) :])
+    try:
+        return os.stat(path).st_mtime_ns
+    except (OSError, ValueError):
+        return None
+
+
+class DatasetPool:
+    """LRU pool of open rasterio datasets.
+
+    Opening a raster file parses its headers and builds a CRS, which can be
+    slower than the read itself for small requests. Instead, datasets are
+    kept open between requests and reused.
+
+    The pool belongs to a single process: handles inherited from a parent
+    process after a fork are dropped rather than shared. Each handle is used
+    by only one thread at a time, and handles are reopened if the file's
+    mtime has changed.
+    """
+
+    def __init__(self, max_size=0):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._idle = collections.OrderedDict()
+        self._n_idle = 0
+        self.resize(max_size)
+
+    def resize(self, max_size):
+        """Set the max number of idle handles, evicting any excess.
+
+        Args:
+            max_size: Integer max number of open datasets.
+        """
+        with self._lock:
+            self.max_size = max(max_size, 0)
+            self._evict()
+
+    def clear(self):
+        """Close all idle handles."""
+        with self._lock:
+            self._check_pid()
+            for handles in self._idle.values():
+                for f, _ in handles:
+                    f.close()
+            self._idle.clear()
+            self._n_idle = 0
+
+    def __len__(self):
+        return self._n_idle
+
+    def discard(self, paths):
+        """Close idle handles of files that have been replaced or removed.
+
+        Args:
+            paths: Set of dataset locations.
+        """
+        with self._lock:
+            self._check_pid()
+            for path in paths & self._idle.keys():
+                for f, _ in self._idle.pop(path):
+                    f.close()
+                    self._n_idle -= 1
+
+    @contextlib.contextmanager
+    def open(self, path):
+        """Open a dataset, reusing an idle handle if available.
+
+        Args:
+            path: GDAL supported raster location.
+
+        Yields:
+            Open rasterio dataset.
+        """
+        mtime = _file_mtime(path)
+        f = self._checkout(path, mtime)
+        if f is None:
+            f = rasterio.open(path)
+        try:
+            yield f
+        finally:
+            self._checkin(path, f, mtime)
+
+    def _check_pid(self):
+        """Drop handles inherited from a parent process."""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._idle = collections.OrderedDict()
+            self._n_idle = 0
+
+    def _checkout(self, path, mtime):
+        with self._lock:
+            self._check_pid()
+            handles = self._idle.get(path, [])
+            while handles:
+                f, f_mtime = handles.pop()
+                self._n_idle -= 1
+                if f_mtime == mtime:
+                    break
+                f.close()
+            else:
+                f = None
+            if not handles:
+                self._idle.pop(path, None)
+            return f
+
+    def _checkin(self, path, f, mtime):
+        with self._lock:
+            self._check_pid()
+            if f.closed or not self.max_size:
+                f.close()
+                return
+            self._idle.setdefault(path, []).append((f, mtime))
+            self._idle.move_to_end(path)
+            self._n_idle += 1
+            self._evict()
+
+    def _evict(self):
+        while self._n_idle > self.max_size:
+            path, handles = next(iter(self._idle.items()))
+            f, _ = handles.pop(0)
+            f.close()
+            self._n_idle -= 1
+            if not handles:
+                del self._idle[path]
+
+
+# Each uWSGI worker process gets its own pool.
+DATASET_POOL = DatasetPool()
+
+
+def resize_open_file_caches(max_open_files):
+    """Share the file descriptor budget between the caches of open files.
+
+    Pooled datasets get up to half the budget, and the memory maps of .hgt
+    tiles and compiled stores get the rest, so together they can't exhaust
+    the process's limit.
+
+    Args:
+        max_open_files: Integer max number of pooled datasets.
+    """
+    budget = utils.cached_fd_budget()
+    if budget is None:
+        DATASET_POOL.resize(max_open_files)
+        utils.MAPPED_FILES.resize(None)
+        return
+    DATASET_POOL.resize(min(max_open_files, budget // 2))
+    utils.MAPPED_FILES.resize(budget - DATASET_POOL.max_size)
+
+
+resize_open_file_caches(0)
+
+
+class BlockCache:
+    """LRU cache of decoded raster blocks.
+
+    Decompressing the same blocks for every request is wasted work when
+    requests are concentrated in a few areas. Instead, blocks are kept as
+    float arrays (with NODATA as NaN), keyed by (path, block_row, block_col).
+
+    Cache blocks are raster blocks grown to the cells used for planning
+    reads, see _cell_shape(). Entries are dropped if the file's mtime has
+    changed. Like DatasetPool, the cache belongs to a single process.
+
+    The hits, misses, and evictions attributes count block lookups.
+    """
+
+    def __init__(self, max_bytes=0):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._blocks = collections.OrderedDict()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.resize(max_bytes)
+
+    def resize(self, max_bytes):
+        """Set the max total size of cached blocks, evicting any excess.
+
+        Args:
+            max_bytes: Integer max size. 0 disables the cache.
+        """
+        with self._lock:
+            self.max_bytes = max(max_bytes, 0)
+            self._evict()
+
+    def clear(self):
+        """Drop all blocks and reset the counters."""
+        with self._lock:
+            self._blocks = collections.OrderedDict()
+            self.n_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def discard(self, paths):
+        """Drop blocks of files that have been replaced or removed.
+
+        Args:
+            paths: Set of raster locations.
+        """
+        with self._lock:
+            self._check_pid()
+            for key in [k for k in self._blocks if k[0] in paths]:
+                _, z = self._blocks.pop(key)
+                self.n_bytes -= z.nbytes
+
+    def stats(self):
+        """Counters and size of the cache, as a dict."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "n_blocks": len(self._blocks),
+            "n_bytes": self.n_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+    def get_many(self, path, mtime, blocks):
+        """Look up cached blocks.
+
+        Args:
+            path: Raster location.
+            mtime: Modification time of the file, from _file_mtime().
+            blocks: List of (block_row, block_col) tuples.
+
+        Returns:
+            Dict of {(block_row, block_col): array} of the cached blocks.
+        """
+        found = {}
+        with self._lock:
+            self._check_pid()
+            for block_row, block_col in blocks:
+                key = (path, block_row, block_col)
+                entry = self._blocks.get(key)
+                if entry is not None and entry[0] == mtime:
+                    self._blocks.move_to_end(key)
+                    found[(block_row, block_col)] = entry[1]
+            self.hits += len(found)
+            self.misses += len(blocks) - len(found)
+        return found
+
+    def put_many(self, path, mtime, z_blocks):
+        """Add blocks to the cache.
+
+        Args:
+            path: Raster location.
+            mtime: Modification time of the file, from _file_mtime().
+            z_blocks: Dict of {(block_row, block_col): array}. The arrays are
+                made read only, as they're shared between requests.
+        """
+        with self._lock:
+            self._check_pid()
+            for (block_row, block_col), z in z_blocks.items():
+                if z.nbytes > self.max_bytes:
+                    continue
+                z.setflags(write=False)
+                key = (path, block_row, block_col)
+                old_entry = self._blocks.pop(key, None)
+                if old_entry is not None:
+                    self.n_bytes -= old_entry[1].nbytes
+                self._blocks[key] = (mtime, z)
+                self.n_bytes += z.nbytes
+            self._evict()
+
+    def _check_pid(self):
+        """Drop blocks inherited from a parent process."""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid = pid
+            self._blocks = collections.OrderedDict()
+            self.n_bytes = 0
+
+    def _evict(self):
+        while self.n_bytes > self.max_bytes:
+            _, (_, z) = self._blocks.popitem(last=False)
+            self.n_bytes -= z.nbytes
+            self.evictions += 1
+
+
+# Each uWSGI worker process gets its own cache.
+BLOCK_CACHE = BlockCache()
+
+# Blocks missing from BLOCK_CACHE are looked for here, before reading the file.
+SHARED_BLOCK_CACHE = sharedcache.SharedBlockCache()
+
+
+def discard_paths(paths):
+    """Drop this process's open handles and cached blocks of changed files.
+
+    Entries for a replaced file are never used, as they're checked against
+    the file's mtime, but until evicted they'd still hold memory, file
+    descriptors, and the disk space of deleted files. The shared block cache
+    is keyed by mtime too, and its stale blocks are overwritten over time.
+
+    Args:
+        paths: Iterable of raster locations.
+    """
+    paths = set(paths)
+    DATASET_POOL.discard(paths)
+    BLOCK_CACHE.discard(paths)
+    utils.MAPPED_FILES.discard(paths)
+
+
 def _noop(x):
     return x
 
@@ -69,6 +437,352 @@ def _validate_points_lie_within_raster(xs, ys, lats, lons, bounds, res):
     return sorted(oob_indices)
 
 
+def _validate_pixels_lie_within_raster(rows, cols, height, width):
+    """Like _validate_points_lie_within_raster(), for pixel coordinates.
+
+    Args:
+        rows, cols: Arrays of fractional pixel coordinates.
+        height, width: Raster shape.
+
+    Returns:
+        oob_indices: Sorted list of indices of points outside the raster.
+    """
+    # As with coordinates, the extent is the centre of the outer pixels.
+    atol = 1e-8
+    with np.errstate(invalid="ignore"):
+        in_bounds = (rows >= 0.5 - atol) & (rows <= height - 0.5 + atol)
+        in_bounds &= (cols >= 0.5 - atol) & (cols <= width - 0.5 + atol)
+    return np.flatnonzero(~in_bounds).tolist()
+
+
+def _read_window(f, window):
+    """Read a window of the first band.
+
+    Args:
+        f: Open rasterio dataset.
+        window: rasterio Window, within the raster.
+
+    Returns:
+        z: 2D float array of the window, with NODATA replaced by NaN.
+    """
+    z = f.read(indexes=1, window=window, out_dtype=float, masked=True)
+    return np.ma.filled(z, np.nan)
+
+
+def _read_windows_uncached(f, windows):
+    """Read several windows of the first band.
+
+    In-memory rasters, .hgt tiles and compiled stores are sliced directly, remote
+    cloud optimised geotiffs are read with concurrent range requests, and
+    everything else one window at a time with GDAL.
+
+    Args:
+        f: Open rasterio dataset.
+        windows: List of rasterio Windows, within the raster.
+
+    Returns:
+        Iterable of 2D float arrays, with NODATA replaced by NaN.
+    """
+    if isinstance(f, _MEMORY_RASTERS):
+        return (f.read_window(window) for window in windows)
+    reader = cog.CogReader.from_dataset(f)
+    if reader:
+        return reader.read_windows(windows)
+    return (_read_window(f, window) for window in windows)
+
+
+def _cell_shape(block_shape):
+    """Raster blocks grown to a minimum size, for reading and caching.
+
+    Rasters with small or single-row blocks would otherwise be split into
+    too many pieces. Very wide blocks are split into columns instead.
+
+    Args:
+        block_shape: Tuple of (block_height, block_width) pixels.
+
+    Returns:
+        Tuple of (cell_height, cell_width) pixels, multiples of the blocks
+            except for the width of very wide blocks.
+    """
+    block_height, block_width = block_shape
+    if block_width > MAX_CELL_WIDTH_PIXELS:
+        # Every block a cell touches is still decoded in full, so the cell
+        # only gets as many rows as a square cell would decode pixels.
+        n_rows = max(MIN_CLUSTER_SIZE_PIXELS**2 // block_width, 1)
+        cell_height = block_height * -(-n_rows // block_height)
+        return cell_height, MIN_CLUSTER_SIZE_PIXELS
+    cell_height = block_height * -(-MIN_CLUSTER_SIZE_PIXELS // block_height)
+    cell_width = block_width * -(-MIN_CLUSTER_SIZE_PIXELS // block_width)
+    return cell_height, cell_width
+
+
+def _read_windows(f, windows):
+    """Read several windows of the first band, through the block caches.
+
+    Windows are assembled from cached blocks, and only the missing blocks
+    are read from the file. Blocks are looked for in the worker's
+    BLOCK_CACHE then the host's SHARED_BLOCK_CACHE.
+
+    Args:
+        f: Open rasterio dataset.
+        windows: List of rasterio Windows, within the raster.
+
+    Returns:
+        Iterable of 2D float arrays, with NODATA replaced by NaN.
+    """
+    # Memory-mapped rasters are already cached by the OS.
+    if isinstance(f, _MEMORY_RASTERS):
+        return _read_windows_uncached(f, windows)
+    if not BLOCK_CACHE.max_bytes and not SHARED_BLOCK_CACHE.enabled:
+        return _read_windows_uncached(f, windows)
+
+    # Find the blocks we need, and read the ones that aren't cached.
+    cell_height, cell_width = _cell_shape(f.block_shapes[0])
+    cells = sorted(
+        set(
+            cell
+            for w in windows
+            for cell in utils.window_tiles(w, (cell_height, cell_width))
+        )
+    )
+    mtime = _file_mtime(f.name)
+    z_cells = BLOCK_CACHE.get_many(f.name, mtime, cells)
+    missing_cells = [cell for cell in cells if cell not in z_cells]
+    if missing_cells and SHARED_BLOCK_CACHE.enabled:
+        z_shared = SHARED_BLOCK_CACHE.get_many(f.name, mtime, missing_cells)
+        BLOCK_CACHE.put_many(f.name, mtime, z_shared)
+        z_cells.update(z_shared)
+        missing_cells = [cell for cell in missing_cells if cell not in z_cells]
+    if missing_cells:
+        cell_windows = [
+            rasterio.windows.Window(
+                c * cell_width,
+                r * cell_height,
+                min(cell_width, f.width - c * cell_width),
+                min(cell_height, f.height - r * cell_height),
+            )
+            for r, c in missing_cells
+        ]
+        z_missing = dict(zip(missing_cells, _read_windows_uncached(f, cell_windows)))
+        BLOCK_CACHE.put_many(f.name, mtime, z_missing)
+        SHARED_BLOCK_CACHE.put_many(f.name, mtime, z_missing)
+        z_cells.update(z_missing)
+
+    return [
+        utils.assemble_window(w, (cell_height, cell_width), z_cells.__getitem__)
+        for w in windows
+    ]
+
+
+def _window_read_cost(window, block_shape):
+    """Estimated cost of reading a window, in units of decoded pixels.
+
+    GDAL decodes every internal block that a window touches, and each read
+    has a fixed overhead on top of that.
+
+    Args:
+        window: rasterio Window.
+        block_shape: Tuple of (block_height, block_width) pixels.
+
+    Returns:
+        Integer cost.
+    """
+    block_height, block_width = block_shape
+    row_start, row_stop = window.row_off, window.row_off + window.height
+    col_start, col_stop = window.col_off, window.col_off + window.width
+    n_block_rows = (row_stop - 1) // block_height - row_start // block_height + 1
+    n_block_cols = (col_stop - 1) // block_width - col_start // block_width + 1
+    n_pixels = n_block_rows * n_block_cols * block_height * block_width
+    return WINDOW_READ_OVERHEAD_PIXELS + n_pixels
+
+
+def _bounding_window(row_starts, row_stops, col_starts, col_stops):
+    """Smallest window containing all the given pixel ranges."""
+    row_start = int(row_starts.min())
+    col_start = int(col_starts.min())
+    height = int(row_stops.max()) - row_start
+    width = int(col_stops.max()) - col_start
+    return rasterio.windows.Window(col_start, row_start, width, height)
+
+
+def _plan_window_reads(row_starts, row_stops, col_starts, col_stops, block_shape):
+    """Group points into windows to read.
+
+    A batch of points close together is best served with a single window
+    read. But for points scattered over a large raster, a single window
+    would decode most of the file, so instead points are clustered by a grid
+    aligned to the raster's internal blocks, with one read per cluster.
+    Whichever option has the lower estimated cost is used.
+
+    Args:
+        row_starts, row_stops, col_starts, col_stops: Integer arrays of the
+            pixels needed for each point (stops are exclusive).
+        block_shape: Tuple of (block_height, block_width) pixels.
+
+    Returns:
+        List of (window, point_indices) tuples.
+    """
+    n_points = len(row_starts)
+    window = _bounding_window(row_starts, row_stops, col_starts, col_stops)
+    single_plan = [(window, np.arange(n_points))]
+    single_cost = _window_read_cost(window, block_shape)
+    if n_points == 1:
+        return single_plan
+
+    # Grid cells are whole blocks, grown to a minimum size so that rasters
+    # with small or single-row blocks don't get split into too many reads.
+    cell_height, cell_width = _cell_shape(block_shape)
+    cell_rows = row_starts // cell_height
+    cell_cols = col_starts // cell_width
+    cell_ids = cell_rows * (int(cell_cols.max()) + 1) + cell_cols
+
+    # Split points by cluster.
+    cluster_plan = []
+    cluster_cost = 0
+    for indices in utils.group_indices(cell_ids)[1]:
+        window = _bounding_window(
+            row_starts[indices],
+            row_stops[indices],
+            col_starts[indices],
+            col_stops[indices],
+        )
+        cluster_plan.append((window, indices))
+        cluster_cost += _window_read_cost(window, block_shape)
+
+    if cluster_cost < single_cost:
+        return cluster_plan
+    return single_plan
+
+
+def _interpolate(z, rows, cols, interpolation):
+    """Interpolate values at fractional locations in a pixel array.
+
+    All locations are interpolated together with numpy: there's no per-point
+    python loop.
+
+    Pixels beyond the edge of the array are ignored, so rows/cols should be
+    relative to an array containing all the pixels needed by the kernel (or
+    the whole raster, for points near its edge).
+
+    Args:
+        z: 2D float array of pixels, with NODATA values as NaN.
+        rows, cols: Arrays of fractional pixel indices into z. Integer values
+            are at the centre of a pixel.
+        interpolation: method name string.
+
+    Returns:
+        Array of elevations, same length as rows/cols.
+    """
+    kernel, radius = INTERPOLATION_METHODS[interpolation]
+    height, width = z.shape
+
+    # Round to the pixel whose centre is closest.
+    if kernel is None:
+        pixel_rows = np.floor(rows + 0.5).astype(int).clip(0, height - 1)
+        pixel_cols = np.floor(cols + 0.5).astype(int).clip(0, width - 1)
+        return z[pixel_rows, pixel_cols]
+
+    # Kernel taps: each point has a (2 * radius) square of pixels around it.
+    offsets = np.arange(1 - radius, radius + 1)
+    tap_rows = np.floor(rows).astype(int)[:, None] + offsets
+    tap_cols = np.floor(cols).astype(int)[:, None] + offsets
+
+    # Separable weights. Taps off the edge of the array don't contribute.
+    row_weights = kernel(rows[:, None] - tap_rows)
+    col_weights = kernel(cols[:, None] - tap_cols)
+    row_weights[(tap_rows < 0) | (tap_rows >= height)] = 0
+    col_weights[(tap_cols < 0) | (tap_cols >= width)] = 0
+    weights = row_weights[:, :, None] * col_weights[:, None, :]
+
+    # Gather the (n_points, 2 * radius, 2 * radius) pixel neighbourhoods.
+    tap_rows = tap_rows.clip(0, height - 1)
+    tap_cols = tap_cols.clip(0, width - 1)
+    values = z[tap_rows[:, :, None], tap_cols[:, None, :]]
+
+    # Drop NODATA pixels from the kernel.
+    is_nodata = np.isnan(values)
+    abs_weights = np.abs(weights)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        nodata_fraction = (abs_weights * is_nodata).sum(axis=(1, 2)) / abs_weights.sum(
+            axis=(1, 2)
+        )
+        weights[is_nodata] = 0
+        values[is_nodata] = 0
+        weight_sum = weights.sum(axis=(1, 2))
+        z_interpolated = (weights * values).sum(axis=(1, 2)) / weight_sum
+
+    is_invalid = (nodata_fraction >= NODATA_WEIGHT_THRESHOLD) | (weight_sum <= 0)
+    z_interpolated[is_invalid] = np.nan
+    return z_interpolated
+
+
+def _read_interpolated(f, rows, cols, oob_indices, interpolation):
+    """Interpolate values for many points, reading windows rather than points.
+
+    Args:
+        f: Open rasterio dataset.
+        rows, cols: Arrays of fractional pixel indices, clipped to the raster.
+        oob_indices: Indices of points lying outside the raster.
+        interpolation: method name string.
+
+    Returns:
+        z_all: Array of elevations, NaN for NODATA and out-of-bounds points.
+        in_bounds: Boolean array, whether each point lies within the raster.
+    """
+    z_all = np.full(len(rows), np.nan)
+    in_bounds = np.ones(len(rows), dtype=bool)
+    in_bounds[oob_indices] = False
+    if not in_bounds.any():
+        return z_all, in_bounds
+    rows = rows[in_bounds]
+    cols = cols[in_bounds]
+
+    # Find every pixel within the kernel radius of a point, plus a pixel for
+    # rounding.
+    _, radius = INTERPOLATION_METHODS[interpolation]
+    margin = max(radius, 1)
+    floor_rows = np.floor(rows).astype(int)
+    floor_cols = np.floor(cols).astype(int)
+    row_starts = (floor_rows - margin + 1).clip(0, f.height - 1)
+    row_stops = (floor_rows + margin + 1).clip(1, f.height)
+    col_starts = (floor_cols - margin + 1).clip(0, f.width - 1)
+    col_stops = (floor_cols + margin + 1).clip(1, f.width)
+
+    # Read the pixels in as few windows as makes sense.
+    z_in_bounds = np.full(len(rows), np.nan)
+    plan = _plan_window_reads(
+        row_starts, row_stops, col_starts, col_stops, f.block_shapes[0]
+    )
+    z_windows = _read_windows(f, [window for window, _ in plan])
+    for (window, indices), z in zip(plan, z_windows):
+        z_in_bounds[indices] = _interpolate(
+            z,
+            rows[indices] - window.row_off,
+            cols[indices] - window.col_off,
+            interpolation,
+        )
+
+    z_all[in_bounds] = z_in_bounds
+    return z_all, in_bounds
+
+
+def _elevations_to_list(z, in_bounds, nodata_value):
+    """Convert an elevation array to a list for the response.
+
+    Args:
+        z: Array of elevations, with NaN for NODATA.
+        in_bounds: Boolean array, False where the location had no data.
+        nodata_value: Replacement for NODATA values.
+
+    Returns:
+        List of elevations, with None for out-of-bounds locations.
+    """
+    elevations = z.astype(object)
+    elevations[np.isnan(z)] = nodata_value
+    elevations[~in_bounds] = None
+    return elevations.tolist()
+
+
 def _get_elevation_from_path(lats, lons, path, interpolation):
     """Read values at locations in a raster.
 
@@ -80,87 +794,226 @@ def _get_elevation_from_path(lats, lons, path, interpolation):
     Returns:
         z_all: List of elevations, same length as lats/lons.
     """
-    z_all = []
-    interpolation = INTERPOLATION_METHODS.get(interpolation)
-    lons = np.asarray(lons)
-    lats = np.asarray(lats)
+    z_all, in_bounds = _sample_path(lats, lons, path, interpolation)
+    return _elevations_to_list(z_all, in_bounds, np.nan)
+
+
+def _open_raster(path):
+    """Open a raster for sampling.
+
+    Uncompressed .hgt tiles and compiled stores are memory mapped, skipping
+    GDAL. Everything else is opened with rasterio, through DATASET_POOL.
+
+    Args:
+        path: GDAL supported raster location.
+
+    Returns:
+        Context manager yielding a rasterio dataset, an hgt.HgtTile, or an
+            arraystore.StoreRaster.
+    """
+    if arraystore.is_store(path):
+        return contextlib.nullcontext(arraystore.open_raster(path))
+    if hgt.is_hgt(path):
+        tile = hgt.open_tile(path)
+        if tile is not None:
+            return contextlib.nullcontext(tile)
+    return DATASET_POOL.open(path)
 
+
+def _sample_path(
+    lats,
+    lons,
+    path,
+    interpolation,
+    raster_catalog=None,
+    tile_cache=None,
+    locations=None,
+):
+    """Read values at locations in a raster.
+
+    If the raster is in the catalog, points are located before the file is
+    opened, and the file isn't opened at all if every point is out of bounds.
+
+    Args:
+        lats, lons: Arrays of latitudes/longitudes.
+        path: GDAL supported raster location.
+        interpolation: method name string.
+        raster_catalog: Optional catalog.RasterCatalog with the raster's
+            georeferencing. If the raster is missing, it's added once opened.
+        tile_cache: Optional tilecache.TileCache to read the file through.
+        locations: Optional utils.ProjectedLocations of lats/lons, to reuse
+            projected coordinates.
+
+    Returns:
+        z_all: Array of elevations, NaN for NODATA and out-of-bounds points.
+        in_bounds: Boolean array, whether each point lies within the raster.
+    """
+    if locations is None:
+        locations = utils.ProjectedLocations(lats, lons)
+    lats = locations.lats
+    info = raster_catalog.get(path) if raster_catalog is not None else None
+    if info is not None:
+        rows, cols, oob_indices = _locate_points(locations, info, path)
+        if len(oob_indices) == len(lats):
+            return np.full(len(lats), np.nan), np.zeros(len(lats), dtype=bool)
+
+    read_path = tile_cache.local_path(path) if tile_cache else path
     try:
-        with rasterio.open(path) as f:
-            if f.crs is None:
-                msg = "Dataset has no coordinate reference system."
-                msg += f" Check the file '{path}' is a geo raster."
-                msg += " Otherwise you'll have to add the crs manually with a tool like gdaltranslate."
-                raise InputError(msg)
-
-            try:
-                if f.crs.is_epsg_code:
-                    xs, ys = utils.reproject_latlons(lats, lons, epsg=f.crs.to_epsg())
-                else:
-                    xs, ys = utils.reproject_latlons(lats, lons, wkt=f.crs.to_wkt())
-            except ValueError:
-                raise InputError("Unable to transform latlons to dataset projection.")
-
-            # Check bounds.
-            oob_indices = _validate_points_lie_within_raster(
-                xs, ys, lats, lons, f.bounds, f.res
-            )
-            print(f"{xs=}")
-            print(f"{ys=}")
-            tmp = f.index(xs.tolist(), ys.tolist(), op=_noop)
-            print(f"{tmp=}")
-            rows, cols = tuple(tmp)
-
-            # rows, cols = tuple(f.index(xs, ys, op=_noop))
-
-            # Different versions of rasterio may or may not collapse single
-            # f.index() lookups into scalars. We want to always have an
-            # array.
-            rows = np.atleast_1d(rows)
-            cols = np.atleast_1d(cols)
-
-            # Offset by 0.5 to convert from center coords (provided by
-            # f.index) to ul coords (expected by f.read).
-            rows = rows - 0.5
-            cols = cols - 0.5
-
-            # Because of floating point precision, indices may slightly exceed
-            # array bounds. Because we've checked the locations are within the
-            # file bounds,  it's safe to clip to the array shape.
-            rows = rows.clip(0, f.height - 1)
-            cols = cols.clip(0, f.width - 1)
-
-            # Read the locations, using a 1x1 window. The `masked` kwarg makes
-            # rasterio replace NODATA values with np.nan. The `boundless` kwarg
-            # forces the windowed elevation to be a 1x1 array, even when it all
-            # values are NODATA.
-            for i, (row, col) in enumerate(zip(rows, cols)):
-                if i in oob_indices:
-                    z_all.append(None)
-                    continue
-                window = rasterio.windows.Window(col, row, 1, 1)
-                z_array = f.read(
-                    indexes=1,
-                    window=window,
-                    resampling=interpolation,
-                    out_dtype=float,
-                    boundless=True,
-                    masked=True,
-                )
-                z = np.ma.filled(z_array, np.nan)[0][0]
-                z_all.append(z)
+        with _open_cached_raster(read_path, path, tile_cache) as f:
+            if info is None:
+                info = _raster_info(f, path, raster_catalog)
+                rows, cols, oob_indices = _locate_points(locations, info, read_path)
+            return _read_interpolated(f, rows, cols, oob_indices, interpolation)
 
     # Depending on the file format, when rasterio finds an invalid projection
     # of file, it might load it with a None crs, or it might throw an error.
     except rasterio.RasterioIOError as e:
         if "not recognized as a supported file format" in str(e):
-            msg = f"Dataset file '{path}' not recognised as a geo raster."
+            msg = f"Dataset file '{read_path}' not recognised as a geo raster."
             msg += " Check that the file has projection information with gdalsrsinfo,"
             msg += " and that the file is not corrupt."
             raise InputError(msg)
         raise e
 
-    return z_all
+
+@contextlib.contextmanager
+def _open_cached_raster(read_path, path, tile_cache):
+    """Open a raster like _open_raster(), fetching a tile cache copy again if
+    another process evicted it after tile_cache.local_path() returned.
+
+    Args:
+        read_path: Raster location, from tile_cache.local_path(path) if
+            tile_cache is set.
+        path: Source raster location.
+        tile_cache: Optional tilecache.TileCache.
+
+    Yields:
+        Open raster, like _open_raster().
+    """
+    with contextlib.ExitStack() as stack:
+        try:
+            f = stack.enter_context(_open_raster(read_path))
+        except (rasterio.RasterioIOError, FileNotFoundError):
+            if tile_cache is None or os.path.exists(read_path):
+                raise
+            f = stack.enter_context(_open_raster(tile_cache.local_path(path)))
+        yield f
+
+
+def _sample_raster(lats, lons, f, interpolation, locations=None):
+    """Read values at locations in an open raster.
+
+    Args:
+        lats, lons: Arrays of latitudes/longitudes.
+        f: inmemory.MemoryRaster.
+        interpolation: method name string.
+        locations: Optional utils.ProjectedLocations of lats/lons, to reuse
+            projected coordinates.
+
+    Returns:
+        z_all: Array of elevations, NaN for NODATA and out-of-bounds points.
+        in_bounds: Boolean array, whether each point lies within the raster.
+    """
+    info = f.info
+    if info is None:
+        raise InputError("Unable to transform latlons to dataset projection.")
+    if locations is None:
+        locations = utils.ProjectedLocations(lats, lons)
+    rows, cols, oob_indices = _locate_points(locations, info, f.name)
+    return _read_interpolated(f, rows, cols, oob_indices, interpolation)
+
+
+def _raster_info(f, path, raster_catalog=None):
+    """Georeferencing of an open raster.
+
+    Args:
+        f: Open rasterio dataset, or an equivalent like hgt.HgtTile.
+        path: Raster path, as the catalog key.
+        raster_catalog: Optional catalog.RasterCatalog to add the raster to.
+
+    Returns:
+        catalog.RasterInfo.
+    """
+    raster_info = catalog.read_raster_info(f)
+    try:
+        if raster_catalog is not None:
+            raster_catalog.add(path, raster_info)
+            return raster_catalog.get(path)
+        return catalog.RasterInfo.from_dict(raster_info)
+    except ValueError:
+        raise InputError("Unable to transform latlons to dataset projection.")
+
+
+def _pixel_coords(inv_transform, xs, ys):
+    """Fractional pixel coordinates of locations, like rasterio's index().
+
+    Args:
+        inv_transform: Inverse of the raster's affine transform.
+        xs, ys: Arrays of coordinates, in the raster's projection.
+
+    Returns:
+        rows, cols: Float arrays of pixel coordinates.
+    """
+    # Same arithmetic as rasterio's inverse affine, for identical results.
+    inv = inv_transform
+    xs = np.atleast_1d(np.asarray(xs, dtype=float))
+    ys = np.atleast_1d(np.asarray(ys, dtype=float))
+    cols = xs * inv.a + ys * inv.b + inv.c
+    rows = xs * inv.d + ys * inv.e + inv.f
+    return rows, cols
+
+
+def _locate_points(locations, info, path):
+    """Pixel coordinates of locations in a raster.
+
+    Args:
+        locations: utils.ProjectedLocations.
+        info: catalog.RasterInfo of the raster.
+        path: Raster location, for error messages.
+
+    Returns:
+        rows, cols: Float arrays of pixel coordinates, clipped to the raster.
+        oob_indices: Indices of points lying outside the raster.
+    """
+    if info.crs is None:
+        msg = "Dataset has no coordinate reference system."
+        msg += f" Check the file '{path}' is a geo raster."
+        msg += " Otherwise you'll have to add the crs manually with a tool like gdaltranslate."
+        raise InputError(msg)
+
+    if info.approx_grid is not None:
+        # Interpolate pixels from the grid, except for any points beyond it.
+        rows, cols, is_covered = info.approx_grid.pixel_coords(
+            locations.lats, locations.lons
+        )
+        uncovered = np.flatnonzero(~is_covered)
+        if len(uncovered):
+            xs, ys = locations.take(uncovered).project(info.crs, info.transformer)
+            rows[uncovered], cols[uncovered] = _pixel_coords(info.inv_transform, xs, ys)
+        oob_indices = _validate_pixels_lie_within_raster(
+            rows, cols, info.height, info.width
+        )
+    else:
+        xs, ys = locations.project(info.crs, info.transformer)
+
+        # Check bounds.
+        oob_indices = _validate_points_lie_within_raster(
+            xs, ys, locations.lats, locations.lons, info.bounds, info.res
+        )
+        rows, cols = _pixel_coords(info.inv_transform, xs, ys)
+
+    # Offset by 0.5 to convert from center coords (provided by
+    # _pixel_coords) to ul coords (expected by f.read).
+    rows = rows - 0.5
+    cols = cols - 0.5
+
+    # Because of floating point precision, indices may slightly exceed
+    # array bounds. Because we've checked the locations are within the
+    # file bounds,  it's safe to clip to the array shape.
+    rows = rows.clip(0, info.height - 1)
+    cols = cols.clip(0, info.width - 1)
+
+    return rows, cols, oob_indices
 
 
 def _get_elevation_for_single_dataset(
@@ -179,46 +1032,76 @@ def _get_elevation_for_single_dataset(
     Returns:
         elevations: List of elevations, same length as lats/lons.
     """
+    z, in_bounds = _sample_dataset(lats, lons, dataset, interpolation)
+    return _elevations_to_list(z, in_bounds, nodata_value)
+
+
+def _sample_dataset(lats, lons, dataset, interpolation, locations=None):
+    """Read elevations from a dataset, as arrays.
+
+    Args:
+        lats, lons: Arrays of latitudes/longitudes.
+        dataset: config.Dataset object.
+        interpolation: method name string.
+        locations: Optional utils.ProjectedLocations of lats/lons, to reuse
+            projected coordinates.
+
+    Returns:
+        z: Array of elevations, NaN for NODATA and out-of-bounds points.
+        in_bounds: Boolean array, whether each point lies within a raster.
+    """
 
     # Which paths we need results from.
-    lats = np.array(lats)
-    lons = np.array(lons)
-    paths = dataset.location_paths(lats, lons)
-
-    # Store mapping of tile path to point so we can merge back together later.
-    elevations_by_path = {}
-    path_to_point_index = collections.defaultdict(list)
-    for i, path in enumerate(paths):
-        path_to_point_index[path].append(i)
-
-    # Batch results by path.
-    for path, indices in path_to_point_index.items():
-        if path is None:
-            elevations_by_path[None] = [None] * len(indices)
-            continue
-        batch_lats = lats[path_to_point_index[path]]
-        batch_lons = lons[path_to_point_index[path]]
-        elevations_by_path[path] = _get_elevation_from_path(
-            batch_lats, batch_lons, path, interpolation
-        )
+    if locations is None:
+        locations = utils.ProjectedLocations(lats, lons)
+    lats = locations.lats
+    lons = locations.lons
+    paths = np.asarray(dataset.location_paths(lats, lons, locations), dtype=object)
 
-    # Put the results back again.
-    elevations = [None] * len(paths)
-    for path, path_elevations in elevations_by_path.items():
-        for i_path, i_original in enumerate(path_to_point_index[path]):
-            elevations[i_original] = path_elevations[i_path]
+    # Locations without a path aren't covered by the dataset.
+    z = np.full(len(paths), np.nan)
+    in_bounds = np.zeros(len(paths), dtype=bool)
+    point_indices = np.flatnonzero(np.not_equal(paths, None))
 
-    elevations = utils.fill_na(elevations, nodata_value)
-    return elevations
+    # Batch points by path.
+    unique_paths, groups = utils.group_indices(paths[point_indices].astype(str))
+    groups = [point_indices[indices] for indices in groups]
 
+    def _sample_group(path, indices):
+        if dataset.in_memory:
+            f = inmemory.load(path, dataset.in_memory_overview)
+            return _sample_raster(
+                lats[indices],
+                lons[indices],
+                f,
+                interpolation,
+                locations=locations.take(indices),
+            )
+        return _sample_path(
+            lats[indices],
+            lons[indices],
+            path,
+            interpolation,
+            raster_catalog=dataset.catalog,
+            tile_cache=dataset.tile_cache,
+            locations=locations.take(indices),
+        )
 
-class _Point:
-    def __init__(self, lat, lon, index):
-        self.lat = lat
-        self.lon = lon
-        self.index = index
-        self.elevation = None
-        self.dataset_name = None
+    # GDAL releases the GIL while reading, so a request spanning many files
+    # can read them concurrently.
+    n_threads = min(dataset.max_read_threads, len(unique_paths))
+    if n_threads > 1:
+        with concurrent.futures.ThreadPoolExecutor(n_threads) as executor:
+            results = list(executor.map(_sample_group, unique_paths, groups))
+    else:
+        results = map(_sample_group, unique_paths, groups)
+
+    # Scatter results back into the full arrays.
+    for indices, (path_z, path_in_bounds) in zip(groups, results):
+        z[indices] = path_z
+        in_bounds[indices] = path_in_bounds
+
+    return z, in_bounds
 
 
 def get_elevation(lats, lons, datasets, interpolation="nearest", nodata_value=None):
@@ -233,56 +1116,50 @@ def get_elevation(lats, lons, datasets, interpolation="nearest", nodata_value=No
     Returns:
         elevations: List of elevations, same length as lats/lons.
     """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+
+    # Each location is projected once per crs, however many tiles and
+    # datasets use that crs.
+    locations = utils.ProjectedLocations(lats, lons)
+
+    # Results so far. A point is filled once it has a non-null elevation.
+    # Points not queried by any dataset are attributed to the last one.
+    z = np.full(len(lats), np.nan)
+    in_bounds = np.zeros(len(lats), dtype=bool)
+    is_filled = np.zeros(len(lats), dtype=bool)
+    dataset_indices = np.full(len(lats), len(datasets) - 1)
 
-    # # Early exit for single dataset.
-    # if len(datasets) == 1:
-    #     elevations = _get_elevation_for_single_dataset(
-    #         lats, lons, datasets[0], interpolation, nodata_value
-    #     )
-    #     dataset_names = [datasets[0].name] * len(lats)
-    #     return elevations, dataset_names
-
-    # Check
-    points = [_Point(lat, lon, idx) for idx, (lat, lon) in enumerate(zip(lats, lons))]
-    for dataset in datasets:
-        # Only check points that have no point yet. Can exit early if
-        # there's no unqueried points.
-        dataset_points = [p for p in points if p.elevation is None]
-        if not dataset_points:
+    for i, dataset in enumerate(datasets):
+        # Can exit early if every point is filled.
+        if is_filled.all():
             break
 
-        # Only check points within the dataset bounds.
-        dataset_points = [
-            p for p in dataset_points if p.lat >= dataset.wgs84_bounds.bottom
-        ]
-        dataset_points = [
-            p for p in dataset_points if p.lat <= dataset.wgs84_bounds.top
-        ]
-        dataset_points = [
-            p for p in dataset_points if p.lon >= dataset.wgs84_bounds.left
-        ]
-        dataset_points = [
-            p for p in dataset_points if p.lon <= dataset.wgs84_bounds.right
-        ]
-        if not dataset_points:
+        # Only check unfilled points within the dataset bounds.
+        bounds = dataset.wgs84_bounds
+        mask = ~is_filled
+        mask &= (lats >= bounds.bottom) & (lats <= bounds.top)
+        mask &= (lons >= bounds.left) & (lons <= bounds.right)
+        indices = np.flatnonzero(mask)
+        if not len(indices):
             continue
 
         # Get locations.
-        elevations = _get_elevation_for_single_dataset(
-            [p.lat for p in dataset_points],
-            [p.lon for p in dataset_points],
+        z[indices], in_bounds[indices] = _sample_dataset(
+            lats[indices],
+            lons[indices],
             dataset,
             interpolation,
-            nodata_value,
+            locations=locations.take(indices),
         )
+        dataset_indices[indices] = i
 
-        # Save.
-        for point, elevation in zip(dataset_points, elevations):
-            points[point.index].elevation = elevation
-            points[point.index].dataset_name = dataset.name
+        # NODATA only counts as filled if it's replaced with a non-null value.
+        is_filled[indices] = in_bounds[indices]
+        if nodata_value is None:
+            is_filled[indices] &= ~np.isnan(z[indices])
 
     # Return elevations.
-    fallback_dataset_name = datasets[-1].name
-    dataset_names = [p.dataset_name or fallback_dataset_name for p in points]
-    elevations = [p.elevation for p in points]
-    return elevations, dataset_names
+    elevations = _elevations_to_list(z, in_bounds, nodata_value)
+    dataset_names = np.array([d.name for d in datasets], dtype=object)
+    return elevations, dataset_names[dataset_indices].tolist()
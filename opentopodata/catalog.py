@@ -0,0 +1,254 @@
+import threading
+
+import numpy as np
+import rasterio
+
+from opentopodata import approxgrid, utils
+
+
+# Entries can be added by concurrent read threads.
+_CATALOG_LOCK = threading.Lock()
+
+# Per-raster arrays of a RasterCatalog, as {name: (row shape, dtype)}.
+_CATALOG_ARRAYS = {
+    "crs_ids": ((), int),
+    "bounds": ((4,), float),
+    "res": ((2,), float),
+    "transforms": ((6,), float),
+    "inv_transforms": ((6,), float),
+    "shapes": ((2,), int),
+}
+
+
+def read_raster_info(f):
+    """Georeferencing of an open raster.
+
+    Args:
+        f: Open rasterio dataset, or an equivalent like hgt.HgtTile.
+
+    Returns:
+        JSON-serialisable dict of the raster's crs (EPSG code, WKT string,
+            or None), bounds, res, affine transform and shape.
+    """
+    crs = f.crs
+    if crs is not None:
+        crs = crs.to_epsg() if crs.is_epsg_code else crs.to_wkt()
+    return {
+        "crs": crs,
+        "bounds": list(f.bounds),
+        "res": list(f.res),
+        "transform": list(f.transform)[:6],
+        "shape": [f.height, f.width],
+    }
+
+
+def _build_transformer(crs):
+    """Transformer from WGS84 latlons to a raster crs from read_raster_info().
+
+    Raises:
+        ValueError: if the crs is invalid.
+    """
+    if crs is None:
+        return None
+    if isinstance(crs, int):
+        return utils.latlon_transformer(epsg=crs)
+    return utils.latlon_transformer(wkt=crs)
+
+
+class RasterInfo:
+    """Georeferencing of a single raster, from a RasterCatalog."""
+
+    def __init__(
+        self,
+        crs,
+        bounds,
+        res,
+        transform,
+        shape,
+        transformer,
+        inv_transform,
+        approx_grid=None,
+    ):
+        self.crs = crs
+        self.bounds = rasterio.coords.BoundingBox(*bounds)
+        self.res = tuple(res)
+        self.transform = rasterio.Affine(*transform)
+        self.height, self.width = (int(n) for n in shape)
+
+        # For locating points: latlons to raster crs, then to pixels. Or
+        # latlons straight to pixels, approximately.
+        self.transformer = transformer
+        self.inv_transform = rasterio.Affine(*inv_transform)
+        self.approx_grid = approx_grid
+
+    @classmethod
+    def from_dict(cls, info):
+        """RasterInfo of a raster outside a catalog.
+
+        Args:
+            info: Dict from read_raster_info().
+
+        Raises:
+            ValueError: if the crs is invalid.
+        """
+        return cls(
+            transformer=_build_transformer(info["crs"]),
+            inv_transform=list(~rasterio.Affine(*info["transform"]))[:6],
+            **info,
+        )
+
+
+class RasterCatalog:
+    """Georeferencing of a dataset's rasters, so reads can be planned without
+    opening files.
+
+    Entries are stored as arrays, with crs values deduplicated into ids, so
+    the catalog stays small when pickled for large tiled datasets. Each crs
+    gets a transformer, built once when it's first added, and each raster the
+    inverse of its transform, so points can be located without any per-request
+    setup. The arrays are views of buffers that double in size when full, so
+    rasters can be added one at a time as they're first used.
+
+    With max_error_px, points are located approximately, with an
+    approxgrid.ApproxGrid built for each raster the first time it's used.
+    """
+
+    def __init__(self, max_error_px=None):
+        """
+        Args:
+            max_error_px: Optional maximum error, in pixels, for locating
+                points approximately. By default points are located exactly.
+        """
+        self.max_error_px = max_error_px
+        self._approx_grids = {}
+        self._indices = {}
+        self.crs_list = []
+        self.transformers = []
+        self._buffers = {}
+        for name, (shape, dtype) in _CATALOG_ARRAYS.items():
+            self._buffers[name] = np.empty((0, *shape), dtype=dtype)
+            setattr(self, name, self._buffers[name])
+
+    def __getstate__(self):
+        # Transformers and grids are rebuilt rather than pickled, and only the
+        # used part of each buffer is kept.
+        state = self.__dict__.copy()
+        del state["transformers"]
+        del state["_approx_grids"]
+        del state["_buffers"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.transformers = [_build_transformer(crs) for crs in self.crs_list]
+        self._approx_grids = {}
+        self._buffers = {name: getattr(self, name) for name in _CATALOG_ARRAYS}
+
+    def __len__(self):
+        return len(self._indices)
+
+    def __contains__(self, path):
+        return path in self._indices
+
+    def add_many(self, paths, infos):
+        """Add rasters.
+
+        Args:
+            paths: List of raster paths.
+            infos: List of dicts from read_raster_info(), same length as paths.
+
+        Raises:
+            ValueError: if a crs is invalid. No rasters are added.
+        """
+        with _CATALOG_LOCK:
+            new = [(p, i) for p, i in zip(paths, infos) if p not in self._indices]
+            if not new:
+                return
+            crs_list = list(self.crs_list)
+            transformers = list(self.transformers)
+            crs_ids = []
+            for _, info in new:
+                if info["crs"] not in crs_list:
+                    transformers.append(_build_transformer(info["crs"]))
+                    crs_list.append(info["crs"])
+                crs_ids.append(crs_list.index(info["crs"]))
+
+            infos = [info for _, info in new]
+            rows = {
+                "crs_ids": crs_ids,
+                "bounds": [i["bounds"] for i in infos],
+                "res": [i["res"] for i in infos],
+                "transforms": [i["transform"] for i in infos],
+                "inv_transforms": [
+                    list(~rasterio.Affine(*i["transform"]))[:6] for i in infos
+                ],
+                "shapes": [i["shape"] for i in infos],
+            }
+
+            # New rows go past the end of the arrays readers can see, and the
+            # arrays are replaced before the paths are added, so readers never
+            # see a path without its entry.
+            n_old = len(self._indices)
+            n_new = n_old + len(new)
+            for name, values in rows.items():
+                buffer = self._buffers[name]
+                if len(buffer) < n_new:
+                    grown = np.empty(
+                        (max(n_new, 2 * len(buffer)), *buffer.shape[1:]),
+                        dtype=buffer.dtype,
+                    )
+                    grown[:n_old] = buffer[:n_old]
+                    buffer = self._buffers[name] = grown
+                buffer[n_old:n_new] = values
+            self.crs_list = crs_list
+            self.transformers = transformers
+            for name, buffer in self._buffers.items():
+                setattr(self, name, buffer[:n_new])
+            for path, _ in new:
+                self._indices[path] = len(self._indices)
+
+    def add(self, path, info):
+        """Add a raster.
+
+        Args:
+            path: Raster path.
+            info: Dict from read_raster_info().
+        """
+        self.add_many([path], [info])
+
+    def get(self, path):
+        """Georeferencing of a raster.
+
+        Args:
+            path: Raster path.
+
+        Returns:
+            RasterInfo, or None if the raster isn't in the catalog.
+        """
+        i = self._indices.get(path)
+        if i is None:
+            return None
+        crs_id = self.crs_ids[i]
+        info = RasterInfo(
+            crs=self.crs_list[crs_id],
+            bounds=self.bounds[i],
+            res=self.res[i],
+            transform=self.transforms[i],
+            shape=self.shapes[i],
+            transformer=self.transformers[crs_id],
+            inv_transform=self.inv_transforms[i],
+        )
+
+        # Concurrent first uses may build the same grid twice, which is
+        # harmless.
+        if self.max_error_px is not None:
+            if i not in self._approx_grids:
+                self._approx_grids[i] = approxgrid.ApproxGrid.build(
+                    info.crs,
+                    info.transformer,
+                    info.inv_transform,
+                    info.bounds,
+                    self.max_error_px,
+                )
+            info.approx_grid = self._approx_grids[i]
+        return info
@@ -0,0 +1,281 @@
+import concurrent.futures
+import threading
+import time
+import zlib
+
+import numpy as np
+import requests
+
+from opentopodata import utils
+
+
+VSICURL_PREFIX = "/vsicurl/"
+
+# Ranges separated by a gap smaller than this are fetched in a single request:
+# downloading a few unused bytes is quicker than another round trip.
+MAX_RANGE_GAP_BYTES = 64 * 1024
+
+# Max number of range requests in flight at once for a single read.
+MAX_FETCH_THREADS = 8
+
+HTTP_TIMEOUT_S = 30
+
+# Compression and predictor values that can be decoded in-process. Horizontal
+# differencing (predictor 2) is only undone for integer samples: for floats it
+# works on the bytes, which is left to GDAL.
+SUPPORTED_COMPRESSIONS = {None, "DEFLATE"}
+SUPPORTED_PREDICTORS = {None, "1", "2"}
+INTEGER_ONLY_PREDICTORS = {"2"}
+
+# Remote files are checked for changes at most this often.
+REMOTE_VERSION_TTL_S = 60
+
+# The TIFF byte order marker of each url, fetched once per process.
+_BYTE_ORDERS = {}
+
+# {url: (checked_at, version)} from remote_version().
+_REMOTE_VERSIONS = {}
+
+_thread_local = threading.local()
+
+
+def _session():
+    """A requests session per thread, so connections can be reused."""
+    if not hasattr(_thread_local, "session"):
+        _thread_local.session = requests.Session()
+    return _thread_local.session
+
+
+def _fetch_range(url, start, stop):
+    """Download bytes [start, stop) of a url."""
+    headers = {"Range": f"bytes={start}-{stop - 1}"}
+    response = _session().get(url, headers=headers, timeout=HTTP_TIMEOUT_S)
+    response.raise_for_status()
+
+    # A server that doesn't support ranges sends the whole file.
+    data = response.content
+    if response.status_code != 206:
+        data = data[start:stop]
+    if len(data) != stop - start:
+        raise IOError(f"Short read of {url}: expected {stop - start} bytes.")
+    return data
+
+
+def remote_version(url):
+    """A token that changes when a remote file is modified.
+
+    Cached blocks of remote files are keyed on this in place of an mtime. The
+    ETag or Last-Modified header is fetched with a HEAD request, at most once
+    every REMOTE_VERSION_TTL_S. If the server sends neither (or can't be
+    reached), the token changes every REMOTE_VERSION_TTL_S instead, so cached
+    blocks expire.
+
+    Args:
+        url: HTTP url of the file.
+
+    Returns:
+        String version token.
+    """
+    now = time.monotonic()
+    cached = _REMOTE_VERSIONS.get(url)
+    if cached and now - cached[0] < REMOTE_VERSION_TTL_S:
+        return cached[1]
+
+    try:
+        response = _session().head(url, timeout=HTTP_TIMEOUT_S)
+        response.raise_for_status()
+        version = response.headers.get("ETag") or response.headers.get("Last-Modified")
+    except requests.RequestException:
+        version = None
+    if not version:
+        version = f"ttl-{int(time.time() // REMOTE_VERSION_TTL_S)}"
+
+    _REMOTE_VERSIONS[url] = (now, version)
+    return version
+
+
+def coalesce_ranges(ranges, max_gap=MAX_RANGE_GAP_BYTES):
+    """Merge nearby byte ranges, to reduce the number of requests.
+
+    Args:
+        ranges: List of (start, stop) byte ranges, stops are exclusive.
+        max_gap: Ranges separated by at most this many bytes are merged.
+
+    Returns:
+        List of (start, stop, range_indices) tuples, where range_indices
+            lists which input ranges are contained in the merged range.
+    """
+    merged = []
+    for i in sorted(range(len(ranges)), key=lambda i: ranges[i]):
+        start, stop = ranges[i]
+        if merged and start - merged[-1][1] <= max_gap:
+            merged[-1][1] = max(merged[-1][1], stop)
+            merged[-1][2].append(i)
+        else:
+            merged.append([start, stop, [i]])
+    return [tuple(m) for m in merged]
+
+
+class CogReader:
+    """Read blocks of a remote GeoTIFF with HTTP range requests.
+
+    GDAL reads a /vsicurl/ raster one block at a time, so a request touching
+    many blocks pays many serial round trips. Instead, GDAL is only used for
+    the header: the byte offsets of every block a batch needs are looked up,
+    nearby blocks are merged into single range requests, the requests are
+    made concurrently, and the blocks are decompressed with numpy.
+
+    Only simple encodings are supported: uncompressed or deflate, with no
+    predictor, or horizontal differencing of integer samples. Use
+    from_dataset() to check whether a raster can be read this way.
+    """
+
+    def __init__(self, f, url, byteorder):
+        """A reader for an open raster.
+
+        Args:
+            f: Open rasterio dataset.
+            url: HTTP url of the raster.
+            byteorder: "<" or ">".
+        """
+        self.f = f
+        self.url = url
+        self.block_shape = f.block_shapes[0]
+        self.dtype = np.dtype(f.dtypes[0]).newbyteorder(byteorder)
+        self.nodata = f.nodata
+        image_structure = f.tags(ns="IMAGE_STRUCTURE")
+        self.compression = image_structure.get("COMPRESSION")
+        self.predictor = image_structure.get("PREDICTOR")
+
+    @classmethod
+    def from_dataset(cls, f):
+        """Build a reader for an open raster, if supported.
+
+        Args:
+            f: Open rasterio dataset.
+
+        Returns:
+            CogReader, or None if the raster isn't a remote GeoTIFF with a
+                supported encoding.
+        """
+        if not f.name.startswith(VSICURL_PREFIX):
+            return None
+        if f.driver != "GTiff" or not f.profile.get("tiled"):
+            return None
+
+        image_structure = f.tags(ns="IMAGE_STRUCTURE")
+        if image_structure.get("COMPRESSION") not in SUPPORTED_COMPRESSIONS:
+            return None
+        predictor = image_structure.get("PREDICTOR")
+        if predictor not in SUPPORTED_PREDICTORS:
+            return None
+        if (
+            predictor in INTEGER_ONLY_PREDICTORS
+            and np.dtype(f.dtypes[0]).kind not in "iu"
+        ):
+            return None
+        if "NBITS" in image_structure:
+            return None
+        if f.count > 1 and image_structure.get("INTERLEAVE") != "BAND":
+            return None
+
+        # Internal mask bands aren't supported, just a NODATA value.
+        if any(
+            flag.name not in ("all_valid", "nodata") for flag in f.mask_flag_enums[0]
+        ):
+            return None
+        if np.dtype(f.dtypes[0]).kind == "c":
+            return None
+
+        url = f.name[len(VSICURL_PREFIX) :]
+        if url not in _BYTE_ORDERS:
+            marker = _fetch_range(url, 0, 2)
+            _BYTE_ORDERS[url] = {b"II": "<", b"MM": ">"}.get(marker)
+        if _BYTE_ORDERS[url] is None:
+            return None
+
+        return cls(f, url, _BYTE_ORDERS[url])
+
+    def _block_range(self, block):
+        """Byte range of a block in the file, or None for sparse blocks."""
+        block_row, block_col = block
+        suffix = f"{block_col}_{block_row}"
+        offset = self.f.get_tag_item(f"BLOCK_OFFSET_{suffix}", "TIFF", bidx=1)
+        size = self.f.get_tag_item(f"BLOCK_SIZE_{suffix}", "TIFF", bidx=1)
+        if not offset or not size or not int(size):
+            return None
+        return int(offset), int(offset) + int(size)
+
+    def _decode_block(self, data):
+        """Decompress a block to a float array, with NODATA as NaN."""
+        if self.compression == "DEFLATE":
+            data = zlib.decompress(data)
+        z = np.frombuffer(data, dtype=self.dtype).reshape(self.block_shape)
+        if self.predictor == "2":
+            z = np.cumsum(z, axis=1, dtype=self.dtype)
+        z = z.astype(float)
+        if self.nodata is not None:
+            z[z == self.nodata] = np.nan
+        return z
+
+    def read_blocks(self, blocks):
+        """Fetch and decode blocks.
+
+        Args:
+            blocks: List of (block_row, block_col) tuples.
+
+        Returns:
+            Dict of {(block_row, block_col): 2D float array}, with NODATA as NaN.
+        """
+        # Sparse blocks aren't stored in the file.
+        z_blocks = {}
+        byte_ranges = []
+        stored_blocks = []
+        for block in blocks:
+            byte_range = self._block_range(block)
+            if byte_range is None:
+                fill = np.nan if self.nodata is not None else 0
+                z_blocks[block] = np.full(self.block_shape, fill)
+            else:
+                byte_ranges.append(byte_range)
+                stored_blocks.append(block)
+
+        def _fetch(merged_range):
+            start, stop, _ = merged_range
+            return _fetch_range(self.url, start, stop)
+
+        merged_ranges = coalesce_ranges(byte_ranges)
+        n_threads = min(MAX_FETCH_THREADS, len(merged_ranges))
+        if n_threads > 1:
+            with concurrent.futures.ThreadPoolExecutor(n_threads) as executor:
+                results = list(executor.map(_fetch, merged_ranges))
+        else:
+            results = map(_fetch, merged_ranges)
+
+        # Split the merged ranges back into blocks.
+        for (start, _, indices), data in zip(merged_ranges, results):
+            for i in indices:
+                block_start, block_stop = byte_ranges[i]
+                block_data = data[block_start - start : block_stop - start]
+                z_blocks[stored_blocks[i]] = self._decode_block(block_data)
+
+        return z_blocks
+
+    def read_windows(self, windows):
+        """Read several windows of the first band, fetching blocks together.
+
+        Args:
+            windows: List of rasterio Windows, within the raster.
+
+        Returns:
+            List of 2D float arrays, with NODATA replaced by NaN.
+        """
+        blocks = set()
+        for window in windows:
+            blocks.update(utils.window_tiles(window, self.block_shape))
+        z_blocks = self.read_blocks(sorted(blocks))
+
+        return [
+            utils.assemble_window(w, self.block_shape, z_blocks.__getitem__)
+            for w in windows
+        ]
@@ -1,5 +1,4 @@
 from decimal import Decimal
-from glob import glob
 from urllib.parse import urlparse
 import abc
 import os
@@ -8,8 +7,17 @@ import yaml
 
 import numpy as np
 import rasterio
-
-from opentopodata import utils
+import rasterio.warp
+
+from opentopodata import (
+    arraystore,
+    catalog,
+    cog,
+    datasetindex,
+    spatialindex,
+    tilecache,
+    utils,
+)
 
 CONFIG_PATH = "config.yaml"
 EXAMPLE_CONFIG_PATH = "example-config.yaml"
@@ -18,8 +26,18 @@ AUX_EXTENSIONS = [".tfw", ".aux", ".aux.xml", ".rdd", ".jpw", ".ovr", ".prj", ".
 
 DEFAULTS = {
     "max_locations_per_request": 100,
+    "max_open_files": 64,
+    "block_cache_size_mb": 64,
+    "shared_block_cache_path": None,
+    "shared_block_cache_size_mb": 256,
+    "max_read_threads": 1,
+    "dataset_index_path": None,
+    "preload_datasets": False,
     "dataset.filename_tile_size": 1,
     "dataset.filename_epsg": utils.WGS84_LATLON_EPSG,
+    "dataset.local_cache_size_gb": 10,
+    "dataset.unzip_cache_size_gb": 10,
+    "dataset.in_memory": False,
     "access_control_allow_origin": None,
 }
 
@@ -147,6 +165,55 @@ def load_config():
     config["access_control_allow_origin"] = config.get(
         "access_control_allow_origin", DEFAULTS["access_control_allow_origin"]
     )
+    config["max_open_files"] = config.get("max_open_files", DEFAULTS["max_open_files"])
+
+    config["block_cache_size_mb"] = config.get(
+        "block_cache_size_mb", DEFAULTS["block_cache_size_mb"]
+    )
+    config["shared_block_cache_path"] = config.get(
+        "shared_block_cache_path", DEFAULTS["shared_block_cache_path"]
+    )
+    config["shared_block_cache_size_mb"] = config.get(
+        "shared_block_cache_size_mb", DEFAULTS["shared_block_cache_size_mb"]
+    )
+    config["max_read_threads"] = config.get(
+        "max_read_threads", DEFAULTS["max_read_threads"]
+    )
+    config["dataset_index_path"] = config.get(
+        "dataset_index_path", DEFAULTS["dataset_index_path"]
+    )
+    config["preload_datasets"] = config.get(
+        "preload_datasets", DEFAULTS["preload_datasets"]
+    )
+
+    # Validate file pool size.
+    if not isinstance(config["max_open_files"], int) or config["max_open_files"] < 0:
+        raise ConfigError("max_open_files must be a non-negative integer.")
+
+    # Validate block cache sizes.
+    size_mb = config["block_cache_size_mb"]
+    if not isinstance(size_mb, (int, float)) or size_mb < 0:
+        raise ConfigError("block_cache_size_mb must be a non-negative number.")
+    size_mb = config["shared_block_cache_size_mb"]
+    if not isinstance(size_mb, (int, float)) or size_mb <= 0:
+        raise ConfigError("shared_block_cache_size_mb must be a positive number.")
+
+    # Validate index folder.
+    if config["dataset_index_path"] is not None and not isinstance(
+        config["dataset_index_path"], str
+    ):
+        raise ConfigError("dataset_index_path must be a folder path.")
+
+    # Validate preloading.
+    if not isinstance(config["preload_datasets"], bool):
+        raise ConfigError("preload_datasets must be true or false.")
+
+    # Validate thread counts.
+    for d in [config] + config["datasets"]:
+        if "max_read_threads" not in d:
+            continue
+        if not isinstance(d["max_read_threads"], int) or d["max_read_threads"] < 1:
+            raise ConfigError("max_read_threads must be a positive integer.")
 
     # Validate CORS. Must have protocol, domain, and optionally port.
     _validate_cors(config["access_control_allow_origin"])
@@ -154,6 +221,25 @@ def load_config():
     return config
 
 
+def dataset_options(config):
+    """Options for each dataset, with global defaults filled in.
+
+    Args:
+        config: Dict from load_config().
+
+    Returns:
+        Dict of {dataset_name: options dict} from config.datasets.
+    """
+    options = {}
+    for d in config["datasets"]:
+        options[d["name"]] = {
+            "max_read_threads": config["max_read_threads"],
+            "dataset_index_path": config["dataset_index_path"],
+            **d,
+        }
+    return options
+
+
 def load_datasets():
     """Init Dataset objects
 
@@ -161,10 +247,34 @@ def load_datasets():
         datasets: Dict of {dataset_name: Dataset object} from config.datasets.
     """
     config = load_config()
-    datasets = {d["name"]: Dataset.from_config(**d) for d in config["datasets"]}
+    datasets = {}
+    for name, d in dataset_options(config).items():
+        datasets[name] = Dataset.from_config(**d)
     return datasets
 
 
+def load_dataset(name, config=None):
+    """Init a single Dataset object, without loading the others.
+
+    Args:
+        name: Dataset name from config.datasets.
+        config: Optional dict from load_config(). By default the config file
+            is read.
+
+    Returns:
+        Dataset or MultiDataset object.
+
+    Raises:
+        ConfigError: if the dataset isn't in the config, or is invalid.
+    """
+    if config is None:
+        config = load_config()
+    options = dataset_options(config)
+    if name not in options:
+        raise ConfigError(f"Dataset '{name}' not in config.")
+    return Dataset.from_config(**options[name])
+
+
 class MultiDataset:
     def __init__(self, name, child_dataset_names):
         if not child_dataset_names:
@@ -183,10 +293,64 @@ class Dataset(abc.ABC):
     # By default, assume raster spans whole globe.
     wgs84_bounds = rasterio.coords.BoundingBox(-180, -90, 180, 90)
 
+    # How many files can be read at once for a single request.
+    max_read_threads = DEFAULTS["max_read_threads"]
+
+    # Optional local copy of the files.
+    tile_cache = None
+
+    # Whether to sample from a copy of the raster held in memory, and which
+    # overview of it.
+    in_memory = DEFAULTS["dataset.in_memory"]
+    in_memory_overview = None
+
+    # Georeferencing of the files, filled in by subclasses.
+    catalog = None
+
     @classmethod
     def _is_aux_file(cls, path):
         return any([path.lower().endswith(e) for e in AUX_EXTENSIONS])
 
+    @classmethod
+    def _srtm_tile_corners(cls, paths):
+        """Corners of SRTM-style named tiles.
+
+        Returns:
+            List of [northing, easting] strings, or None if any file isn't
+                named like an SRTM tile.
+        """
+        filenames = [os.path.basename(p) for p in paths]
+        if not all(re.match(FILENAME_TILE_REGEX, f, re.IGNORECASE) for f in filenames):
+            return None
+        corners = [TiledDataset._filename_to_tile_corner(f) for f in filenames]
+        return [[str(y), str(x)] for y, x in corners]
+
+    @classmethod
+    def _read_single_file_metadata(cls, path):
+        try:
+            with rasterio.open(path) as f:
+                return {
+                    "n_overviews": len(f.overviews(1)),
+                    "raster": catalog.read_raster_info(f),
+                }
+        except rasterio.RasterioIOError as e:
+            raise ConfigError(f"Unsupported filetype for '{path}': {e}")
+
+    @classmethod
+    def _save_index(cls, index, paths):
+        # The index only speeds up loading, so failing to save isn't an error.
+        try:
+            index.save(paths)
+        except OSError:
+            pass
+
+    @classmethod
+    def _validate_overview(cls, path, overview_level, n_overviews):
+        if overview_level is not None and overview_level >= n_overviews:
+            msg = f"in_memory_overview is {overview_level} but '{path}'"
+            msg += f" has {n_overviews} overviews."
+            raise ConfigError(msg)
+
     @classmethod
     def from_config(cls, name, path=None, **kwargs):
         """Initialise a Dataset from the config.
@@ -196,7 +360,8 @@ class Dataset(abc.ABC):
 
         Args:
             name: String used in request url and as datasets dictionary key.
-            path: String path to directory containing dataset.
+            path: String path to directory containing dataset, or http url
+                of a single raster file.
             kwargs: Passed to subclass __init__.
 
         Returns:
@@ -207,48 +372,151 @@ class Dataset(abc.ABC):
         if "child_datasets" in kwargs:
             return MultiDataset(name, kwargs["child_datasets"])
 
+        # Build bounds.
+        wgs84_bounds = None
+        if "wgs84_bounds" in kwargs:
+            wgs84_bounds = rasterio.coords.BoundingBox(
+                kwargs["wgs84_bounds"]["left"],
+                kwargs["wgs84_bounds"]["bottom"],
+                kwargs["wgs84_bounds"]["right"],
+                kwargs["wgs84_bounds"]["top"],
+            )
+
+        # Resident datasets.
+        in_memory = kwargs.get("in_memory", DEFAULTS["dataset.in_memory"])
+        in_memory_overview = kwargs.get("in_memory_overview")
+        if not isinstance(in_memory, bool):
+            raise ConfigError("in_memory must be true or false.")
+        if in_memory_overview is not None:
+            if not in_memory:
+                raise ConfigError("in_memory_overview requires in_memory: true.")
+            if (
+                not isinstance(in_memory_overview, int)
+                or isinstance(in_memory_overview, bool)
+                or in_memory_overview < 0
+            ):
+                raise ConfigError("in_memory_overview must be a non-negative integer.")
+        if in_memory and (
+            kwargs.get("local_cache_path") or kwargs.get("unzip_cache_path")
+        ):
+            msg = "Local caches aren't needed for in_memory datasets."
+            raise ConfigError(msg)
+
+        # Approximate point location.
+        max_error_px = kwargs.get("max_reprojection_error_px")
+        if max_error_px is not None and (
+            not isinstance(max_error_px, (int, float))
+            or isinstance(max_error_px, bool)
+            or max_error_px <= 0
+        ):
+            raise ConfigError("max_reprojection_error_px must be a positive number.")
+
+        # A url is a single remote file.
+        if urlparse(path).scheme in ("http", "https"):
+            if kwargs.get("local_cache_path") or kwargs.get("unzip_cache_path"):
+                msg = "Local caches aren't supported for url datasets."
+                raise ConfigError(msg)
+            tile_path = cog.VSICURL_PREFIX + path
+            try:
+                metadata = cls._read_single_file_metadata(tile_path)
+            except ConfigError:
+                raise ConfigError("Unable to read dataset at url '{}'.".format(path))
+            cls._validate_overview(
+                tile_path, in_memory_overview, metadata["n_overviews"]
+            )
+            return SingleFileDataset(
+                name,
+                tile_path=tile_path,
+                wgs84_bounds=wgs84_bounds,
+                in_memory=in_memory,
+                in_memory_overview=in_memory_overview,
+                raster_info=metadata["raster"],
+                max_reprojection_error_px=max_error_px,
+            )
+
         # Check the dataset is there.
         if not os.path.isdir(path):
             raise ConfigError("No dataset folder found at location '{}'".format(path))
 
+        # Compiled datasets are described by their manifest.
+        manifest = arraystore.read_manifest(path)
+        if manifest is not None:
+            if kwargs.get("local_cache_path") or kwargs.get("unzip_cache_path"):
+                msg = "Local caches aren't supported for compiled datasets."
+                raise ConfigError(msg)
+            if in_memory:
+                msg = "in_memory isn't supported for compiled datasets."
+                raise ConfigError(msg)
+            return ArrayStoreDataset(
+                name,
+                path,
+                manifest,
+                wgs84_bounds=wgs84_bounds,
+                max_read_threads=kwargs.get("max_read_threads"),
+                max_reprojection_error_px=max_error_px,
+            )
+
         # Find all the files in the dataset.
-        pattern = os.path.join(path, "**", "*")
-        all_paths = list(glob(pattern, recursive=True))
-        all_files = [p for p in all_paths if os.path.isfile(p)]
-        all_rasters = [p for p in all_files if not cls._is_aux_file(p)]
+        index = datasetindex.DatasetIndex(path, kwargs.get("dataset_index_path"))
+        all_files = index.files()
+        all_rasters = index.derived(
+            "rasters", lambda: [p for p in all_files if not cls._is_aux_file(p)]
+        )
         if not all_rasters:
             msg = f"Dataset folder '{path}' is empty after ignoring folders and aux files."
-            msg += f" {len(all_paths)} paths were found and {len(all_files)} files."
+            msg += f" {len(all_files)} files were found."
             raise ConfigError(msg)
 
-        # Build bounds.
-        wgs84_bounds = None
-        if "wgs84_bounds" in kwargs:
-            wgs84_bounds = rasterio.coords.BoundingBox(
-                kwargs["wgs84_bounds"]["left"],
-                kwargs["wgs84_bounds"]["bottom"],
-                kwargs["wgs84_bounds"]["right"],
-                kwargs["wgs84_bounds"]["top"],
+        # Build local cache.
+        tile_cache = None
+        if kwargs.get("local_cache_path") and kwargs.get("unzip_cache_path"):
+            msg = "Only one of local_cache_path and unzip_cache_path can be set."
+            raise ConfigError(msg)
+        for option, cache_cls in [
+            ("local_cache", tilecache.TileCache),
+            ("unzip_cache", tilecache.UnzipCache),
+        ]:
+            if not kwargs.get(f"{option}_path"):
+                continue
+            size_gb = kwargs.get(
+                f"{option}_size_gb", DEFAULTS[f"dataset.{option}_size_gb"]
+            )
+            if not isinstance(size_gb, (int, float)) or size_gb <= 0:
+                raise ConfigError(f"{option}_size_gb must be a positive number.")
+            tile_cache = cache_cls(
+                kwargs[f"{option}_path"], max_bytes=int(size_gb * 1024**3)
             )
 
         # Check for single file.
         if len(all_rasters) == 1:
             tile_path = all_rasters[0]
-            try:
-                with rasterio.open(tile_path):
-                    pass
-            except rasterio.RasterioIOError as e:
-                raise ConfigError("Unsupported filetype for '{}'.".format(tile_path))
+            metadata = index.metadata(tile_path, cls._read_single_file_metadata)
+            cls._save_index(index, all_rasters)
+            cls._validate_overview(
+                tile_path, in_memory_overview, metadata["n_overviews"]
+            )
             return SingleFileDataset(
-                name, tile_path=tile_path, wgs84_bounds=wgs84_bounds
+                name,
+                tile_path=tile_path,
+                wgs84_bounds=wgs84_bounds,
+                tile_cache=tile_cache,
+                in_memory=in_memory,
+                in_memory_overview=in_memory_overview,
+                raster_info=metadata["raster"],
+                max_reprojection_error_px=max_error_px,
             )
 
+        if in_memory:
+            msg = "in_memory is only supported for single-file datasets."
+            raise ConfigError(msg)
+        max_read_threads = kwargs.get("max_read_threads", DEFAULTS["max_read_threads"])
+
         # Check for SRTM-style naming.
-        all_filenames = [os.path.basename(p) for p in all_rasters]
-        is_srtm_raster = [
-            re.match(FILENAME_TILE_REGEX, f, re.IGNORECASE) for f in all_filenames
-        ]
-        if all(is_srtm_raster):
+        tile_corners = index.derived(
+            "tile_corners", lambda: cls._srtm_tile_corners(all_rasters)
+        )
+        if tile_corners is not None:
+            cls._save_index(index, [])
             filename_epsg = kwargs.get(
                 "filename_epsg", DEFAULTS["dataset.filename_epsg"]
             )
@@ -262,25 +530,36 @@ class Dataset(abc.ABC):
                 filename_epsg=filename_epsg,
                 filename_tile_size=filename_tile_size,
                 wgs84_bounds=wgs84_bounds,
+                max_read_threads=max_read_threads,
+                tile_cache=tile_cache,
+                tile_corners=[(Decimal(y), Decimal(x)) for y, x in tile_corners],
+                max_reprojection_error_px=max_error_px,
             )
 
-        # Unable to identify dataset type.
-        invalid_files = [
-            fn for fn, is_valid in zip(all_filenames, is_srtm_raster) if not is_valid
-        ]
-        is_srtm_raster = np.array(is_srtm_raster, dtype=bool)
-        msg = f"Unknown dataset type for '{name}'. Dataset should either be a single file,"
-        msg += " or split into tiles with the lower-left corner coord in the filename like 'N20W120'."
-        if invalid_files:
-            msg += f" Unrecognised filename: '{invalid_files[0]}'."
-        raise ConfigError(msg)
+        # Otherwise find files by their footprint.
+        dataset = IndexedDataset(
+            name,
+            path,
+            tile_paths=all_rasters,
+            wgs84_bounds=wgs84_bounds,
+            max_read_threads=max_read_threads,
+            tile_cache=tile_cache,
+            read_metadata=lambda p: index.metadata(
+                p, IndexedDataset._read_tile_metadata
+            ),
+            max_reprojection_error_px=max_error_px,
+        )
+        cls._save_index(index, all_rasters)
+        return dataset
 
     @abc.abstractmethod
-    def location_paths(self, lats, lons):
+    def location_paths(self, lats, lons, locations=None):
         """File corresponding to each location.
 
         Args:
             lats, lons: Lists of locations.
+            locations: Optional utils.ProjectedLocations of lats/lons, to
+                reuse projected coordinates.
 
         Returns:
             List of filenames, same length as locations.
@@ -288,23 +567,54 @@ class Dataset(abc.ABC):
 
 
 class SingleFileDataset(Dataset):
-    def __init__(self, name, tile_path, wgs84_bounds=None):
+    def __init__(
+        self,
+        name,
+        tile_path,
+        wgs84_bounds=None,
+        tile_cache=None,
+        in_memory=False,
+        in_memory_overview=None,
+        raster_info=None,
+        max_reprojection_error_px=None,
+    ):
         """A dataset consisting of a single raster file.
 
         Args:
             name: String used in request url and as datasets dictionary key.
             tile_path: String path to single raster file.
+            tile_cache: Optional tilecache.TileCache to read the file through.
+            in_memory: Whether to sample from a copy of the raster in memory.
+            in_memory_overview: Optional overview index to hold in memory
+                instead of the full resolution raster.
+            raster_info: Optional dict from catalog.read_raster_info() for
+                the file. Otherwise it's read when the file is first sampled.
+            max_reprojection_error_px: Optional maximum error, in pixels, for
+                locating points approximately.
         """
         self.name = name
         self.tile_path = tile_path
+        self.catalog = catalog.RasterCatalog(max_reprojection_error_px)
+        if raster_info:
+            try:
+                self.catalog.add(tile_path, raster_info)
+            except ValueError as e:
+                raise ConfigError(f"Invalid projection for '{tile_path}': {e}")
         if wgs84_bounds:
             self.wgs84_bounds = wgs84_bounds
+        if tile_cache:
+            self.tile_cache = tile_cache
+        if in_memory:
+            self.in_memory = in_memory
+            self.in_memory_overview = in_memory_overview
 
-    def location_paths(self, lats, lons):
+    def location_paths(self, lats, lons, locations=None):
         """File corresponding to each location.
 
         Args:
             lats, lons: Lists of locations.
+            locations: Optional utils.ProjectedLocations of lats/lons, to
+                reuse projected coordinates.
 
         Returns:
             List of filenames, same length as locations.
@@ -322,6 +632,10 @@ class TiledDataset(Dataset):
         filename_epsg,
         filename_tile_size,
         wgs84_bounds=None,
+        max_read_threads=None,
+        tile_cache=None,
+        tile_corners=None,
+        max_reprojection_error_px=None,
     ):
         """A dataset of files named in SRTM format.
 
@@ -338,15 +652,34 @@ class TiledDataset(Dataset):
             filename_epsg: Coordinate system of the filename.
             filename_tile_size: Size of each tile, in the coordinate system units. Used for
                 rounding down the location to get the corner. Assumed to have an offset from zero.
+            max_read_threads: How many tiles to read concurrently for a single request.
+            tile_cache: Optional tilecache.TileCache to read tiles through.
+            tile_corners: Optional list of (northing, easting) Decimal
+                corners of tile_paths, if already parsed from the filenames.
+            max_reprojection_error_px: Optional maximum error, in pixels, for
+                locating points in tiles approximately.
         """
         self.name = name
         self.path = path
+        self.tile_paths = tile_paths
         self.filename_epsg = filename_epsg
 
+        # Opening every tile would make loading slow, so each tile is added to
+        # the catalog when it's first sampled.
+        self.catalog = catalog.RasterCatalog(max_reprojection_error_px)
+
         # Bounds.
         if wgs84_bounds:
             self.wgs84_bounds = wgs84_bounds
 
+        # Concurrency.
+        if max_read_threads:
+            self.max_read_threads = max_read_threads
+
+        # Local copies.
+        if tile_cache:
+            self.tile_cache = tile_cache
+
         # Validate tile size.
         if isinstance(filename_tile_size, float):
             if filename_tile_size.is_integer():
@@ -364,13 +697,67 @@ class TiledDataset(Dataset):
             msg = f"Unable to parse filename_tile_size {filename_tile_size}"
             raise ConfigError(msg)
 
+        # Locations are converted to the filename projection on every lookup.
+        self._build_filename_transformer()
+
         # Build tile lookup.
-        corners = [self._filename_to_tile_corner(p) for p in tile_paths]
+        corners = tile_corners
+        if corners is None:
+            corners = [self._filename_to_tile_corner(p) for p in tile_paths]
         if len(corners) > len(set(corners)):
             msg = "SRTM-type tile coords must be unique,"
             msg += " cannot be the same tile with different extensions."
             raise ConfigError(msg)
-        self._tile_lookup = dict(zip(corners, tile_paths))
+        self._build_tile_lookup(corners, tile_paths)
+
+    def _build_filename_transformer(self):
+        try:
+            self._filename_transformer = utils.latlon_transformer(
+                epsg=self.filename_epsg
+            )
+        except ValueError as e:
+            raise ConfigError(f"Invalid filename_epsg {self.filename_epsg}: {e}")
+
+    def __getstate__(self):
+        # The transformer is rebuilt rather than pickled.
+        state = self.__dict__.copy()
+        del state["_filename_transformer"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._build_filename_transformer()
+
+    def _build_tile_lookup(self, corners, tile_paths):
+        """Index tiles by integer grid position, for vectorised lookups.
+
+        A tile's grid position is its corner divided by the tile size, done
+        exactly in Decimal. Tiles whose corner isn't a multiple of the tile
+        size can never be found, so are left out.
+
+        Args:
+            corners: List of (northing, easting) Decimal tile corners.
+            tile_paths: List of paths, same length as corners.
+        """
+        rows, cols, paths = [], [], []
+        for (northing, easting), path in zip(corners, tile_paths):
+            row = northing / self.filename_tile_size
+            col = easting / self.filename_tile_size
+            if row == row.to_integral_value() and col == col.to_integral_value():
+                rows.append(int(row))
+                cols.append(int(col))
+                paths.append(path)
+
+        # Grid positions are packed into a sorted table of int64 keys.
+        self._tile_row_min = min(rows, default=0)
+        self._tile_col_min = min(cols, default=0)
+        self._tile_n_rows = max(rows, default=-1) - self._tile_row_min + 1
+        self._tile_n_cols = max(cols, default=-1) - self._tile_col_min + 1
+        keys = (np.array(rows, dtype=np.int64) - self._tile_row_min) * self._tile_n_cols
+        keys += np.array(cols, dtype=np.int64) - self._tile_col_min
+        order = np.argsort(keys)
+        self._tile_keys = keys[order]
+        self._tile_key_paths = np.array(paths, dtype=object)[order]
 
     @classmethod
     def _filename_to_tile_corner(cls, filename):
@@ -408,32 +795,32 @@ class TiledDataset(Dataset):
 
         return northing, easting
 
-    @classmethod
-    def _location_to_tile_corner(cls, xs, ys, tile_size=1):
-        """Convert locations to SRTM tile corner.
+    def _location_to_tile_index(self, xs, ys):
+        """Convert locations to integer tile grid positions.
 
-        For example, (-120.5, 40.1) becomes (-120, 40). The lower left corner
-        of the tile is used. Decimals are used to preserve precsion for
-        fractional tile sizes.
+        For example, with a tile size of 1, (-120.5, 40.1) is in row 40 and
+        column -121. Rounding matches utils.decimal_base_floor().
 
         Args:
-            xs, ys: Lists of x and y coordinates.
-            tile_size: Which value to round the tiles to. Int or Decimal.
+            xs, ys: Arrays of x and y coordinates.
 
         Returns:
-            tile_names: List of (Decimal, Decimal) northing, easting tuples.
+            rows, cols: Float arrays of grid positions, NaN for invalid
+                coordinates.
         """
+        tile_size = float(self.filename_tile_size)
+        with np.errstate(invalid="ignore"):
+            rows = np.floor(np.asarray(ys, dtype=float) / tile_size)
+            cols = np.floor(np.asarray(xs, dtype=float) / tile_size)
+        return rows, cols
 
-        northings = [utils.decimal_base_floor(y, tile_size) for y in ys]
-        eastings = [utils.decimal_base_floor(y, tile_size) for y in xs]
-
-        return list(zip(northings, eastings))
-
-    def location_paths(self, lats, lons):
+    def location_paths(self, lats, lons, locations=None):
         """File corresponding to each location.
 
         Args:
             lats, lons: Lists of locations.
+            locations: Optional utils.ProjectedLocations of lats/lons, to
+                reuse projected coordinates.
 
         Returns:
             List of filenames, same length as locations.
@@ -442,10 +829,259 @@ class TiledDataset(Dataset):
         lons = np.asarray(lons)
 
         # Convert to filename projection.
-        xs, ys = utils.reproject_latlons(lats, lons, epsg=self.filename_epsg)
+        if locations is None:
+            locations = utils.ProjectedLocations(lats, lons)
+        xs, ys = locations.project(self.filename_epsg, self._filename_transformer)
+
+        # Grid positions outside the tiles' extent (or NaN) have no tile.
+        rows, cols = self._location_to_tile_index(xs, ys)
+        rows -= self._tile_row_min
+        cols -= self._tile_col_min
+        with np.errstate(invalid="ignore"):
+            in_extent = (rows >= 0) & (rows < self._tile_n_rows)
+            in_extent &= (cols >= 0) & (cols < self._tile_n_cols)
+        point_indices = np.flatnonzero(in_extent)
 
         # Find corresponding tile.
-        filenames = self._location_to_tile_corner(xs, ys, self.filename_tile_size)
-        paths = [self._tile_lookup.get(f) for f in filenames]
+        keys = rows[point_indices].astype(np.int64) * self._tile_n_cols
+        keys += cols[point_indices].astype(np.int64)
+        key_indices = np.searchsorted(self._tile_keys, keys)
+        key_indices = key_indices.clip(max=len(self._tile_keys) - 1)
+        is_found = self._tile_keys[key_indices] == keys
+        paths = np.full(len(rows), None, dtype=object)
+        paths[point_indices[is_found]] = self._tile_key_paths[key_indices[is_found]]
+
+        return paths.tolist()
+
+
+class IndexedDataset(Dataset):
+    def __init__(
+        self,
+        name,
+        path,
+        tile_paths,
+        wgs84_bounds=None,
+        max_read_threads=None,
+        tile_cache=None,
+        read_metadata=None,
+        max_reprojection_error_px=None,
+    ):
+        """A dataset of files with any names, found by their footprints.
+
+        Each file's bounds are reprojected to WGS84 and put in a spatial index.
+        Index matches are then checked against the file's own bounds, so the
+        loose WGS84 boxes of neighbouring projected tiles don't overlap. Where
+        files do overlap, the first in sorted path order is used.
+
+        Args:
+            name: String used in request url and as datasets dictionary key.
+            path: Path to folder containing the files.
+            tile_paths: List of individual raster file paths in the dataset.
+            max_read_threads: How many tiles to read concurrently for a single request.
+            tile_cache: Optional tilecache.TileCache to read tiles through.
+            read_metadata: Optional replacement for _read_tile_metadata(),
+                like a lookup in a datasetindex.DatasetIndex.
+            max_reprojection_error_px: Optional maximum error, in pixels, for
+                locating points in files approximately.
+        """
+        self.name = name
+        self.path = path
+        self.tile_paths = sorted(tile_paths)
+
+        # Bounds.
+        if wgs84_bounds:
+            self.wgs84_bounds = wgs84_bounds
+
+        # Concurrency.
+        if max_read_threads:
+            self.max_read_threads = max_read_threads
+
+        # Local copies.
+        if tile_cache:
+            self.tile_cache = tile_cache
+
+        # Build spatial index.
+        read_metadata = read_metadata or self._read_tile_metadata
+        raster_infos = []
+        boxes = []
+        box_tiles = []
+        for i, tile_path in enumerate(self.tile_paths):
+            metadata = read_metadata(tile_path)
+            raster_infos.append(metadata["raster"])
+            for box in metadata["wgs84_boxes"]:
+                boxes.append(box)
+                box_tiles.append(i)
+        # Catalog rows are in the same order as tile_paths.
+        self.catalog = catalog.RasterCatalog(max_reprojection_error_px)
+        self.catalog.add_many(self.tile_paths, raster_infos)
+        self._box_tiles = np.array(box_tiles, dtype=int)
+        self._index = spatialindex.STRtree(boxes)
+
+    @classmethod
+    def _read_tile_metadata(cls, path):
+        """Footprint of a raster.
+
+        Returns:
+            Dict with the raster's georeferencing from
+                catalog.read_raster_info(), and the WGS84 boxes covering it.
+        """
+        try:
+            if arraystore.is_store(path):
+                raster_info = catalog.read_raster_info(arraystore.open_raster(path))
+            else:
+                with rasterio.open(path) as f:
+                    raster_info = catalog.read_raster_info(f)
+        except rasterio.RasterioIOError as e:
+            raise ConfigError(f"Unsupported filetype for '{path}': {e}")
+        if raster_info["crs"] is None:
+            raise ConfigError(f"Dataset file '{path}' has no crs.")
+        return {
+            "raster": raster_info,
+            "wgs84_boxes": cls._wgs84_boxes(raster_info["crs"], raster_info["bounds"]),
+        }
+
+    @classmethod
+    def _wgs84_boxes(cls, crs, bounds):
+        """Boxes in WGS84 covering a raster's bounds.
+
+        Returns:
+            List of [left, bottom, right, top] boxes, two if the raster
+                crosses the antimeridian.
+        """
+        if isinstance(crs, int):
+            crs = f"EPSG:{crs}"
+        try:
+            left, bottom, right, top = rasterio.warp.transform_bounds(
+                crs, f"EPSG:{utils.WGS84_LATLON_EPSG}", *bounds, densify_pts=21
+            )
+        except Exception as e:
+            raise ConfigError(f"Unable to transform bounds to WGS84: {e}")
+
+        # Reprojected edges can bulge between the densified points.
+        pad_x = (right - left) % 360 * utils.FOOTPRINT_PADDING_FRACTION
+        pad_y = (top - bottom) * utils.FOOTPRINT_PADDING_FRACTION
+        left, right = left - pad_x, right + pad_x
+        bottom, top = bottom - pad_y, top + pad_y
+        if left > right:
+            return [[left, bottom, 180, top], [-180, bottom, right, top]]
+        return [[left, bottom, right, top]]
+
+    def location_paths(self, lats, lons, locations=None):
+        """File corresponding to each location.
+
+        Args:
+            lats, lons: Lists of locations.
+            locations: Optional utils.ProjectedLocations of lats/lons, to
+                reuse projected coordinates.
+
+        Returns:
+            List of filenames, same length as locations, None if no file
+                covers the location.
+        """
+        if locations is None:
+            locations = utils.ProjectedLocations(lats, lons)
+        lats = locations.lats
+        lons = locations.lons
+        point_indices, box_indices = self._index.query_points(lons, lats)
+        tile_indices = self._box_tiles[box_indices]
+
+        # Check candidates tile by tile, in path order.
+        paths = np.full(len(lats), None, dtype=object)
+        is_found = np.zeros(len(lats), dtype=bool)
+        for i in np.unique(tile_indices):
+            candidates = point_indices[tile_indices == i]
+            candidates = np.unique(candidates[~is_found[candidates]])
+            if not len(candidates):
+                continue
+            crs_id = self.catalog.crs_ids[i]
+            xs, ys = locations.take(candidates).project(
+                self.catalog.crs_list[crs_id], self.catalog.transformers[crs_id]
+            )
+            left, bottom, right, top = self.catalog.bounds[i]
+            xs = np.asarray(xs)
+            ys = np.asarray(ys)
+            is_inside = (left <= xs) & (xs <= right) & (bottom <= ys) & (ys <= top)
+            paths[candidates[is_inside]] = self.tile_paths[i]
+            is_found[candidates[is_inside]] = True
+
+        return paths.tolist()
+
+
+class ArrayStoreDataset(Dataset):
+    def __init__(
+        self,
+        name,
+        path,
+        manifest,
+        wgs84_bounds=None,
+        max_read_threads=None,
+        max_reprojection_error_px=None,
+    ):
+        """A dataset compiled to memory-mapped stores by arraystore.
+
+        Locations are mapped to stores the same way as the source dataset.
+
+        Args:
+            name: String used in request url and as datasets dictionary key.
+            path: Path to the compiled dataset folder.
+            manifest: Dict from arraystore.read_manifest().
+            max_read_threads: How many stores to read concurrently for a single request.
+            max_reprojection_error_px: Optional maximum error, in pixels, for
+                locating points in stores approximately.
+        """
+        self.name = name
+        self.path = path
+        if manifest.get("version") != arraystore.STORE_VERSION:
+            msg = f"Compiled dataset '{path}' has an unsupported version,"
+            msg += " it should be compiled again."
+            raise ConfigError(msg)
 
-        return paths
+        # Bounds.
+        if wgs84_bounds:
+            self.wgs84_bounds = wgs84_bounds
+
+        # Concurrency.
+        if max_read_threads:
+            self.max_read_threads = max_read_threads
+
+        # Stores keep the source filenames, so can be looked up like the source.
+        store_paths = [os.path.join(path, p) for p in manifest["stores"]]
+        missing_paths = [p for p in store_paths if not os.path.isdir(p)]
+        if missing_paths:
+            raise ConfigError(f"Compiled store '{missing_paths[0]}' not found.")
+        if manifest["type"] == "indexed":
+            self._source = IndexedDataset(
+                name,
+                path,
+                tile_paths=store_paths,
+                max_reprojection_error_px=max_reprojection_error_px,
+            )
+        elif manifest["type"] == "tiled":
+            self._source = TiledDataset(
+                name,
+                path,
+                tile_paths=store_paths,
+                filename_epsg=manifest["filename_epsg"],
+                filename_tile_size=manifest["filename_tile_size"],
+                max_reprojection_error_px=max_reprojection_error_px,
+            )
+        else:
+            self._source = SingleFileDataset(
+                name,
+                tile_path=store_paths[0],
+                max_reprojection_error_px=max_reprojection_error_px,
+            )
+        self.catalog = self._source.catalog
+
+    def location_paths(self, lats, lons, locations=None):
+        """Store corresponding to each location.
+
+        Args:
+            lats, lons: Lists of locations.
+            locations: Optional utils.ProjectedLocations of lats/lons, to
+                reuse projected coordinates.
+
+        Returns:
+            List of store paths, same length as locations.
+        """
+        return self._source.location_paths(lats, lons, locations)
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+
+
+INDEX_VERSION = 2
+
+
+def _index_filename(dataset_path):
+    """Index filename for a dataset folder, unique to its absolute path."""
+    abs_path = os.path.abspath(dataset_path)
+    digest = hashlib.sha1(abs_path.encode()).hexdigest()[:16]
+    name = os.path.basename(abs_path.rstrip(os.sep)) or "root"
+    return f"{name}-{digest}.json"
+
+
+class DatasetIndex:
+    """The files in a dataset folder, and metadata about them.
+
+    Listing a folder of many thousands of tiles, and opening them to read
+    their metadata, makes startup slow. The results can be saved to an index
+    file and reused: a folder is only listed again if its mtime changed, and
+    a file only reopened if its mtime or size changed.
+
+    Without an index folder, everything is found from scratch.
+    """
+
+    def __init__(self, dataset_path, index_dir=None):
+        """Load the index for a dataset folder.
+
+        Args:
+            dataset_path: Folder containing the dataset.
+            index_dir: Optional folder to save index files to.
+        """
+        self.dataset_path = dataset_path
+        self.index_path = None
+        if index_dir:
+            self.index_path = os.path.join(index_dir, _index_filename(dataset_path))
+
+        # Saved listings and metadata, keyed by path relative to the dataset.
+        self._dirs = {}
+        self._files = {}
+        self._is_changed = False
+
+        # The full file list, and values computed from it, are kept until any
+        # folder changes.
+        self._file_list = None
+        self._derived = {}
+        if self.index_path:
+            self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        if index.get("version") != INDEX_VERSION:
+            return
+        self._dirs = index["dirs"]
+        self._files = index["files"]
+        self._file_list = index["file_list"]
+        self._derived = index["derived"]
+
+    def _list_dir(self, rel_path):
+        """Subfolder and file names in a folder, from the index if unchanged.
+
+        Hidden entries are skipped, like glob does.
+
+        Returns:
+            dir_names, file_names: Lists of names.
+            is_changed: Whether the folder had to be listed again.
+        """
+        path = os.path.join(self.dataset_path, rel_path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self._dirs.get(rel_path)
+        if entry is not None and entry[0] == mtime:
+            return entry[1], entry[2], False
+
+        dir_names, file_names = [], []
+        with os.scandir(path) as it:
+            for e in it:
+                if e.name.startswith("."):
+                    continue
+                if e.is_dir():
+                    dir_names.append(e.name)
+                elif e.is_file():
+                    file_names.append(e.name)
+        dir_names.sort()
+        file_names.sort()
+        self._dirs[rel_path] = [mtime, dir_names, file_names]
+        self._is_changed = True
+        return dir_names, file_names, True
+
+    def files(self):
+        """All files in the dataset folder, recursively.
+
+        Returns:
+            Sorted list of file paths, prefixed with the dataset path.
+        """
+        listings = []
+        is_listing_changed = False
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            dir_names, file_names, is_changed = self._list_dir(rel_dir)
+            is_listing_changed |= is_changed
+            listings.append((rel_dir, file_names))
+            stack.extend(os.path.join(rel_dir, n) for n in dir_names)
+        seen_dirs = set(rel_dir for rel_dir, _ in listings)
+
+        # Forget about folders that have gone.
+        for rel_dir in set(self._dirs) - seen_dirs:
+            del self._dirs[rel_dir]
+            is_listing_changed = True
+
+        if is_listing_changed or self._file_list is None:
+            self._file_list = sorted(
+                os.path.join(self.dataset_path, rel_dir, n)
+                for rel_dir, file_names in listings
+                for n in file_names
+            )
+            self._derived = {}
+            self._is_changed = True
+        return list(self._file_list)
+
+    def derived(self, key, compute):
+        """A value computed from the file list, reused until it changes.
+
+        Call files() first, to check for changes.
+
+        Args:
+            key: Name of the value.
+            compute: Function with no arguments, returning a
+                JSON-serialisable value.
+
+        Returns:
+            Result of compute().
+        """
+        if key not in self._derived:
+            self._derived[key] = compute()
+            self._is_changed = True
+        return self._derived[key]
+
+    def metadata(self, path, read_metadata):
+        """Metadata for a file, from the index if the file is unchanged.
+
+        Args:
+            path: File path, as returned by files().
+            read_metadata: Function of path, returning JSON-serialisable
+                metadata.
+
+        Returns:
+            Result of read_metadata(path).
+        """
+        rel_path = os.path.relpath(path, self.dataset_path)
+        stat = os.stat(path)
+        entry = self._files.get(rel_path)
+        if entry is not None and entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+            return entry[2]
+
+        metadata = read_metadata(path)
+        self._files[rel_path] = [stat.st_mtime_ns, stat.st_size, metadata]
+        self._is_changed = True
+        return metadata
+
+    def save(self, paths=None):
+        """Write the index, if anything changed.
+
+        Args:
+            paths: Optional list of file paths in use: metadata for other
+                files is dropped.
+        """
+        if paths is not None:
+            rel_paths = set(os.path.relpath(p, self.dataset_path) for p in paths)
+            for rel_path in set(self._files) - rel_paths:
+                del self._files[rel_path]
+                self._is_changed = True
+        if not self.index_path or not self._is_changed:
+            return
+
+        # Write atomically, as several processes may load the config at once.
+        index = {
+            "version": INDEX_VERSION,
+            "dirs": self._dirs,
+            "files": self._files,
+            "file_list": self._file_list,
+            "derived": self._derived,
+        }
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        self._is_changed = False
@@ -0,0 +1,117 @@
+import math
+import os
+import re
+
+import numpy as np
+import rasterio
+
+from opentopodata import utils
+
+
+# Raw SRTM tiles are big-endian int16 grids, covering one degree from the
+# lower-left corner in the filename (like N50W025.hgt). The edge rows and
+# columns overlap with the neighbouring tiles.
+HGT_DTYPE = np.dtype(">i2")
+HGT_NODATA = -32768
+HGT_EPSG = 4326
+FILENAME_REGEX = r"^([NS])(\d{1,2})([EW])(\d{1,3})\.hgt$"
+
+
+def is_hgt(path):
+    """Whether a path is an uncompressed SRTM .hgt tile.
+
+    Args:
+        path: Raster location.
+
+    Returns:
+        Boolean.
+    """
+    return bool(re.match(FILENAME_REGEX, os.path.basename(path), re.IGNORECASE))
+
+
+class HgtTile:
+    """A memory-mapped SRTM .hgt tile.
+
+    The tile's georeferencing comes from its filename and size, so it can be
+    sampled without GDAL: there's no header to parse, and pixels are read
+    straight from the page cache.
+
+    The tile has the attributes of a rasterio dataset that the backend uses,
+    with the same georeferencing GDAL gives .hgt files: pixels are centred on
+    the grid points.
+    """
+
+    def __init__(self, path, lat, lon, size):
+        """A .hgt tile.
+
+        Args:
+            path: Location of the .hgt file.
+            lat, lon: Integer lower-left corner of the tile.
+            size: Number of rows/columns in the tile.
+        """
+        self.name = path
+        self.z = np.memmap(path, dtype=HGT_DTYPE, mode="r", shape=(size, size))
+        self.height = size
+        self.width = size
+        self.block_shapes = [(1, size)]
+        self.nodata = HGT_NODATA
+        self.crs = rasterio.crs.CRS.from_epsg(HGT_EPSG)
+
+        res = 1 / (size - 1)
+        self.res = (res, res)
+        self.transform = rasterio.Affine(
+            res, 0, lon - res / 2, 0, -res, lat + 1 + res / 2
+        )
+        self.bounds = rasterio.coords.BoundingBox(
+            *rasterio.transform.array_bounds(size, size, self.transform)
+        )
+
+    def read_window(self, window):
+        """Read a window, like backend._read_window().
+
+        Args:
+            window: rasterio Window, within the tile.
+
+        Returns:
+            z: 2D float array of the window, with NODATA replaced by NaN.
+        """
+        z = self.z[
+            window.row_off : window.row_off + window.height,
+            window.col_off : window.col_off + window.width,
+        ].astype(float)
+        z[z == HGT_NODATA] = np.nan
+        return z
+
+
+def _open(path):
+    lat_sign, lat, lon_sign, lon = re.match(
+        FILENAME_REGEX, os.path.basename(path), re.IGNORECASE
+    ).groups()
+    lat = int(lat) * (1 if lat_sign.upper() == "N" else -1)
+    lon = int(lon) * (1 if lon_sign.upper() == "E" else -1)
+
+    # Size is implied by the file size.
+    n_pixels = os.path.getsize(path) // HGT_DTYPE.itemsize
+    size = math.isqrt(n_pixels)
+    if size < 2 or size * size * HGT_DTYPE.itemsize != os.path.getsize(path):
+        return None
+    return HgtTile(path, lat, lon, size)
+
+
+def open_tile(path):
+    """Open a .hgt tile, reusing an existing memory map if possible.
+
+    Maps are kept in utils.MAPPED_FILES, and a tile is remapped if its mtime
+    changes.
+
+    Args:
+        path: Location of the .hgt file.
+
+    Returns:
+        HgtTile, or None if the file isn't a valid .hgt tile.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return utils.MAPPED_FILES.get(path, mtime, lambda: _open(path))
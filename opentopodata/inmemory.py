@@ -0,0 +1,90 @@
+import threading
+
+import numpy as np
+import rasterio
+
+from opentopodata import arraystore, catalog
+
+
+# Loaded rasters, as {path: MemoryRaster}. Rasters loaded before uWSGI forks
+# the workers are shared copy-on-write: as they're never written to, the
+# pages stay shared.
+_RASTERS = {}
+_RASTERS_LOCK = threading.Lock()
+
+
+class MemoryRaster:
+    """A raster held in memory as a numpy array.
+
+    The raster has the attributes of a rasterio dataset that the backend uses.
+    """
+
+    def __init__(self, path, overview_level=None):
+        """Load a raster.
+
+        Args:
+            path: GDAL supported raster location.
+            overview_level: Optional index of an overview to load instead of
+                the full resolution raster.
+        """
+        kwargs = {} if overview_level is None else {"overview_level": overview_level}
+        with rasterio.open(path, **kwargs) as f:
+            self.z, self.nodata = arraystore.read_unmasked(f)
+            self.crs = f.crs
+            self.transform = f.transform
+            self.bounds = f.bounds
+            self.res = f.res
+
+        self.z.flags.writeable = False
+        self.name = path
+        self.overview_level = overview_level
+        self.height, self.width = self.z.shape
+        self.block_shapes = [(1, self.width)]
+
+        # Georeferencing for locating points, built once rather than on every
+        # request. An invalid crs is reported when the raster is sampled.
+        try:
+            self.info = catalog.RasterInfo.from_dict(catalog.read_raster_info(self))
+        except ValueError:
+            self.info = None
+
+    def read_window(self, window):
+        """Read a window, like backend._read_window().
+
+        Args:
+            window: rasterio Window, within the raster.
+
+        Returns:
+            z: 2D float array of the window, with NODATA replaced by NaN.
+        """
+        z = self.z[
+            window.row_off : window.row_off + window.height,
+            window.col_off : window.col_off + window.width,
+        ].astype(float)
+        if self.nodata is not None:
+            z[z == self.nodata] = np.nan
+        return z
+
+
+def load(path, overview_level=None):
+    """Load a raster into memory, or return the already loaded copy.
+
+    Args:
+        path: GDAL supported raster location.
+        overview_level: Optional index of an overview to load instead of the
+            full resolution raster.
+
+    Returns:
+        MemoryRaster.
+    """
+    raster = _RASTERS.get(path)
+    if raster is not None and raster.overview_level == overview_level:
+        return raster
+
+    # Only one thread loads each raster, as they can be big.
+    with _RASTERS_LOCK:
+        raster = _RASTERS.get(path)
+        if raster is None or raster.overview_level != overview_level:
+            raster = MemoryRaster(path, overview_level)
+            _RASTERS[path] = raster
+    return raster
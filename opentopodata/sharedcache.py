@@ -0,0 +1,326 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import threading
+
+import numpy as np
+
+
+# Identifies a cache file with this layout. Bump when changing the layout.
+MAGIC = 0x4F54444243000001
+
+HEADER_DTYPE = np.dtype(
+    [
+        ("magic", "<u8"),
+        ("n_sets", "<u8"),
+        ("data_size", "<u8"),
+        ("write_pos", "<u8"),
+        ("_reserved", "<u8", 4),
+    ]
+)
+
+# Index entries are protected by a sequence number which is odd while the
+# entry is being written.
+ENTRY_DTYPE = np.dtype(
+    [
+        ("seq", "<u8"),
+        ("key", "<u8"),
+        ("pos", "<u8"),
+        ("height", "<u4"),
+        ("width", "<u4"),
+    ]
+)
+
+# Each key can be stored in any of this many index entries.
+SET_SIZE = 4
+
+# The index is sized for blocks of about this size. Smaller blocks still
+# work, but are evicted from the index before the data is overwritten.
+EXPECTED_BLOCK_BYTES = 256 * 256 * 8
+
+# Blocks larger than this fraction of the data area aren't cached, as they
+# would evict too much.
+MAX_BLOCK_FRACTION = 1 / 8
+
+DTYPE = np.dtype("<f8")
+
+
+def _key(path, mtime, block):
+    """Stable 64-bit hash of a block, the same in every process."""
+    text = f"{path}\0{mtime}\0{block[0]}\0{block[1]}".encode("utf-8")
+    key = int.from_bytes(hashlib.blake2b(text, digest_size=8).digest(), "little")
+    return key or 1
+
+
+class SharedBlockCache:
+    """Cache of decoded raster blocks, shared by all processes on a host.
+
+    BlockCache is per process, so each uWSGI worker holds its own copy of
+    hot blocks. This cache instead lives in a memory-mapped file: put it on a
+    tmpfs like /dev/shm and blocks are held in memory once per host.
+
+    Block data is written to a ring buffer, so the oldest blocks are
+    overwritten first. A set-associative index maps a hash of
+    (path, mtime, block_row, block_col) to a position in the ring buffer.
+
+    Reads don't lock. Each index entry has a sequence number that's odd
+    while the entry is being written, and the header has the ring buffer's
+    write position, which is advanced before data is overwritten. A reader
+    checks both again after copying a block, and treats it as a miss if
+    either changed. Writers are serialised with a lock on the file.
+
+    The interface matches BlockCache. Like DatasetPool, file handles belong
+    to a single process, and are reopened after a fork.
+    """
+
+    def __init__(self, path=None, max_bytes=0):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._file = None
+        self._mmap = None
+        self._views = None
+        self.path = None
+        self.max_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.configure(path, max_bytes)
+
+    def configure(self, path, max_bytes):
+        """Set the cache file location and size.
+
+        Args:
+            path: Location of the cache file, or None to disable the cache.
+                Processes using the same file share the cache.
+            max_bytes: Integer size of the cache data area.
+        """
+        max_bytes = max(max_bytes, 0) if path else 0
+        with self._lock:
+            if (path, max_bytes) != (self.path, self.max_bytes):
+                self._close()
+                self.path = path
+                self.max_bytes = max_bytes
+
+    @property
+    def enabled(self):
+        return bool(self.path and self.max_bytes)
+
+    def stats(self):
+        """Counters for this process, and the shared cache size, as a dict."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "max_bytes": self.max_bytes,
+        }
+
+    def _close(self):
+        # Readers in other threads may still be using the mapping, so it's
+        # left to be closed when garbage collected.
+        self._views = None
+        if self._file is not None:
+            self._file.close()
+        self._mmap = None
+        self._file = None
+        self._pid = None
+
+    def _layout(self):
+        """Sizes of the file sections.
+
+        Returns:
+            Tuple of (n_sets, index_bytes, total_bytes).
+        """
+        n_sets = max(self.max_bytes // (EXPECTED_BLOCK_BYTES * SET_SIZE), 1)
+        index_bytes = n_sets * SET_SIZE * ENTRY_DTYPE.itemsize
+        total_bytes = HEADER_DTYPE.itemsize + index_bytes + self.max_bytes
+        return n_sets, index_bytes, total_bytes
+
+    def _open(self):
+        """Map the cache file, creating it if needed.
+
+        Returns:
+            Tuple of (header, index, data) numpy views of the file.
+        """
+        # Mappings survive a fork, but flock() locks are shared with the
+        # parent, so each process needs its own file handle.
+        if self._pid == os.getpid():
+            return self._views
+        self._views = None
+        self._mmap = None
+        self._file = None
+
+        n_sets, index_bytes, total_bytes = self._layout()
+        mm = None
+        while mm is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            f = os.fdopen(fd, "r+b")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    mm = self._map(f, n_sets, total_bytes)
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            finally:
+                if mm is None:
+                    f.close()
+
+        header = np.ndarray(1, HEADER_DTYPE, buffer=mm)
+        index = np.ndarray(
+            (n_sets, SET_SIZE), ENTRY_DTYPE, buffer=mm, offset=HEADER_DTYPE.itemsize
+        )
+        data = np.ndarray(
+            self.max_bytes,
+            np.uint8,
+            buffer=mm,
+            offset=HEADER_DTYPE.itemsize + index_bytes,
+        )
+        self._file = f
+        self._mmap = mm
+        self._views = (header, index, data)
+        self._pid = os.getpid()
+        return self._views
+
+    def _map(self, f, n_sets, total_bytes):
+        """Map an open and locked cache file, initialising it if it's new.
+
+        Returns:
+            mmap, or None if the file was replaced and should be reopened.
+        """
+        # Another process may have replaced the file before we locked it.
+        try:
+            if os.stat(self.path).st_ino != os.fstat(f.fileno()).st_ino:
+                return None
+        except FileNotFoundError:
+            return None
+
+        # Nobody else can have a new file mapped yet.
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            f.truncate(total_bytes)
+            mm = mmap.mmap(f.fileno(), total_bytes)
+            header = np.ndarray(1, HEADER_DTYPE, buffer=mm)
+            header["n_sets"] = n_sets
+            header["data_size"] = self.max_bytes
+            header["magic"] = MAGIC
+            return mm
+
+        if size == total_bytes:
+            mm = mmap.mmap(f.fileno(), total_bytes)
+            header = np.ndarray(1, HEADER_DTYPE, buffer=mm)[0].copy()
+            layout = (header["magic"], header["n_sets"], header["data_size"])
+            if layout == (MAGIC, n_sets, self.max_bytes):
+                return mm
+            mm.close()
+
+        # A cache with a different layout. Other processes may still have it
+        # mapped, so rather than resizing it in place, replace it with a new
+        # empty file.
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        open(tmp_path, "wb").close()
+        os.replace(tmp_path, self.path)
+        return None
+
+    def _get(self, header, index, data, key):
+        """Copy a block out of the cache, or None if missing."""
+        data_size = len(data)
+        entries = index[key % len(index)]
+        for i in range(SET_SIZE):
+            entry = entries[i].copy()
+            if entry["key"] != key or entry["seq"] % 2:
+                continue
+            pos = int(entry["pos"])
+            nbytes = int(entry["height"]) * int(entry["width"]) * DTYPE.itemsize
+            if int(header[0]["write_pos"]) > pos + data_size:
+                return None
+
+            offset = pos % data_size
+            z = data[offset : offset + nbytes].view(DTYPE).copy()
+
+            # Check nothing was overwritten while copying.
+            if entries[i]["seq"] != entry["seq"]:
+                return None
+            if int(header[0]["write_pos"]) > pos + data_size:
+                return None
+            return z.reshape(int(entry["height"]), int(entry["width"]))
+        return None
+
+    def get_many(self, path, mtime, blocks):
+        """Look up cached blocks.
+
+        Args:
+            path: Raster location.
+            mtime: Modification time of the file.
+            blocks: List of (block_row, block_col) tuples.
+
+        Returns:
+            Dict of {(block_row, block_col): array} of the cached blocks.
+        """
+        if not self.enabled:
+            return {}
+        with self._lock:
+            header, index, data = self._open()
+        found = {}
+        for block in blocks:
+            z = self._get(header, index, data, _key(path, mtime, block))
+            if z is not None:
+                found[block] = z
+        self.hits += len(found)
+        self.misses += len(blocks) - len(found)
+        return found
+
+    def put_many(self, path, mtime, z_blocks):
+        """Add blocks to the cache.
+
+        Args:
+            path: Raster location.
+            mtime: Modification time of the file.
+            z_blocks: Dict of {(block_row, block_col): 2D float array}.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            header, index, data = self._open()
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+            try:
+                for block, z in z_blocks.items():
+                    self._put(header, index, data, _key(path, mtime, block), z)
+            finally:
+                fcntl.flock(self._file, fcntl.LOCK_UN)
+
+    def _put(self, header, index, data, key, z):
+        """Write a block. Must hold the file lock."""
+        data_size = len(data)
+        nbytes = z.size * DTYPE.itemsize
+        if not nbytes or nbytes > data_size * MAX_BLOCK_FRACTION:
+            return
+
+        # Blocks don't wrap around the end of the ring buffer.
+        write_pos = int(header[0]["write_pos"])
+        pos = write_pos
+        if pos % data_size + nbytes > data_size:
+            pos = (pos // data_size + 1) * data_size
+
+        # Readers of the data we're about to overwrite will see that the
+        # write position has passed it.
+        header["write_pos"] = pos + nbytes
+        offset = pos % data_size
+        data[offset : offset + nbytes] = (
+            np.ascontiguousarray(z, DTYPE).view(np.uint8).ravel()
+        )
+
+        # Replace the same key, or else the oldest entry in the set.
+        entries = index[key % len(index)]
+        matches = np.flatnonzero(entries["key"] == key)
+        i = matches[0] if len(matches) else np.argmin(entries["pos"])
+
+        # Only count evictions of entries whose data was still readable.
+        replaced_key = int(entries["key"][i])
+        replaced_pos = int(entries["pos"][i])
+        if replaced_key not in (0, key) and write_pos <= replaced_pos + data_size:
+            self.evictions += 1
+        entries["seq"][i] += 1
+        entries["key"][i] = key
+        entries["pos"][i] = pos
+        entries["height"][i], entries["width"][i] = z.shape
+        entries["seq"][i] += 1
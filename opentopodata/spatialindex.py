@@ -0,0 +1,100 @@
+import numpy as np
+
+
+# Children per tree node. Small nodes prune more boxes per level, large nodes
+# mean fewer levels to step through.
+NODE_CAPACITY = 16
+
+
+class STRtree:
+    """A static R-tree of boxes, bulk loaded with Sort-Tile-Recursive.
+
+    The tree is stored as one array of boxes per level, so it pickles
+    cheaply, and is queried for many points at once with vectorised numpy.
+    Node i of a level covers nodes [i * node_capacity, (i + 1) *
+    node_capacity) of the level below.
+    """
+
+    def __init__(self, boxes, node_capacity=NODE_CAPACITY):
+        """Build a tree.
+
+        Args:
+            boxes: Array of (left, bottom, right, top) rows.
+            node_capacity: Children per node.
+        """
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self.node_capacity = node_capacity
+
+        # Sort-Tile-Recursive: sort by x into vertical slices, then each slice
+        # by y, so neighbouring leaves are spatially close.
+        n = len(boxes)
+        n_leaves = -(-n // node_capacity)
+        slice_size = node_capacity * max(1, int(np.ceil(np.sqrt(n_leaves))))
+        xs = (boxes[:, 0] + boxes[:, 2]) / 2
+        ys = (boxes[:, 1] + boxes[:, 3]) / 2
+        order = np.argsort(xs, kind="stable")
+        slice_ids = np.empty(n, dtype=int)
+        slice_ids[order] = np.arange(n) // slice_size
+        order = np.lexsort((ys, slice_ids))
+
+        # Box index of each leaf entry.
+        self.order = order
+        self.levels = [boxes[order]]
+        while len(self.levels[-1]) > node_capacity:
+            self.levels.append(self._parent_boxes(self.levels[-1]))
+
+    def _parent_boxes(self, boxes):
+        starts = np.arange(0, len(boxes), self.node_capacity)
+        return np.column_stack(
+            [
+                np.minimum.reduceat(boxes[:, 0], starts),
+                np.minimum.reduceat(boxes[:, 1], starts),
+                np.maximum.reduceat(boxes[:, 2], starts),
+                np.maximum.reduceat(boxes[:, 3], starts),
+            ]
+        )
+
+    def query_points(self, xs, ys):
+        """Find the boxes containing each point.
+
+        Box edges are inclusive.
+
+        Args:
+            xs, ys: Arrays of point coordinates.
+
+        Returns:
+            point_indices, box_indices: Arrays of every (point, box) match,
+                sorted by point then box.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+
+        # Start with every point against every top-level node.
+        n_top = len(self.levels[-1])
+        point_indices = np.repeat(np.arange(len(xs)), n_top)
+        node_indices = np.tile(np.arange(n_top), len(xs))
+
+        for i_level in range(len(self.levels) - 1, -1, -1):
+            boxes = self.levels[i_level][node_indices]
+            px = xs[point_indices]
+            py = ys[point_indices]
+            is_inside = (boxes[:, 0] <= px) & (px <= boxes[:, 2])
+            is_inside &= (boxes[:, 1] <= py) & (py <= boxes[:, 3])
+            point_indices = point_indices[is_inside]
+            node_indices = node_indices[is_inside]
+            if i_level == 0:
+                break
+
+            # Expand matching nodes into their children.
+            n_children_level = len(self.levels[i_level - 1])
+            starts = node_indices * self.node_capacity
+            counts = np.minimum(n_children_level - starts, self.node_capacity)
+            point_indices = np.repeat(point_indices, counts)
+            offsets = np.arange(counts.sum()) - np.repeat(
+                np.cumsum(counts) - counts, counts
+            )
+            node_indices = np.repeat(starts, counts) + offsets
+
+        box_indices = self.order[node_indices]
+        sort = np.lexsort((box_indices, point_indices))
+        return point_indices[sort], box_indices[sort]
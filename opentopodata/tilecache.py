@@ -0,0 +1,264 @@
+import hashlib
+import math
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+
+# Partially written files live here until they're complete.
+TMP_DIRNAME = ".tmp"
+
+# Partial files older than this must be left over from a crashed process.
+STALE_TMP_AGE_S = 60 * 60
+
+# Recency is tracked with file mtimes. To avoid a write for every read, the
+# mtime is only updated this often.
+TOUCH_INTERVAL_S = 60
+
+COPY_BUFFER_BYTES = 1024 * 1024
+
+# Listing the cache directory to find its size is slow for large caches, so
+# each process tracks the size from its last scan plus the tiles it fetched
+# since. The directory is only scanned again once that passes max_bytes, or
+# after this long, as other processes add tiles too.
+SCAN_INTERVAL_S = 60
+
+
+class TileCache:
+    """Local disk copies of tiles from slow storage.
+
+    Reading tiles from a network mount can be slow enough to become the
+    bottleneck. Instead, each tile is copied to a local directory the first
+    time it's used, and all reads go to the local copy. The cache directory
+    can be shared between processes.
+
+    Files are written to a temporary file then atomically renamed into place,
+    so a crash never leaves a partial tile in the cache. When the cache grows
+    past max_bytes, the least recently used tiles are deleted. Another
+    process can delete a tile just after it's been returned by local_path(),
+    so callers should call local_path() again if the file has gone.
+
+    Source tiles aren't checked for updates: when a tile is replaced, its
+    copy must be dropped with discard().
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        """A tile cache in a local directory.
+
+        Args:
+            cache_dir: Local directory to store tiles in. Created if missing.
+            max_bytes: Max total size of cached tiles.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._last_touched = {}
+        self._n_bytes = None
+        self._scanned_at = -math.inf
+
+    def local_path(self, path):
+        """Local copy of a tile, fetching it if needed.
+
+        Args:
+            path: Source path of the tile.
+
+        Returns:
+            Path to the local copy.
+        """
+        local_path = self._local_path(path)
+        now = time.time()
+
+        if os.path.exists(local_path):
+            if now - self._last_touched.get(local_path, 0) > TOUCH_INTERVAL_S:
+                try:
+                    os.utime(local_path)
+                except FileNotFoundError:
+                    pass
+                self._last_touched[local_path] = now
+            return local_path
+
+        self._fetch(path, local_path)
+        self._last_touched[local_path] = now
+        if self._n_bytes is not None:
+            self._n_bytes += os.path.getsize(local_path)
+        if (
+            self._n_bytes is None
+            or self._n_bytes > self.max_bytes
+            or now - self._scanned_at > SCAN_INTERVAL_S
+        ):
+            self.evict(keep=local_path)
+        return local_path
+
+    def cached_path(self, path):
+        """Where reads of a tile go, without fetching it.
+
+        Args:
+            path: Source path of the tile.
+
+        Returns:
+            Path to the local copy, which may not exist yet.
+        """
+        return self._local_path(path)
+
+    def discard(self, path):
+        """Delete the local copy of a tile, so it's fetched again on next use.
+
+        Args:
+            path: Source path of the tile.
+        """
+        local_path = self._local_path(path)
+        try:
+            os.remove(local_path)
+        except OSError:
+            pass
+        self._last_touched.pop(local_path, None)
+
+    def _local_path(self, path):
+        # Keep the original filename, as some formats (like .hgt) take their
+        # georeferencing from it. The hash avoids collisions between tiles
+        # with the same filename.
+        key = hashlib.sha1(path.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, key, self._local_filename(path))
+
+    def _local_filename(self, path):
+        return os.path.basename(path)
+
+    def _open_source(self, path):
+        """Open the contents of a tile to be cached, as a binary file."""
+        return open(path, "rb")
+
+    def _fetch(self, path, local_path):
+        """Copy a tile into the cache, atomically."""
+        tmp_dir = os.path.join(self.cache_dir, TMP_DIRNAME)
+        os.makedirs(tmp_dir, exist_ok=True)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f_dst:
+                with self._open_source(path) as f_src:
+                    shutil.copyfileobj(f_src, f_dst, COPY_BUFFER_BYTES)
+                f_dst.flush()
+                os.fsync(f_dst.fileno())
+            try:
+                os.replace(tmp_path, local_path)
+            except FileNotFoundError:
+                # The tile's folder was removed by another process.
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                os.replace(tmp_path, local_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def size(self):
+        """Total size in bytes of cached tiles."""
+        return sum(size for _, size, _ in self._scan())
+
+    def _scan(self):
+        """List cached tiles, and clean up stale partial files.
+
+        Returns:
+            List of (mtime, size, path) tuples.
+        """
+        tmp_dir = os.path.join(self.cache_dir, TMP_DIRNAME)
+        now = time.time()
+        entries = []
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    if dirpath == tmp_dir:
+                        if now - stat.st_mtime > STALE_TMP_AGE_S:
+                            os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self, keep=None):
+        """Delete least recently used tiles until the cache fits in max_bytes.
+
+        Tile folders are left in place, as other processes may be about to
+        move a tile into them.
+
+        Args:
+            keep: Path of a tile that shouldn't be deleted.
+        """
+        entries = sorted(self._scan())
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._last_touched.pop(path, None)
+            total_bytes -= size
+        self._n_bytes = total_bytes
+        self._scanned_at = time.time()
+
+
+class UnzipCache(TileCache):
+    """Local decompressed copies of zipped tiles.
+
+    GDAL can read zipped tiles (like SRTM .hgt.zip files) in place, but has
+    to decompress them again every time they're opened. Instead, each zipped
+    tile is expanded into a local directory the first time it's used, and
+    reads go to the expanded copy. Files that aren't zipped are read in place.
+
+    Expansion and eviction work the same as TileCache.
+    """
+
+    def local_path(self, path):
+        """Local expanded copy of a zipped tile, expanding it if needed.
+
+        Args:
+            path: Source path of the tile.
+
+        Returns:
+            Path to the expanded copy, or the source path if it's not a zip.
+        """
+        if not path.lower().endswith(".zip"):
+            return path
+        return super().local_path(path)
+
+    def cached_path(self, path):
+        """Where reads of a tile go, without expanding it.
+
+        Args:
+            path: Source path of the tile.
+
+        Returns:
+            Path to the expanded copy, which may not exist yet, or the source
+                path if it's not a zip.
+        """
+        if not path.lower().endswith(".zip"):
+            return path
+        return super().cached_path(path)
+
+    def _local_filename(self, path):
+        # N00E011.hgt.zip expands to N00E011.hgt.
+        return os.path.basename(path)[: -len(".zip")]
+
+    def _open_source(self, path):
+        """Open the raster inside a zip file."""
+        with zipfile.ZipFile(path) as z:
+            members = [m for m in z.infolist() if not m.is_dir()]
+            name = self._local_filename(path)
+            matching = [m for m in members if os.path.basename(m.filename) == name]
+            if matching:
+                member = matching[0]
+            elif len(members) == 1:
+                member = members[0]
+            else:
+                raise ValueError(f"Can't tell which file in '{path}' is the tile.")
+            return z.open(member)
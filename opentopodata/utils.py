@@ -1,5 +1,8 @@
+import collections
 from decimal import Decimal
 import math
+import resource
+import threading
 
 from geographiclib.geodesic import Geodesic
 import numpy as np
@@ -8,19 +11,35 @@ import pyproj
 
 WGS84_LATLON_EPSG = 4326
 
+# WGS84 boxes reprojected from a raster's bounds, like IndexedDataset
+# footprints and approxgrid.ApproxGrid extents, are grown by this fraction of
+# their size, as reprojected edges can bulge between the points used to find
+# them.
+FOOTPRINT_PADDING_FRACTION = 0.01
+
+# Caches that keep files open between requests, like pooled rasterio datasets
+# and memory maps, share this fraction of the process's file descriptor limit.
+MAX_CACHED_FD_FRACTION = 0.25
+
 # There's significant overhead in pyproj when building a Transformer object.
 # Without a cache a Transformer can be built many times per request, even for
-# the same CRS.
+# the same CRS. Datasets hold on to their own transformers, so this only needs
+# to cover the handful of projections in use.
+MAX_CACHED_TRANSFORMERS = 64
 _TRANSFORMER_CACHE = {}
+_TRANSFORMER_CACHE_LOCK = threading.Lock()
 
 
-def reproject_latlons(lats, lons, epsg=None, wkt=None):
-    """Convert WGS84 latlons to another projection.
+def latlon_transformer(epsg=None, wkt=None):
+    """Transformer from WGS84 latlons to another projection.
 
     Args:
-        lats, lons: Lists/arrays of latitude/longitude numbers.
         epsg: Integer EPSG code.
+        wkt: WKT string, instead of epsg.
 
+    Returns:
+        pyproj Transformer, or None if the projection is WGS84 latlons
+            already.
     """
     if epsg is None and wkt is None:
         raise ValueError("Must provide either epsg or wkt.")
@@ -29,7 +48,7 @@ def reproject_latlons(lats, lons, epsg=None, wkt=None):
         raise ValueError("Must provide only one of epsg or wkt.")
 
     if epsg == WGS84_LATLON_EPSG:
-        return lons, lats
+        return None
 
     # Validate EPSG.
     if epsg is not None and (not 1024 <= epsg <= 32767):
@@ -37,19 +56,267 @@ def reproject_latlons(lats, lons, epsg=None, wkt=None):
 
     # Load transformer.
     to_crs = wkt or f"EPSG:{epsg}"
-    if to_crs in _TRANSFORMER_CACHE:
-        transformer = _TRANSFORMER_CACHE[to_crs]
-    else:
+    with _TRANSFORMER_CACHE_LOCK:
+        transformer = _TRANSFORMER_CACHE.get(to_crs)
+    if transformer is None:
         from_crs = f"EPSG:{WGS84_LATLON_EPSG}"
         transformer = pyproj.transformer.Transformer.from_crs(
             from_crs, to_crs, always_xy=True
         )
-        _TRANSFORMER_CACHE[to_crs] = transformer
+        with _TRANSFORMER_CACHE_LOCK:
+            while (
+                _TRANSFORMER_CACHE
+                and len(_TRANSFORMER_CACHE) >= MAX_CACHED_TRANSFORMERS
+            ):
+                del _TRANSFORMER_CACHE[next(iter(_TRANSFORMER_CACHE))]
+            _TRANSFORMER_CACHE[to_crs] = transformer
+    return transformer
+
+
+def transform_latlons(lats, lons, transformer):
+    """Convert WGS84 latlons with a transformer from latlon_transformer().
+
+    Args:
+        lats, lons: Lists/arrays of latitude/longitude numbers.
+        transformer: pyproj Transformer, or None to leave latlons as they are.
+
+    Returns:
+        x, y: Projected coordinates.
+    """
+    if transformer is None:
+        return lons, lats
+    return transformer.transform(lons, lats)
+
+
+def reproject_latlons(lats, lons, epsg=None, wkt=None):
+    """Convert WGS84 latlons to another projection.
+
+    Args:
+        lats, lons: Lists/arrays of latitude/longitude numbers.
+        epsg: Integer EPSG code.
+
+    """
+    transformer = latlon_transformer(epsg=epsg, wkt=wkt)
+    return transform_latlons(lats, lons, transformer)
+
+
+class ProjectedLocations:
+    """Latlons in a request, and their coordinates in each projection.
+
+    Tiles, datasets and MultiDataset children usually share a projection, so
+    each location is converted at most once per projection: subsets made with
+    take() share the converted coordinates of the full set.
+    """
+
+    def __init__(self, lats, lons):
+        """
+        Args:
+            lats, lons: Arrays of latitude/longitude numbers.
+        """
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self._indices = np.arange(len(self.lats))
+        self._all_lats = self.lats
+        self._all_lons = self.lons
+        self._projected = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.lats)
+
+    def take(self, indices):
+        """A subset of the locations, sharing converted coordinates.
+
+        Args:
+            indices: Integer array of positions in these locations.
+
+        Returns:
+            ProjectedLocations.
+        """
+        subset = ProjectedLocations.__new__(ProjectedLocations)
+        subset.__dict__.update(self.__dict__)
+        subset.lats = self.lats[indices]
+        subset.lons = self.lons[indices]
+        subset._indices = self._indices[indices]
+        return subset
+
+    def project(self, crs, transformer):
+        """Coordinates of the locations in a projection.
+
+        Args:
+            crs: Hashable key of the projection, like an EPSG code or WKT
+                string. The same crs must always be passed with the same
+                transformer.
+            transformer: From latlon_transformer(), or None for latlons.
+
+        Returns:
+            x, y: Arrays of projected coordinates.
+        """
+        if transformer is None:
+            return self.lons, self.lats
+
+        with self._lock:
+            if crs not in self._projected:
+                n = len(self._all_lats)
+                self._projected[crs] = (
+                    np.full(n, np.nan),
+                    np.full(n, np.nan),
+                    np.zeros(n, dtype=bool),
+                )
+            xs, ys, is_done = self._projected[crs]
+
+        # Concurrent callers may convert the same locations, but will write
+        # the same values.
+        missing = self._indices[~is_done[self._indices]]
+        if len(missing):
+            xs[missing], ys[missing] = transformer.transform(
+                self._all_lons[missing], self._all_lats[missing]
+            )
+            is_done[missing] = True
+        return xs[self._indices], ys[self._indices]
+
+
+def cached_fd_budget():
+    """How many file descriptors the caches of open files can hold in total.
+
+    Returns:
+        Integer, or None if the process has no file descriptor limit.
+    """
+    fd_limit, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if fd_limit == resource.RLIM_INFINITY:
+        return None
+    return int(fd_limit * MAX_CACHED_FD_FRACTION)
+
+
+class MtimeLRU:
+    """LRU cache of opened files, reopened when the file's mtime changes.
+
+    Each entry has a cost, like the number of file descriptors it holds, and
+    the least recently used entries are dropped once the total is over
+    max_cost. A replaced entry is dropped straight away, as a deleted file's
+    disk space isn't freed while it's open.
+    """
+
+    def __init__(self, max_cost=None):
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._cost = 0
+        self.max_cost = max_cost
+
+    def __len__(self):
+        return len(self._entries)
+
+    def resize(self, max_cost):
+        """Set the max total cost, dropping entries over it.
+
+        Args:
+            max_cost: Number, or None for no limit.
+        """
+        with self._lock:
+            self.max_cost = max_cost
+            self._evict()
+
+    def get(self, key, mtime, open_file, cost=1):
+        """Get an open file, opening it if it isn't cached.
+
+        Args:
+            key: Hashable key, like the file's path.
+            mtime: Modification time the cached entry must match.
+            open_file: Function with no arguments that opens the file.
+            cost: Cost of the entry if it's opened.
+
+        Returns:
+            The cached or newly opened value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._entries.move_to_end(key)
+                return entry[1]
+
+        value = open_file()
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (mtime, value, cost)
+            self._cost += cost
+            self._evict()
+        return value
+
+    def discard(self, keys):
+        """Drop the entries of files that have been replaced or removed.
+
+        Args:
+            keys: Iterable of keys.
+        """
+        with self._lock:
+            for key in keys:
+                self._pop(key)
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._cost -= entry[2]
+
+    def _evict(self):
+        if self.max_cost is None:
+            return
+        while self._entries and self._cost > self.max_cost:
+            _, (_, _, cost) = self._entries.popitem(last=False)
+            self._cost -= cost
+
+
+# Memory maps of .hgt tiles and compiled store chunks. Maps are cheap to keep
+# open, as the OS manages the memory, but each holds a file descriptor. The
+# max number of maps is set by backend.resize_open_file_caches().
+MAPPED_FILES = MtimeLRU()
+
+
+def window_tiles(window, tile_shape):
+    """The (tile_row, tile_col) of every tile in a grid that a window touches.
+
+    Args:
+        window: rasterio Window.
+        tile_shape: Tuple of (tile_height, tile_width) pixels, like raster
+            blocks.
+
+    Returns:
+        List of (tile_row, tile_col) tuples.
+    """
+    tile_height, tile_width = tile_shape
+    row_stop = window.row_off + window.height
+    col_stop = window.col_off + window.width
+    tile_rows = range(window.row_off // tile_height, (row_stop - 1) // tile_height + 1)
+    tile_cols = range(window.col_off // tile_width, (col_stop - 1) // tile_width + 1)
+    return [(r, c) for r in tile_rows for c in tile_cols]
 
-    # Do the transform.
-    x, y = transformer.transform(lons, lats)
 
-    return x, y
+def assemble_window(window, tile_shape, get_tile):
+    """Copy a window together from the tiles of a grid.
+
+    Args:
+        window: rasterio Window.
+        tile_shape: Tuple of (tile_height, tile_width) pixels. Tiles on the
+            raster's edges can be smaller.
+        get_tile: Function taking (tile_row, tile_col) and returning the
+            tile's 2D array.
+
+    Returns:
+        2D float array of the window.
+    """
+    tile_height, tile_width = tile_shape
+    z = np.empty((window.height, window.width))
+    for tile_row, tile_col in window_tiles(window, tile_shape):
+        z_tile = get_tile((tile_row, tile_col))
+
+        # Overlap of tile and window, relative to the window.
+        row_off = tile_row * tile_height - window.row_off
+        col_off = tile_col * tile_width - window.col_off
+        r0, r1 = max(row_off, 0), min(row_off + z_tile.shape[0], window.height)
+        c0, c1 = max(col_off, 0), min(col_off + z_tile.shape[1], window.width)
+        z[r0:r1, c0:c1] = z_tile[
+            r0 - row_off : r1 - row_off, c0 - col_off : c1 - col_off
+        ]
+    return z
 
 
 def base_floor(x, base=1):
@@ -99,6 +366,25 @@ def fill_na(a, value):
     return [value if safe_is_nan(x) else x for x in a]
 
 
+def group_indices(keys):
+    """Group array positions by key.
+
+    Args:
+        keys: 1D array of sortable keys.
+
+    Returns:
+        unique_keys: Sorted array of distinct keys.
+        groups: List of integer index arrays, one for each unique key, in
+            ascending order.
+    """
+    keys = np.asarray(keys)
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    order = np.argsort(inverse, kind="stable")
+    split_at = np.flatnonzero(np.diff(inverse[order])) + 1
+    groups = np.split(order, split_at) if len(keys) else []
+    return unique_keys, groups
+
+
 def sample_points_on_path(path_lats, path_lons, n_samples):
     """Find points along a path.
 
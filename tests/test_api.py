@@ -1,17 +1,20 @@
+import fcntl
 import math
+import threading
 
 import pytest
 import rasterio
 from unittest.mock import patch
 import numpy as np
 from flask import request
+from flask_caching.backends import SimpleCache
 
 from opentopodata import api
 from opentopodata import backend
 
 
 GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
-INTERPOLATION_METHODS = ["nearest", "bilinear", "cubic"]
+INTERPOLATION_METHODS = ["nearest", "bilinear", "cubic", "cubic_spline", "lanczos"]
 DEFAULT_INTERPOLATION_METHOD = "bilinear"
 TEST_CONFIG_PATH = "tests/data/configs/test-config.yaml"
 INVALID_CONFIG_PATH = "tests/data/configs/no-datasets.yaml"
@@ -26,6 +29,16 @@ def patch_config():
         yield
 
 
+# Stand in for memcache, shared by the "workers" and the dataset watcher.
+@pytest.fixture
+def shared_cache():
+    with patch.dict(api.app.extensions["cache"], {api.cache: SimpleCache()}):
+        with patch.dict("os.environ", {"DISABLE_MEMCACHE": ""}):
+            api._SIMPLE_CACHE.clear()
+            yield
+            api._SIMPLE_CACHE.clear()
+
+
 class TestCORS:
     def test_default_cors(self):
         test_api = api.app.test_client()
@@ -251,6 +264,169 @@ class TestGetDatasets:
                 api._get_datasets(f",  ,, , , ")
 
 
+class TestLoadDataset:
+    def test_built_once(self, patch_config):
+        api._SIMPLE_CACHE.pop("datasets", None)
+        with patch.dict("os.environ", {"DISABLE_MEMCACHE": ""}):
+            with patch(
+                "opentopodata.config.load_dataset", wraps=api.config.load_dataset
+            ) as load_dataset:
+                dataset = api._load_dataset(ETOPO1_DATASET_NAME)
+                assert api._load_dataset(ETOPO1_DATASET_NAME) is dataset
+        assert load_dataset.call_count == 1
+        api._SIMPLE_CACHE.pop("datasets", None)
+        api._SIMPLE_CACHE.pop("generation_checked_at", None)
+
+    def test_only_requested_datasets_built(self, patch_config):
+        with patch(
+            "opentopodata.config.load_dataset", wraps=api.config.load_dataset
+        ) as load_dataset:
+            with api.app.test_request_context():
+                api._get_datasets("multi_eudem_etopo1")
+        names = [c.args[0] for c in load_dataset.call_args_list]
+        assert names == ["multi_eudem_etopo1", "nodata", "eudemsubset", "etopo1deg"]
+
+    def test_datasets_endpoint_builds_nothing(self, patch_config):
+        with patch("opentopodata.config.load_dataset") as load_dataset:
+            response = api.app.test_client().get("/datasets")
+        assert response.status_code == 200
+        assert len(response.json["results"]) == 7
+        assert not load_dataset.called
+
+    def test_preload(self, patch_config):
+        with patch(
+            "opentopodata.config.load_dataset", wraps=api.config.load_dataset
+        ) as load_dataset:
+            api._preload_datasets()
+        assert load_dataset.call_count == 7
+
+    def test_preload_error_ignored(self, patch_config):
+        with patch(
+            "opentopodata.config.load_dataset", side_effect=api.config.ConfigError
+        ):
+            api._preload_datasets()
+
+
+class TestPublishDataset:
+    def test_workers_switch_to_new_version(self, patch_config, shared_cache):
+        old_dataset = api._load_dataset(ETOPO1_DATASET_NAME)
+        with backend.DATASET_POOL.open(GEOTIFF_PATH) as f:
+            pass
+
+        version = api.publish_dataset(ETOPO1_DATASET_NAME, [GEOTIFF_PATH])
+        assert version != api.INITIAL_VERSION
+
+        # Workers only look for new versions every so often.
+        assert api._load_dataset(ETOPO1_DATASET_NAME) is old_dataset
+        api._SIMPLE_CACHE.pop("generation_checked_at")
+        new_dataset = api._load_dataset(ETOPO1_DATASET_NAME)
+        assert new_dataset is not old_dataset
+        assert api._load_dataset(ETOPO1_DATASET_NAME) is new_dataset
+        assert f.closed
+
+    def test_workers_switch_after_memcache_restart(self, patch_config, shared_cache):
+        api.publish_dataset(ETOPO1_DATASET_NAME, [GEOTIFF_PATH])
+        old_dataset = api._load_dataset(ETOPO1_DATASET_NAME)
+
+        api.cache.clear()
+        api._SIMPLE_CACHE.pop("generation_checked_at")
+        assert api._load_dataset(ETOPO1_DATASET_NAME) is not old_dataset
+
+    def test_other_datasets_kept(self, patch_config, shared_cache):
+        dataset = api._load_dataset("srtm90subset")
+        api.publish_dataset(ETOPO1_DATASET_NAME, [GEOTIFF_PATH])
+        api._SIMPLE_CACHE.pop("generation_checked_at")
+        assert api._load_dataset("srtm90subset") is dataset
+
+    def test_publishers_take_turns(self, patch_config, shared_cache, tmp_path):
+        lock_path = str(tmp_path / "publish.lock")
+        with patch("opentopodata.api.PUBLISH_LOCK_PATH", lock_path):
+            with open(lock_path, "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                thread = threading.Thread(
+                    target=api.publish_dataset,
+                    args=(ETOPO1_DATASET_NAME, [GEOTIFF_PATH]),
+                )
+                thread.start()
+                thread.join(0.5)
+                assert thread.is_alive()
+                assert not api.cache.get(api.GENERATION_KEY)
+                fcntl.flock(f, fcntl.LOCK_UN)
+            thread.join()
+        assert api.cache.get(api.GENERATION_KEY)
+
+    def test_failed_build_not_published(self, patch_config, shared_cache):
+        with patch(
+            "opentopodata.config.load_dataset", side_effect=api.config.ConfigError
+        ):
+            with pytest.raises(api.config.ConfigError):
+                api.publish_dataset(ETOPO1_DATASET_NAME, [GEOTIFF_PATH])
+        assert not api.cache.get(api.GENERATION_KEY)
+
+
+class TestPublishConfig:
+    @pytest.fixture
+    def config_path(self, tmp_path, shared_cache):
+        path = tmp_path / "config.yaml"
+        path.write_text(open(TEST_CONFIG_PATH).read())
+        with patch("opentopodata.config.CONFIG_PATH", str(path)):
+            yield path
+
+    def _publish_edited_config(self, path, old, new):
+        path.write_text(path.read_text().replace(old, new))
+        generation = api.publish_config()
+        api._SIMPLE_CACHE.pop("generation_checked_at")
+        return generation
+
+    def test_unchanged_datasets_kept(self, config_path):
+        conf = api._load_config()
+        etopo1 = api._load_dataset(ETOPO1_DATASET_NAME)
+        srtm = api._load_dataset("srtm90subset")
+
+        self._publish_edited_config(config_path, "left: 10", "left: 10.5")
+        assert api._load_config() is not conf
+        assert api._load_dataset(ETOPO1_DATASET_NAME) is etopo1
+        new_srtm = api._load_dataset("srtm90subset")
+        assert new_srtm is not srtm
+        assert new_srtm.wgs84_bounds.left == 10.5
+
+    def test_global_options_applied(self, config_path):
+        api._load_config()
+        self._publish_edited_config(
+            config_path,
+            "max_locations_per_request: 100",
+            "max_locations_per_request: 5",
+        )
+        assert api._load_config()["max_locations_per_request"] == 5
+
+    def test_removed_dataset(self, config_path):
+        api._load_dataset("srtm90utm")
+        self._publish_edited_config(config_path, "name: srtm90utm", "name: renamed")
+        with api.app.test_request_context():
+            with pytest.raises(api.ClientError):
+                api._get_datasets("srtm90utm")
+            assert api._get_datasets("renamed")[0].name == "renamed"
+
+    def test_invalid_config_not_published(self, config_path):
+        conf = api._load_config()
+        config_path.write_text("datasets: []")
+        with pytest.raises(api.config.ConfigError):
+            api.publish_config()
+        api._SIMPLE_CACHE.pop("generation_checked_at")
+        assert api._load_config() is conf
+
+    def test_invalid_dataset_not_published(self, config_path):
+        conf = api._load_config()
+        config_path.write_text(
+            config_path.read_text().replace("test-nodata/", "missing/")
+        )
+        with pytest.raises(api.config.ConfigError):
+            api.publish_config()
+        assert not api.cache.get(api.GENERATION_KEY)
+        api._SIMPLE_CACHE.pop("generation_checked_at")
+        assert api._load_config() is conf
+
+
 class TestGetElevation:
     test_api = api.app.test_client()
     with rasterio.open(GEOTIFF_PATH) as f:
@@ -513,6 +689,32 @@ class TestGetHealthStatus:
             assert response.status_code == 500
             assert rjson["status"] == "SERVER_ERROR"
 
+    def test_deep_builds_every_dataset(self, patch_config):
+        api._SIMPLE_CACHE.pop("datasets", None)
+        api._PRELOAD_ERRORS.clear()
+        with patch(
+            "opentopodata.config.load_dataset", side_effect=api.config.ConfigError
+        ):
+            assert self.test_api.get("/health").status_code == 200
+            assert self.test_api.get("/health?deep=1").status_code == 500
+
+    def test_loaded_datasets_checked(self, patch_config):
+        api._load_dataset(ETOPO1_DATASET_NAME)
+        with patch(
+            "opentopodata.config.load_dataset", side_effect=api.config.ConfigError
+        ):
+            assert self.test_api.get("/health").status_code == 500
+
+    def test_preload_errors_reported(self, patch_config):
+        try:
+            with patch(
+                "opentopodata.config.load_dataset", side_effect=api.config.ConfigError
+            ):
+                api._preload_datasets()
+            assert self.test_api.get("/health").status_code == 500
+        finally:
+            api._PRELOAD_ERRORS.clear()
+
 
 class TestDatasetsEndpoint:
     test_api = api.app.test_client()
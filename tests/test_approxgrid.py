@@ -0,0 +1,88 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import rasterio
+
+from opentopodata import approxgrid, backend, catalog
+
+
+ETOPO1_GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
+UTM_TILE_PATH = "tests/data/datasets/test-srtm90m-subset-utm/N00E010.tif"
+EUDEM_TILE_PATH = "tests/data/datasets/test-eu-dem-subset/N2000000E3000000.TIF"
+
+
+def _raster_info(path):
+    with rasterio.open(path) as f:
+        return catalog.RasterInfo.from_dict(catalog.read_raster_info(f))
+
+
+def _build(info, max_error_px):
+    return approxgrid.ApproxGrid.build(
+        info.crs, info.transformer, info.inv_transform, info.bounds, max_error_px
+    )
+
+
+class TestApproxGrid:
+    @pytest.mark.parametrize("path", [UTM_TILE_PATH, EUDEM_TILE_PATH])
+    @pytest.mark.parametrize("max_error_px", [0.5, 0.125, 0.01])
+    def test_matches_pyproj(self, path, max_error_px):
+        info = _raster_info(path)
+        grid = _build(info, max_error_px)
+
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(grid.south, grid.north, 10000)
+        lons = rng.uniform(grid.west, grid.east, 10000)
+        rows, cols, is_covered = grid.pixel_coords(lats, lons)
+        xs, ys = info.transformer.transform(lons, lats)
+        rows_exact, cols_exact = backend._pixel_coords(info.inv_transform, xs, ys)
+
+        assert is_covered.all()
+        assert np.abs(rows - rows_exact).max() <= max_error_px
+        assert np.abs(cols - cols_exact).max() <= max_error_px
+
+    def test_exact_at_nodes(self):
+        info = _raster_info(UTM_TILE_PATH)
+        grid = _build(info, 0.01)
+        lats = np.linspace(grid.south, grid.north, grid.rows.shape[0])
+        lons = np.linspace(grid.west, grid.east, grid.rows.shape[1])
+        lons, lats = np.meshgrid(lons, lats)
+        rows, cols, _ = grid.pixel_coords(lats.ravel(), lons.ravel())
+        np.testing.assert_allclose(rows, grid.rows.ravel())
+        np.testing.assert_allclose(cols, grid.cols.ravel())
+
+    def test_refined_for_smaller_error(self):
+        info = _raster_info(EUDEM_TILE_PATH)
+        assert _build(info, 0.01).rows.size > _build(info, 0.5).rows.size
+
+    def test_uncovered(self):
+        grid = _build(_raster_info(UTM_TILE_PATH), 0.125)
+        rows, cols, is_covered = grid.pixel_coords(
+            [grid.south - 1, grid.north, np.nan], [grid.west, grid.east + 1, 0]
+        )
+        assert not is_covered.any()
+        assert np.isnan(rows).all()
+        assert np.isnan(cols).all()
+
+    def test_latlon_raster(self):
+        assert _build(_raster_info(ETOPO1_GEOTIFF_PATH), 0.125) is None
+
+    def test_too_distorted(self):
+        with patch("opentopodata.approxgrid.MAX_GRID_CELLS", 2):
+            assert _build(_raster_info(EUDEM_TILE_PATH), 1e-6) is None
+
+
+class TestCatalogApproxGrid:
+    def test_built_once(self):
+        raster_catalog = catalog.RasterCatalog(max_error_px=0.125)
+        with rasterio.open(UTM_TILE_PATH) as f:
+            raster_catalog.add(UTM_TILE_PATH, catalog.read_raster_info(f))
+        grid = raster_catalog.get(UTM_TILE_PATH).approx_grid
+        assert grid is not None
+        assert raster_catalog.get(UTM_TILE_PATH).approx_grid is grid
+
+    def test_disabled_by_default(self):
+        raster_catalog = catalog.RasterCatalog()
+        with rasterio.open(UTM_TILE_PATH) as f:
+            raster_catalog.add(UTM_TILE_PATH, catalog.read_raster_info(f))
+        assert raster_catalog.get(UTM_TILE_PATH).approx_grid is None
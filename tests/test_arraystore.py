@@ -0,0 +1,167 @@
+import os
+import shutil
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import rasterio
+
+from opentopodata import arraystore, backend, config, utils
+
+
+ETOPO1_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/"
+EUDEM_PATH = "tests/data/datasets/test-eu-dem-subset/"
+NODATA_PATH = "tests/data/datasets/test-nodata/"
+SRTM_PATH = "tests/data/datasets/test-srtm90m-subset/"
+SRTM_UTM_PATH = "tests/data/datasets/test-srtm90m-subset-utm/"
+
+
+def _compile(src_path, out_dir):
+    kwargs = {}
+    if src_path == EUDEM_PATH:
+        kwargs = {"filename_epsg": 3035, "filename_tile_size": 1000000}
+    dataset = config.Dataset.from_config("source", src_path, **kwargs)
+    arraystore.compile_dataset(dataset, str(out_dir))
+    return dataset, config.Dataset.from_config("compiled", str(out_dir))
+
+
+class TestCompileRaster:
+    @pytest.mark.parametrize(
+        "src_path",
+        [
+            ETOPO1_PATH + "ETOPO1_Ice_g_geotiff.resampled-1deg.tif",
+            NODATA_PATH + "nodata.geotiff",
+            SRTM_PATH + "N00E011.hgt.zip",
+        ],
+    )
+    def test_matches_gdal(self, tmp_path, src_path):
+        out_path = str(tmp_path / "raster.npystore")
+        arraystore.compile_raster(src_path, out_path)
+        raster = arraystore.open_raster(out_path)
+        with rasterio.open(src_path) as f:
+            assert raster.transform == f.transform
+            assert raster.bounds == f.bounds
+            assert raster.crs == f.crs
+            assert (raster.height, raster.width) == f.shape
+            window = rasterio.windows.Window(0, 0, f.width, f.height)
+            np.testing.assert_array_equal(
+                raster.read_window(window), backend._read_window(f, window)
+            )
+
+    def test_chunks_block_aligned(self, tmp_path):
+        src_path = SRTM_PATH + "N00E010.hgt"
+        out_path = str(tmp_path / "raster.npystore")
+        arraystore.compile_raster(src_path, out_path)
+        raster = arraystore.open_raster(out_path)
+        assert raster.block_shapes == [(512, 1201)]
+        assert len([p for p in os.listdir(out_path) if p.endswith(".npy")]) == 3
+
+    def test_reopened_when_changed(self, tmp_path):
+        out_path = str(tmp_path / "raster.npystore")
+        arraystore.compile_raster(SRTM_PATH + "N00E010.hgt", out_path)
+        raster = arraystore.open_raster(out_path)
+        assert arraystore.open_raster(out_path) is raster
+        arraystore.compile_raster(SRTM_PATH + "N00E011.hgt.zip", out_path)
+        assert arraystore.open_raster(out_path) is not raster
+
+    def test_chunks_share_map_budget(self, tmp_path):
+        out_path = str(tmp_path / "raster.npystore")
+        arraystore.compile_raster(SRTM_PATH + "N00E010.hgt", out_path)
+        raster = arraystore.open_raster(out_path)
+        window = rasterio.windows.Window(0, 0, raster.width, raster.height)
+        z = raster.read_window(window)
+        try:
+            utils.MAPPED_FILES.resize(1)
+            assert len(utils.MAPPED_FILES) == 1
+            np.testing.assert_array_equal(raster.read_window(window), z)
+            assert len(utils.MAPPED_FILES) == 1
+        finally:
+            backend.resize_open_file_caches(0)
+
+
+class TestArrayStoreDataset:
+    def test_single_file(self, tmp_path):
+        _, dataset = _compile(ETOPO1_PATH, tmp_path)
+        assert isinstance(dataset, config.ArrayStoreDataset)
+        assert dataset.location_paths([0], [0]) == [
+            str(tmp_path / "ETOPO1_Ice_g_geotiff.resampled-1deg.tif.npystore")
+        ]
+
+    def test_tiled(self, tmp_path):
+        _, dataset = _compile(SRTM_PATH, tmp_path)
+        paths = dataset.location_paths([0.5, 0.5, 5], [10.5, 11.5, 5])
+        assert paths == [
+            str(tmp_path / "N00E010.hgt.npystore"),
+            str(tmp_path / "N00E011.hgt.zip.npystore"),
+            None,
+        ]
+
+    def test_indexed(self, tmp_path):
+        src_path = tmp_path / "src"
+        src_path.mkdir()
+        shutil.copy(SRTM_UTM_PATH + "N00E010.tif", src_path / "dem_west.tif")
+        shutil.copy(SRTM_UTM_PATH + "USGS_13_n00e011.tif", src_path / "dem_east.tif")
+        source, compiled = _compile(str(src_path), tmp_path / "out")
+        assert isinstance(source, config.IndexedDataset)
+        paths = compiled.location_paths([0.5, 0.5], [10.5, 11.5])
+        assert [os.path.basename(p) for p in paths] == [
+            "dem_west.tif.npystore",
+            "dem_east.tif.npystore",
+        ]
+
+    def test_same_filename_in_subfolders(self, tmp_path):
+        src_path = tmp_path / "src"
+        (src_path / "west").mkdir(parents=True)
+        (src_path / "east").mkdir()
+        shutil.copy(SRTM_UTM_PATH + "N00E010.tif", src_path / "west" / "dem.tif")
+        shutil.copy(
+            SRTM_UTM_PATH + "USGS_13_n00e011.tif", src_path / "east" / "dem.tif"
+        )
+        source, compiled = _compile(str(src_path), tmp_path / "out")
+        assert isinstance(source, config.IndexedDataset)
+
+        manifest = arraystore.read_manifest(str(tmp_path / "out"))
+        assert sorted(manifest["stores"]) == [
+            os.path.join("east", "dem.tif.npystore"),
+            os.path.join("west", "dem.tif.npystore"),
+        ]
+        paths = compiled.location_paths([0.5, 0.5], [10.5, 11.5])
+        assert paths == [
+            str(tmp_path / "out" / "west" / "dem.tif.npystore"),
+            str(tmp_path / "out" / "east" / "dem.tif.npystore"),
+        ]
+
+    def test_incomplete_compile_not_loaded(self, tmp_path):
+        _, dataset = _compile(SRTM_PATH, tmp_path)
+        os.remove(tmp_path / arraystore.MANIFEST_FILENAME)
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config("compiled", str(tmp_path))
+
+    def test_cache_not_supported(self, tmp_path):
+        _compile(ETOPO1_PATH, tmp_path)
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config(
+                "compiled", str(tmp_path), local_cache_path=str(tmp_path / "cache")
+            )
+
+    @pytest.mark.parametrize("src_path", [ETOPO1_PATH, EUDEM_PATH, SRTM_PATH])
+    @pytest.mark.parametrize("interpolation", ["nearest", "bilinear", "cubic"])
+    def test_elevations_match_source(self, tmp_path, src_path, interpolation):
+        source, compiled = _compile(src_path, tmp_path)
+        left, bottom, right, top = source.wgs84_bounds
+        if src_path == EUDEM_PATH:
+            left, bottom, right, top = 0, 42, 12, 49
+        elif src_path == SRTM_PATH:
+            left, bottom, right, top = 10, 0, 12, 1
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(bottom, top, 200)
+        lons = rng.uniform(left, right, 200)
+
+        z = backend.get_elevation(lats, lons, [source], interpolation)
+        with patch("rasterio.open") as mock_open:
+            z_compiled = backend.get_elevation(lats, lons, [compiled], interpolation)
+        mock_open.assert_not_called()
+        assert any(e is not None for e in z[0])
+        np.testing.assert_array_equal(
+            np.array(z_compiled[0], dtype=float), np.array(z[0], dtype=float)
+        )
@@ -1,10 +1,15 @@
+import os
+import resource
+import shutil
+
 from opentopodata import backend
 import rasterio
+import rasterio.warp
 import pytest
 import numpy as np
 from unittest.mock import patch
 
-from opentopodata import config
+from opentopodata import config, utils
 
 
 ETOPO1_GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
@@ -18,6 +23,7 @@ NO_FILL_VALUE_CONFIG_PATH = "tests/data/configs/no-fill-value.yaml"
 TEST_CONFIG_PATH = "tests/data/configs/test-config.yaml"
 NODATA_DATASET_PATH = "tests/data/datasets/test-nodata/nodata.geotiff"
 NODATA_DATASET_NAME = "nodata"
+SRTM_FOLDER = "tests/data/datasets/test-srtm90m-subset/"
 EUDEM_TILE_PATH = "tests/data/datasets/test-eu-dem-subset/N2000000E3000000.TIF"
 
 
@@ -136,6 +142,20 @@ class TestGetElevationFromPath:
         z = backend._get_elevation_from_path(lats, lons, ETOPO1_GEOTIFF_PATH, "nearest")
         assert z[0] == self.geotiff_z[0, 0]
 
+    def test_nearest_batch(self):
+        lats = [89.51, 10.2, -45.7, 0.4, -89.9]
+        lons = [-179.51, 120.6, 3.3, -0.4, 179.9]
+        z = backend._get_elevation_from_path(lats, lons, ETOPO1_GEOTIFF_PATH, "nearest")
+        rows = np.round(90 - np.array(lats)).astype(int)
+        cols = np.round(180 + np.array(lons)).astype(int)
+        assert z == self.geotiff_z[rows, cols].tolist()
+
+    def test_nearest_batch_with_oob(self):
+        lats = [0, 0, 10.2]
+        lons = [-180.1, 10.4, 180.1]
+        z = backend._get_elevation_from_path(lats, lons, ETOPO1_GEOTIFF_PATH, "nearest")
+        assert z == [None, self.geotiff_z[90, 190], None]
+
     def _interp_bilinear(self, x, y, z):
         return (
             z[0][0] * (1 - x) * (1 - y)
@@ -234,6 +254,160 @@ class TestGetElevationFromPath:
         assert np.isnan(z)
 
 
+class TestPixelCoords:
+    @pytest.mark.parametrize(
+        "path", [ETOPO1_GEOTIFF_PATH, EUDEM_TILE_PATH, SRTM_FOLDER + "N00E010.hgt"]
+    )
+    def test_matches_rasterio(self, path):
+        rng = np.random.default_rng(0)
+        with rasterio.open(path) as f:
+            xs = rng.uniform(f.bounds.left, f.bounds.right, 100)
+            ys = rng.uniform(f.bounds.bottom, f.bounds.top, 100)
+            rows, cols = backend._pixel_coords(~f.transform, xs, ys)
+            rows_rasterio, cols_rasterio = f.index(xs, ys, op=backend._noop)
+        np.testing.assert_array_equal(rows, rows_rasterio)
+        np.testing.assert_array_equal(cols, cols_rasterio)
+
+    def test_scalar(self):
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            rows, cols = backend._pixel_coords(~f.transform, 10.5, 20.5)
+        assert rows.shape == (1,)
+        assert cols.shape == (1,)
+
+
+class TestInterpolate:
+    z = np.arange(16, dtype=float).reshape(4, 4) ** 1.5
+    rows = np.array([0, 1.5, 2.2, 0.7, 3])
+    cols = np.array([0, 1.5, 0.4, 2.9, 3])
+
+    def test_nearest(self):
+        z = backend._interpolate(self.z, self.rows, self.cols, "nearest")
+        assert z.tolist() == self.z[[0, 2, 2, 1, 3], [0, 2, 0, 3, 3]].tolist()
+
+    def test_kernels_exact_at_pixel_centres(self):
+        rows = np.array([0, 1, 2, 3])
+        cols = np.array([3, 0, 2, 1])
+        for method in backend.INTERPOLATION_METHODS:
+            if method == "cubic_spline":
+                # B-splines smooth rather than interpolate.
+                continue
+            z = backend._interpolate(self.z, rows, cols, method)
+            assert np.allclose(z, self.z[rows, cols])
+
+    def test_bilinear(self):
+        z = backend._interpolate(self.z, np.array([1.25]), np.array([2.5]), "bilinear")
+        expected = (
+            0.75 * 0.5 * self.z[1, 2]
+            + 0.75 * 0.5 * self.z[1, 3]
+            + 0.25 * 0.5 * self.z[2, 2]
+            + 0.25 * 0.5 * self.z[2, 3]
+        )
+        assert z[0] == pytest.approx(expected)
+
+    def test_matches_gdal(self):
+        # Interpolation used to be done by GDAL on a resampled 1x1 window.
+        lats = [10.3, -45.71, 0.49, 60.01, -12.5]
+        lons = [120.6, 3.35, -0.4, 80.99, -77.77]
+        for method in backend.INTERPOLATION_METHODS:
+            z = backend._get_elevation_from_path(
+                lats, lons, ETOPO1_GEOTIFF_PATH, method
+            )
+            with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+                for lat, lon, z_numpy in zip(lats, lons, z):
+                    row, col = f.index(lon, lat, op=backend._noop)
+                    window = rasterio.windows.Window(col - 0.5, row - 0.5, 1, 1)
+                    z_gdal = f.read(
+                        1,
+                        window=window,
+                        resampling=getattr(rasterio.enums.Resampling, method),
+                        out_dtype=float,
+                    )[0, 0]
+                    assert z_numpy == pytest.approx(z_gdal, abs=0.1)
+
+    def test_nodata(self):
+        z = self.z.copy()
+        z[0, 0] = np.nan
+        rows = np.array([0, 0.1, 0.2, 0.6])
+        cols = np.array([0, 0.1, 0.2, 0.6])
+        z_bilinear = backend._interpolate(z, rows, cols, "bilinear")
+        assert np.isnan(z_bilinear[:3]).all()
+        assert z_bilinear[3] == pytest.approx(
+            (0.24 * z[0, 1] + 0.24 * z[1, 0] + 0.36 * z[1, 1]) / 0.84
+        )
+
+    def test_nodata_threshold(self):
+        # Half the kernel weight on NODATA is NODATA, any less is renormalised.
+        assert backend.NODATA_WEIGHT_THRESHOLD == 0.5
+        z = self.z.copy()
+        z[2, :] = np.nan
+        rows = np.array([1.5, 1.49])
+        cols = np.array([1.5, 1.5])
+        z_bilinear = backend._interpolate(z, rows, cols, "bilinear")
+        assert np.isnan(z_bilinear[0])
+        assert z_bilinear[1] == pytest.approx((z[1, 1] + z[1, 2]) / 2)
+
+    def test_edges_ignored(self):
+        rows = np.array([0, 3])
+        cols = np.array([0.5, 2.5])
+        z = backend._interpolate(self.z, rows, cols, "cubic")
+        assert np.isfinite(z).all()
+
+    def test_integer_raster_not_rounded(self, patch_config):
+        lats = [0.1234]
+        lons = [10.5678]
+        path = config.load_datasets()[SRTM_DATASET_NAME].location_paths(lats, lons)[0]
+        z = backend._get_elevation_from_path(lats, lons, path, "bilinear")
+        assert not float(z[0]).is_integer()
+
+
+class TestPlanWindowReads:
+    block_shape = (256, 256)
+
+    def _plan(self, rows, cols):
+        rows = np.array(rows)
+        cols = np.array(cols)
+        return backend._plan_window_reads(
+            rows, rows + 2, cols, cols + 2, self.block_shape
+        )
+
+    def test_single_point(self):
+        plan = self._plan([5], [7])
+        assert len(plan) == 1
+        window, indices = plan[0]
+        assert window == rasterio.windows.Window(7, 5, 2, 2)
+        assert indices.tolist() == [0]
+
+    def test_dense_points_read_together(self):
+        plan = self._plan([5, 200, 10], [7, 20, 200])
+        assert len(plan) == 1
+        window, indices = plan[0]
+        assert window == rasterio.windows.Window(7, 5, 195, 197)
+        assert sorted(indices.tolist()) == [0, 1, 2]
+
+    def test_sparse_points_clustered(self):
+        plan = self._plan([5, 9000, 10, 9001], [7, 9000, 9, 5000])
+        assert len(plan) == 3
+        indices = sorted(sorted(i.tolist()) for _, i in plan)
+        assert indices == [[0, 2], [1], [3]]
+        for window, i in plan:
+            assert window.width < 256
+            assert window.height < 256
+
+    def test_clustered_read_matches_single_read(self):
+        lats = np.linspace(-80, 80, 50)
+        lons = np.linspace(170, -170, 50)
+        for method in backend.INTERPOLATION_METHODS:
+            z_single = backend._get_elevation_from_path(
+                lats, lons, ETOPO1_GEOTIFF_PATH, method
+            )
+            with patch("opentopodata.backend.MIN_CLUSTER_SIZE_PIXELS", 1):
+                with patch("opentopodata.backend.WINDOW_READ_OVERHEAD_PIXELS", 0):
+                    z_clustered = backend._get_elevation_from_path(
+                        lats, lons, ETOPO1_GEOTIFF_PATH, method
+                    )
+            assert z_single == pytest.approx(z_clustered)
+
+
 class TestGetElevationForSingleDataset:
     def test_single_file_dataset(self):
         lats = [0.1, -9]
@@ -248,6 +422,40 @@ class TestGetElevationForSingleDataset:
         )
         assert elevations_by_dataset == elevations_by_path
 
+    def test_nodata_value(self):
+        lats = [0, 0, 1, 5]
+        lons = [0, 2, 1, 5]
+        dataset = config.Dataset.from_config(
+            NODATA_DATASET_NAME, os.path.dirname(NODATA_DATASET_PATH)
+        )
+        z = backend._get_elevation_for_single_dataset(
+            lats, lons, dataset, "nearest", nodata_value=-9999
+        )
+        assert z == [4, -9999, -9999, None]
+
+    def test_oob_skips_open(self):
+        lats = [5, 50]
+        lons = [5, -50]
+        dataset = config.Dataset.from_config(
+            NODATA_DATASET_NAME, os.path.dirname(NODATA_DATASET_PATH)
+        )
+        assert NODATA_DATASET_PATH in dataset.catalog
+        with patch("opentopodata.backend._open_raster") as mock_open:
+            z = backend._get_elevation_for_single_dataset(lats, lons, dataset)
+        assert z == [None, None]
+        mock_open.assert_not_called()
+
+    def test_tiles_added_to_catalog(self, patch_config):
+        lats = [0.1, 0.9]
+        lons = [10.5, 11.5]
+        dataset = config.load_datasets()[SRTM_DATASET_NAME]
+        assert len(dataset.catalog) == 0
+        z = backend._get_elevation_for_single_dataset(lats, lons, dataset)
+        paths = dataset.location_paths(lats, lons)
+        assert all(p in dataset.catalog for p in paths)
+        z_cataloged = backend._get_elevation_for_single_dataset(lats, lons, dataset)
+        assert z == z_cataloged
+
     def test_oob(self, patch_config):
         lats = [1.5, -0.5, 0.5, 0.5]
         lons = [10.5, 11.5, 9.5, 12.5]
@@ -263,6 +471,72 @@ class TestGetElevationForSingleDataset:
         assert all(z)
         assert all(np.isfinite(z))
 
+    def test_threaded_reads(self, patch_config):
+        lats = [0.1, 0.9, 0.5, 0.2]
+        lons = [10.5, 11.5, 10.1, 11.9]
+        dataset = config.load_datasets()[SRTM_DATASET_NAME]
+        z = backend._get_elevation_for_single_dataset(lats, lons, dataset)
+        with patch.object(dataset, "max_read_threads", 4):
+            z_threaded = backend._get_elevation_for_single_dataset(lats, lons, dataset)
+        assert z == z_threaded
+
+    def test_local_cache(self, tmp_path):
+        lats = [0.1, 0.9]
+        lons = [10.5, 11.5]
+        dataset = config.Dataset.from_config(SRTM_DATASET_NAME, SRTM_FOLDER)
+        dataset_cached = config.Dataset.from_config(
+            SRTM_DATASET_NAME, SRTM_FOLDER, local_cache_path=str(tmp_path)
+        )
+        z = backend._get_elevation_for_single_dataset(lats, lons, dataset)
+        z_cached = backend._get_elevation_for_single_dataset(lats, lons, dataset_cached)
+        assert z == z_cached
+        assert dataset_cached.tile_cache.size() > 0
+
+    def test_local_cache_evicted_before_open(self, tmp_path):
+        lats = [0.1, 0.9]
+        lons = [10.5, 11.5]
+        dataset = config.Dataset.from_config(SRTM_DATASET_NAME, SRTM_FOLDER)
+        dataset_cached = config.Dataset.from_config(
+            SRTM_DATASET_NAME, SRTM_FOLDER, local_cache_path=str(tmp_path)
+        )
+        tile_cache = dataset_cached.tile_cache
+        real_local_path = tile_cache.local_path
+        evicted = []
+
+        # Another process evicts each tile as soon as it's been fetched.
+        def local_path(path):
+            local_path = real_local_path(path)
+            if path not in evicted:
+                evicted.append(path)
+                os.remove(local_path)
+            return local_path
+
+        with patch.object(tile_cache, "local_path", side_effect=local_path):
+            z_cached = backend._get_elevation_for_single_dataset(
+                lats, lons, dataset_cached
+            )
+        assert evicted
+        assert z_cached == backend._get_elevation_for_single_dataset(
+            lats, lons, dataset
+        )
+
+    def test_unzip_cache(self, tmp_path):
+        lats = [0.1, 0.9, 0.5]
+        lons = [10.5, 11.5, 11.25]
+        dataset = config.Dataset.from_config(SRTM_DATASET_NAME, SRTM_FOLDER)
+        dataset_cached = config.Dataset.from_config(
+            SRTM_DATASET_NAME, SRTM_FOLDER, unzip_cache_path=str(tmp_path)
+        )
+        for interpolation in backend.INTERPOLATION_METHODS:
+            z = backend._get_elevation_for_single_dataset(
+                lats, lons, dataset, interpolation
+            )
+            z_cached = backend._get_elevation_for_single_dataset(
+                lats, lons, dataset_cached, interpolation
+            )
+            assert z == z_cached
+        assert os.listdir(tmp_path)
+
     def test_utm(self, patch_config):
         lats = [0.2, 0.8, 0.6]
         lons = [10.2, 10.8, 11.5]
@@ -275,6 +549,64 @@ class TestGetElevationForSingleDataset:
 
         assert np.allclose(z, z_utm)
 
+    def test_indexed_matches_tiled(self, patch_config, tmp_path):
+        utm_folder = "tests/data/datasets/test-srtm90m-subset-utm/"
+        shutil.copy(utm_folder + "N00E010.tif", tmp_path / "dem_west.tif")
+        shutil.copy(utm_folder + "USGS_13_n00e011.tif", tmp_path / "dem_east.tif")
+        dataset_indexed = config.Dataset.from_config("indexed", str(tmp_path))
+        dataset_utm = config.load_datasets()[SRTM_UTM_DATASET_NAME]
+
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(0, 1, 100)
+        lons = rng.uniform(10, 12, 100)
+        for interpolation in ["nearest", "bilinear"]:
+            z_indexed = backend._get_elevation_for_single_dataset(
+                lats, lons, dataset_indexed, interpolation
+            )
+            z_utm = backend._get_elevation_for_single_dataset(
+                lats, lons, dataset_utm, interpolation
+            )
+            assert z_indexed == z_utm
+
+    def test_shared_locations(self, patch_config):
+        lats = [43.597009, 45.534601, 47.625765]
+        lons = [1.455697, 10.698698, 9.418759]
+        dataset = config.load_datasets()[EU_DEM_DATASET_NAME]
+        z, _ = backend._sample_dataset(lats, lons, dataset, "bilinear")
+
+        # Filenames and tiles share the projection.
+        locations = utils.ProjectedLocations(lats, lons)
+        transformer = dataset._filename_transformer
+        with patch.object(
+            transformer, "transform", wraps=transformer.transform
+        ) as mock_transform:
+            z_shared, _ = backend._sample_dataset(
+                lats, lons, dataset, "bilinear", locations=locations
+            )
+        np.testing.assert_array_equal(z, z_shared)
+        assert mock_transform.call_count == 1
+
+    @pytest.mark.parametrize("interpolation", ["nearest", "bilinear"])
+    def test_approximate_reprojection(self, interpolation):
+        path = "tests/data/datasets/test-srtm90m-subset-utm/"
+        dataset = config.Dataset.from_config("utm", path)
+        dataset_approx = config.Dataset.from_config(
+            "utm", path, max_reprojection_error_px=0.001
+        )
+
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-0.1, 1.1, 1000)
+        lons = rng.uniform(9.9, 12.1, 1000)
+        z, in_bounds = backend._sample_dataset(lats, lons, dataset, interpolation)
+        with patch("opentopodata.backend._pixel_coords") as mock_pixel_coords:
+            z_approx, in_bounds_approx = backend._sample_dataset(
+                lats, lons, dataset_approx, interpolation
+            )
+        mock_pixel_coords.assert_not_called()
+        np.testing.assert_array_equal(in_bounds, in_bounds_approx)
+        is_equal = np.isclose(z, z_approx, atol=1, equal_nan=True)
+        assert is_equal.mean() > 0.99
+
     def test_out_of_srtm_bounds(self, patch_config):
         lats = [70]
         lons = [10.5]
@@ -340,6 +672,24 @@ class TestGetElevation:
         assert all(np.isfinite(z))
         assert dataset_names == [ETOPO1_RESAMPLED_DATASET_NAME] * len(lats)
 
+    def test_nodata_value_fills_point(self, patch_config):
+        lats = [0, 0]
+        lons = [0, 2]
+        datasets = [
+            config.load_datasets()[NODATA_DATASET_NAME],
+            config.load_datasets()[ETOPO1_RESAMPLED_DATASET_NAME],
+        ]
+        z, dataset_names = backend.get_elevation(lats, lons, datasets)
+        assert z[0] == 4
+        assert np.isfinite(z[1])
+        assert dataset_names == [NODATA_DATASET_NAME, ETOPO1_RESAMPLED_DATASET_NAME]
+
+        z, dataset_names = backend.get_elevation(
+            lats, lons, datasets, nodata_value=-9999
+        )
+        assert z == [4, -9999]
+        assert dataset_names == [NODATA_DATASET_NAME] * 2
+
     def test_single_dataset(self, patch_config):
         lats = [0.1, 0.9]
         lons = [10.5, 11.5]
@@ -348,3 +698,198 @@ class TestGetElevation:
         assert all(z)
         assert all(np.isfinite(z))
         assert names == [SRTM_DATASET_NAME] * len(lats)
+
+
+class TestDatasetPool:
+    def test_reuses_handle(self):
+        pool = backend.DatasetPool(max_size=2)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f1:
+            pass
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f2:
+            pass
+        assert f1 is f2
+        assert not f2.closed
+        assert len(pool) == 1
+
+    def test_concurrent_use_opens_new_handle(self):
+        pool = backend.DatasetPool(max_size=2)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f1:
+            with pool.open(ETOPO1_GEOTIFF_PATH) as f2:
+                assert f1 is not f2
+        assert len(pool) == 2
+
+    def test_discard(self):
+        pool = backend.DatasetPool(max_size=2)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f1:
+            pass
+        with pool.open(NODATA_DATASET_PATH) as f2:
+            pass
+        pool.discard({ETOPO1_GEOTIFF_PATH})
+        assert f1.closed
+        assert not f2.closed
+        assert len(pool) == 1
+
+    def test_lru_eviction(self):
+        pool = backend.DatasetPool(max_size=1)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f1:
+            pass
+        with pool.open(NODATA_DATASET_PATH) as f2:
+            pass
+        assert f1.closed
+        assert not f2.closed
+        assert len(pool) == 1
+
+    def test_disabled(self):
+        pool = backend.DatasetPool(max_size=0)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f:
+            pass
+        assert f.closed
+        assert len(pool) == 0
+
+    def test_resize_evicts(self):
+        pool = backend.DatasetPool(max_size=2)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f1:
+            with pool.open(ETOPO1_GEOTIFF_PATH) as f2:
+                pass
+        pool.resize(1)
+        assert len(pool) == 1
+        assert f1.closed != f2.closed
+
+    def test_modified_file_reopened(self, tmp_path):
+        path = tmp_path / "etopo1.tif"
+        path.write_bytes(open(ETOPO1_GEOTIFF_PATH, "rb").read())
+        pool = backend.DatasetPool(max_size=2)
+        with pool.open(str(path)) as f1:
+            pass
+        os.utime(path, ns=(0, 0))
+        with pool.open(str(path)) as f2:
+            pass
+        assert f1 is not f2
+        assert f1.closed
+
+    def test_fork_drops_handles(self):
+        pool = backend.DatasetPool(max_size=2)
+        with pool.open(ETOPO1_GEOTIFF_PATH) as f1:
+            pass
+        with patch("os.getpid", return_value=-1):
+            with pool.open(ETOPO1_GEOTIFF_PATH) as f2:
+                pass
+        assert f1 is not f2
+        assert len(pool) == 1
+
+
+class TestResizeOpenFileCaches:
+    def test_budget_shared(self):
+        try:
+            with patch("resource.getrlimit", return_value=(400, 400)):
+                backend.resize_open_file_caches(64)
+                assert backend.DATASET_POOL.max_size == 50
+                assert utils.MAPPED_FILES.max_cost == 50
+
+                backend.resize_open_file_caches(10)
+                assert backend.DATASET_POOL.max_size == 10
+                assert utils.MAPPED_FILES.max_cost == 90
+        finally:
+            backend.resize_open_file_caches(0)
+
+    def test_no_limit(self):
+        try:
+            with patch(
+                "resource.getrlimit", return_value=(resource.RLIM_INFINITY,) * 2
+            ):
+                backend.resize_open_file_caches(64)
+                assert backend.DATASET_POOL.max_size == 64
+                assert utils.MAPPED_FILES.max_cost is None
+        finally:
+            backend.resize_open_file_caches(0)
+
+
+class TestBlockCache:
+    def test_discard(self):
+        cache = backend.BlockCache(max_bytes=10**6)
+        cache.put_many("a", None, {(0, 0): np.zeros((2, 2))})
+        cache.put_many("b", None, {(0, 0): np.zeros((2, 2))})
+        cache.discard({"a"})
+        assert not cache.get_many("a", None, [(0, 0)])
+        assert cache.get_many("b", None, [(0, 0)])
+        assert cache.n_bytes == 8 * 4
+
+    def test_lru_eviction(self):
+        cache = backend.BlockCache(max_bytes=2 * 8 * 100)
+        z = {(i, 0): np.zeros((10, 10)) for i in range(3)}
+        cache.put_many("a", None, {(0, 0): z[(0, 0)], (1, 0): z[(1, 0)]})
+        cache.get_many("a", None, [(0, 0)])
+        cache.put_many("a", None, {(2, 0): z[(2, 0)]})
+        assert set(cache.get_many("a", None, [(0, 0), (1, 0), (2, 0)])) == {
+            (0, 0),
+            (2, 0),
+        }
+        assert cache.evictions == 1
+        assert cache.n_bytes == 2 * 8 * 100
+
+    def test_counters(self):
+        cache = backend.BlockCache(max_bytes=10**6)
+        cache.put_many("a", None, {(0, 0): np.zeros((2, 2))})
+        cache.get_many("a", None, [(0, 0), (0, 1)])
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["n_blocks"] == 1
+
+    def test_modified_file_is_miss(self):
+        cache = backend.BlockCache(max_bytes=10**6)
+        cache.put_many("a", 1, {(0, 0): np.zeros((2, 2))})
+        assert not cache.get_many("a", 2, [(0, 0)])
+
+    def test_cached_blocks_read_only(self):
+        cache = backend.BlockCache(max_bytes=10**6)
+        cache.put_many("a", None, {(0, 0): np.zeros((2, 2))})
+        z = cache.get_many("a", None, [(0, 0)])[(0, 0)]
+        with pytest.raises(ValueError):
+            z[0, 0] = 1
+
+    def test_fork_drops_blocks(self):
+        cache = backend.BlockCache(max_bytes=10**6)
+        cache.put_many("a", None, {(0, 0): np.zeros((2, 2))})
+        with patch("os.getpid", return_value=-1):
+            assert not cache.get_many("a", None, [(0, 0)])
+        assert len(cache) == 0
+
+    def test_strips_split_into_columns(self, tmp_path):
+        path = str(tmp_path / "strips.tif")
+        profile = dict(driver="GTiff", width=5000, height=300, count=1, dtype="int16")
+        z = np.arange(300 * 5000, dtype="int16").reshape(300, 5000)
+        with rasterio.open(path, "w", blockysize=1, **profile) as f:
+            f.write(z, 1)
+
+        cache = backend.BlockCache(max_bytes=10**9)
+        with patch("opentopodata.backend.BLOCK_CACHE", cache):
+            with rasterio.open(path) as f:
+                assert f.block_shapes[0] == (1, 5000)
+                window = rasterio.windows.Window(2600, 10, 2, 2)
+                z_window = list(backend._read_windows(f, [window]))[0]
+        np.testing.assert_array_equal(z_window, z[10:12, 2600:2602])
+        assert len(cache) == 1
+        assert cache.n_bytes == 13 * 256 * 8
+
+    @pytest.mark.parametrize("interpolation", backend.INTERPOLATION_METHODS.keys())
+    @pytest.mark.parametrize(
+        "path", [ETOPO1_GEOTIFF_PATH, SRTM_FOLDER + "N00E011.hgt.zip", EUDEM_TILE_PATH]
+    )
+    def test_matches_uncached(self, path, interpolation):
+        with rasterio.open(path) as f:
+            bounds = rasterio.warp.transform_bounds(f.crs, "EPSG:4326", *f.bounds)
+        rng = np.random.default_rng(0)
+        lons = rng.uniform(bounds[0], bounds[2], 50)
+        lats = rng.uniform(bounds[1], bounds[3], 50)
+
+        z_uncached, _ = backend._sample_path(lats, lons, path, interpolation)
+        cache = backend.BlockCache(max_bytes=10**9)
+        with patch("opentopodata.backend.BLOCK_CACHE", cache):
+            z_miss, _ = backend._sample_path(lats, lons, path, interpolation)
+            assert cache.misses > 0
+            assert cache.hits == 0
+            z_hit, _ = backend._sample_path(lats, lons, path, interpolation)
+            assert cache.hits == cache.misses
+
+        np.testing.assert_array_equal(z_miss, z_uncached)
+        np.testing.assert_array_equal(z_hit, z_uncached)
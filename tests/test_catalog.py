@@ -0,0 +1,113 @@
+import pickle
+
+import numpy as np
+import pytest
+import rasterio
+
+from opentopodata import catalog, hgt, utils
+
+
+ETOPO1_GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
+EUDEM_TILE_PATH = "tests/data/datasets/test-eu-dem-subset/N2000000E3000000.TIF"
+SRTM_PATH = "tests/data/datasets/test-srtm90m-subset/N00E010.hgt"
+
+
+class TestReadRasterInfo:
+    def test_matches_rasterio(self):
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            info = catalog.RasterInfo.from_dict(catalog.read_raster_info(f))
+            assert info.crs == f.crs.to_epsg()
+            assert info.bounds == f.bounds
+            assert info.res == f.res
+            assert info.transform == f.transform
+            assert (info.height, info.width) == f.shape
+
+    def test_hgt_tile(self):
+        tile = hgt.open_tile(SRTM_PATH)
+        with rasterio.open(SRTM_PATH) as f:
+            assert catalog.read_raster_info(tile) == catalog.read_raster_info(f)
+
+
+class TestRasterCatalog:
+    def test_get(self):
+        raster_catalog = catalog.RasterCatalog()
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            raster_catalog.add(ETOPO1_GEOTIFF_PATH, catalog.read_raster_info(f))
+            info = raster_catalog.get(ETOPO1_GEOTIFF_PATH)
+            assert info.bounds == f.bounds
+            assert info.transform == f.transform
+        assert raster_catalog.get("missing.tif") is None
+
+    def test_crs_deduplicated(self):
+        paths = [ETOPO1_GEOTIFF_PATH, EUDEM_TILE_PATH, SRTM_PATH]
+        infos = []
+        for path in paths + paths:
+            with rasterio.open(path) as f:
+                infos.append(catalog.read_raster_info(f))
+        raster_catalog = catalog.RasterCatalog()
+        raster_catalog.add_many([f"{i}-{p}" for i, p in enumerate(paths * 2)], infos)
+        assert len(raster_catalog) == 6
+        assert raster_catalog.crs_list == [4326, 3035]
+        assert raster_catalog.crs_ids.tolist() == [0, 1, 0, 0, 1, 0]
+
+    def test_add_existing_ignored(self):
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            info = catalog.read_raster_info(f)
+        raster_catalog = catalog.RasterCatalog()
+        raster_catalog.add("a", info)
+        raster_catalog.add("a", info)
+        assert len(raster_catalog) == 1
+        assert len(raster_catalog.bounds) == 1
+
+    def test_add_incrementally(self):
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            info = catalog.read_raster_info(f)
+        raster_catalog = catalog.RasterCatalog()
+        n = 5000
+        for i in range(n):
+            tile_info = dict(info, bounds=[i, 0, i + 1, 1])
+            raster_catalog.add(f"{i}.tif", tile_info)
+        assert len(raster_catalog) == n
+        assert raster_catalog.bounds.shape == (n, 4)
+        assert raster_catalog.bounds[:, 0].tolist() == list(range(n))
+        assert raster_catalog.get("1234.tif").bounds.left == 1234
+
+        # Buffers double when full, rather than growing on every add.
+        assert len(raster_catalog._buffers["bounds"]) < 2 * n
+        assert raster_catalog.bounds.base is raster_catalog._buffers["bounds"]
+
+        unpickled = pickle.loads(pickle.dumps(raster_catalog))
+        assert unpickled.bounds.shape == (n, 4)
+        unpickled.add("new.tif", info)
+        assert list(unpickled.get("new.tif").bounds) == info["bounds"]
+
+    def test_pickle(self):
+        raster_catalog = catalog.RasterCatalog()
+        with rasterio.open(EUDEM_TILE_PATH) as f:
+            raster_catalog.add(EUDEM_TILE_PATH, catalog.read_raster_info(f))
+        unpickled = pickle.loads(pickle.dumps(raster_catalog))
+        assert np.array_equal(unpickled.transforms, raster_catalog.transforms)
+        assert unpickled.get(EUDEM_TILE_PATH).crs == 3035
+        assert unpickled.get(EUDEM_TILE_PATH).transformer is not None
+
+    def test_transformers(self):
+        raster_catalog = catalog.RasterCatalog()
+        for path in [ETOPO1_GEOTIFF_PATH, EUDEM_TILE_PATH]:
+            with rasterio.open(path) as f:
+                raster_catalog.add(path, catalog.read_raster_info(f))
+                info = raster_catalog.get(path)
+                assert info.inv_transform == ~f.transform
+        assert raster_catalog.get(ETOPO1_GEOTIFF_PATH).transformer is None
+        transformer = raster_catalog.get(EUDEM_TILE_PATH).transformer
+        x, y = transformer.transform(10, 50)
+        assert (x, y) == utils.reproject_latlons(50, 10, epsg=3035)
+
+    def test_invalid_crs(self):
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            info = catalog.read_raster_info(f)
+        info["crs"] = 1
+        raster_catalog = catalog.RasterCatalog()
+        with pytest.raises(ValueError):
+            raster_catalog.add("a", info)
+        assert len(raster_catalog) == 0
+        assert raster_catalog.crs_list == []
@@ -0,0 +1,250 @@
+import functools
+import http.server
+import multiprocessing
+import os
+import re
+
+import numpy as np
+import pytest
+import rasterio
+
+from opentopodata import backend, cog, config
+
+
+ETOPO1_GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
+
+
+class _RangeHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file server with support for single Range requests.
+
+    Requested ranges are appended to a log file.
+    """
+
+    log_path = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if not match:
+            return super().do_GET()
+
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        start, stop = int(match.group(1)), int(match.group(2)) + 1
+        with open(path, "rb") as f:
+            f.seek(start)
+            data = f.read(stop - start)
+        with open(self.log_path, "a") as f:
+            f.write(f"{start} {stop}\n")
+
+        self.send_response(206)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        size = os.path.getsize(path)
+        self.send_header(
+            "Content-Range", f"bytes {start}-{start + len(data) - 1}/{size}"
+        )
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _serve(directory, log_path, port_queue):
+    handler = functools.partial(_RangeHandler, directory=directory)
+    _RangeHandler.log_path = log_path
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    port_queue.put(httpd.server_port)
+    httpd.serve_forever()
+
+
+class _Server:
+    def __init__(self, url, log_path):
+        self.url = url
+        self.log_path = log_path
+
+    def requested_ranges(self):
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path) as f:
+            return [tuple(map(int, line.split())) for line in f]
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Serve tmp_path over http.
+
+    GDAL holds the GIL while opening a file, so the server has to run in
+    another process.
+    """
+    log_path = str(tmp_path.parent / f"{tmp_path.name}-ranges.log")
+    ctx = multiprocessing.get_context("fork")
+    port_queue = ctx.Queue()
+    process = ctx.Process(
+        target=_serve, args=(str(tmp_path), log_path, port_queue), daemon=True
+    )
+    process.start()
+    port = port_queue.get(timeout=10)
+    yield _Server(f"http://127.0.0.1:{port}", log_path)
+    process.terminate()
+    process.join()
+
+
+def _write_geotiff(path, **kwargs):
+    """Copy the etopo1 test raster as a tiled geotiff, int16 by default."""
+    with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+        profile = f.profile
+        z = f.read(1)
+    z = np.round(z).astype("int16")
+    z[:5, :5] = -32768
+    profile.update(
+        driver="GTiff",
+        dtype="int16",
+        nodata=-32768,
+        tiled=True,
+        blockxsize=64,
+        blockysize=64,
+    )
+    profile.update(kwargs)
+    with rasterio.open(path, "w", **profile) as f:
+        f.write(z.astype(profile["dtype"]), 1)
+
+
+class TestCoalesceRanges:
+    def test_merges_adjacent(self):
+        merged = cog.coalesce_ranges([(0, 10), (10, 20)], max_gap=0)
+        assert merged == [(0, 20, [0, 1])]
+
+    def test_merges_small_gaps(self):
+        merged = cog.coalesce_ranges([(100, 110), (0, 10), (15, 20)], max_gap=5)
+        assert merged == [(0, 20, [1, 2]), (100, 110, [0])]
+
+    def test_empty(self):
+        assert cog.coalesce_ranges([]) == []
+
+
+class TestCogReader:
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"compress": "deflate", "predictor": 2},
+            {"compress": "deflate"},
+            {},
+        ],
+    )
+    def test_matches_gdal(self, server, tmp_path, kwargs):
+        url = server.url
+        _write_geotiff(tmp_path / "dem.tif", **kwargs)
+        windows = [
+            rasterio.windows.Window(0, 0, 10, 10),
+            rasterio.windows.Window(60, 60, 10, 10),
+            rasterio.windows.Window(100, 30, 260, 150),
+        ]
+
+        with rasterio.open(tmp_path / "dem.tif") as f:
+            expected = [backend._read_window(f, w) for w in windows]
+        with rasterio.open(cog.VSICURL_PREFIX + url + "/dem.tif") as f:
+            reader = cog.CogReader.from_dataset(f)
+            assert reader is not None
+            result = reader.read_windows(windows)
+
+        for z, z_expected in zip(result, expected):
+            np.testing.assert_array_equal(z, z_expected)
+
+    def test_unsupported_compression(self, server, tmp_path):
+        url = server.url
+        _write_geotiff(tmp_path / "dem.tif", compress="lzw")
+        with rasterio.open(cog.VSICURL_PREFIX + url + "/dem.tif") as f:
+            assert cog.CogReader.from_dataset(f) is None
+
+    def test_float_predictor_read_by_gdal(self, server, tmp_path):
+        url = server.url
+        _write_geotiff(
+            tmp_path / "dem.tif", compress="deflate", predictor=2, dtype="float32"
+        )
+        window = rasterio.windows.Window(100, 30, 260, 150)
+        with rasterio.open(tmp_path / "dem.tif") as f:
+            expected = backend._read_window(f, window)
+        with rasterio.open(cog.VSICURL_PREFIX + url + "/dem.tif") as f:
+            assert cog.CogReader.from_dataset(f) is None
+            result = list(backend._read_windows_uncached(f, [window]))[0]
+        np.testing.assert_array_equal(result, expected)
+
+    def test_local_file(self):
+        with rasterio.open(ETOPO1_GEOTIFF_PATH) as f:
+            assert cog.CogReader.from_dataset(f) is None
+
+    def test_coalesces_requests(self, server, tmp_path):
+        url = server.url
+        _write_geotiff(tmp_path / "dem.tif", compress="deflate")
+        with rasterio.open(cog.VSICURL_PREFIX + url + "/dem.tif") as f:
+            reader = cog.CogReader.from_dataset(f)
+            n_header_requests = len(server.requested_ranges())
+            blocks = [(r, c) for r in range(3) for c in range(6)]
+            z_blocks = reader.read_blocks(blocks)
+        assert set(z_blocks) == set(blocks)
+        n_block_requests = len(server.requested_ranges()) - n_header_requests
+        assert 0 < n_block_requests < len(blocks)
+
+
+class TestUrlDataset:
+    def test_matches_local(self, server, tmp_path):
+        url = server.url
+        _write_geotiff(tmp_path / "dem.tif", compress="deflate", predictor=2)
+        dataset = config.Dataset.from_config("remote", path=url + "/dem.tif")
+        assert isinstance(dataset, config.SingleFileDataset)
+
+        lats = np.array([-89.9, -45.3, 0.5, 12.25, 60, 89.9])
+        lons = np.array([-179.9, -120.7, 0.5, 33.3, 150, 179.9])
+        for interpolation in backend.INTERPOLATION_METHODS:
+            z, in_bounds = backend._sample_dataset(lats, lons, dataset, interpolation)
+            z_local, in_bounds_local = backend._sample_path(
+                lats, lons, str(tmp_path / "dem.tif"), interpolation
+            )
+            np.testing.assert_array_equal(z, z_local)
+            np.testing.assert_array_equal(in_bounds, in_bounds_local)
+
+    def test_invalid_url(self, server):
+        url = server.url
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config("remote", path=url + "/missing.tif")
+
+    def test_modified_file_not_served_from_cache(self, server, tmp_path, monkeypatch):
+        monkeypatch.setattr(cog, "REMOTE_VERSION_TTL_S", 0)
+        monkeypatch.setattr(backend, "BLOCK_CACHE", backend.BlockCache(10**9))
+        path = tmp_path / "dem.tif"
+        _write_geotiff(path)
+        dataset = config.Dataset.from_config("remote", path=server.url + "/dem.tif")
+        lats = np.array([12.25])
+        lons = np.array([33.3])
+        z, _ = backend._sample_dataset(lats, lons, dataset, "nearest")
+        assert len(backend.BLOCK_CACHE) > 0
+
+        with rasterio.open(path, "r+") as f:
+            f.write(f.read(1) + 1, 1)
+        os.utime(path, (0, 0))
+        z_modified, _ = backend._sample_dataset(lats, lons, dataset, "nearest")
+        np.testing.assert_array_equal(z_modified, z + 1)
+
+
+class TestRemoteVersion:
+    def test_cached_for_ttl(self, server, tmp_path, monkeypatch):
+        path = tmp_path / "dem.tif"
+        path.write_bytes(b"dem")
+        url = server.url + "/dem.tif"
+        monkeypatch.setattr(cog, "_REMOTE_VERSIONS", {})
+        version = cog.remote_version(url)
+        assert version
+
+        os.utime(path, (0, 0))
+        assert cog.remote_version(url) == version
+        monkeypatch.setattr(cog, "REMOTE_VERSION_TTL_S", 0)
+        assert cog.remote_version(url) != version
+
+    def test_unreachable(self, monkeypatch):
+        monkeypatch.setattr(cog, "_REMOTE_VERSIONS", {})
+        version = cog.remote_version("http://127.0.0.1:1/dem.tif")
+        assert version.startswith("ttl-")
@@ -1,10 +1,13 @@
 from decimal import Decimal
 import os
+import pickle
 import re
+import shutil
 
 import numpy as np
 import pytest
-from opentopodata import config
+import rasterio
+from opentopodata import config, tilecache, utils
 from unittest.mock import patch
 
 
@@ -127,6 +130,18 @@ class TestLoadConfig:
             with patch("opentopodata.config.CONFIG_PATH", path):
                 config.load_config()
 
+    def test_invalid_read_threads(self):
+        path = "tests/data/configs/invalid-read-threads.yaml"
+        with pytest.raises(config.ConfigError):
+            with patch("opentopodata.config.CONFIG_PATH", path):
+                config.load_config()
+
+    def test_invalid_preload_datasets(self):
+        path = "tests/data/configs/invalid-preload-datasets.yaml"
+        with pytest.raises(config.ConfigError):
+            with patch("opentopodata.config.CONFIG_PATH", path):
+                config.load_config()
+
     def test_complete_dataset(self, patch_config):
         conf = config.load_config()
         assert "datasets" in conf
@@ -144,6 +159,10 @@ class TestLoadConfig:
                 conf["access_control_allow_origin"]
                 != config.DEFAULTS["access_control_allow_origin"]
             )
+            assert conf["max_open_files"] != config.DEFAULTS["max_open_files"]
+            assert conf["block_cache_size_mb"] != config.DEFAULTS["block_cache_size_mb"]
+            assert conf["max_read_threads"] != config.DEFAULTS["max_read_threads"]
+            assert conf["preload_datasets"] != config.DEFAULTS["preload_datasets"]
 
     def test_defaults(self):
         path = "tests/data/configs/no-optional-params.yaml"
@@ -157,6 +176,11 @@ class TestLoadConfig:
                 conf["access_control_allow_origin"]
                 == config.DEFAULTS["access_control_allow_origin"]
             )
+            assert conf["max_open_files"] == config.DEFAULTS["max_open_files"]
+            assert conf["block_cache_size_mb"] == config.DEFAULTS["block_cache_size_mb"]
+            assert conf["shared_block_cache_path"] is None
+            assert conf["max_read_threads"] == config.DEFAULTS["max_read_threads"]
+            assert conf["preload_datasets"] == config.DEFAULTS["preload_datasets"]
 
 
 class TestLoadDatasets:
@@ -164,6 +188,21 @@ class TestLoadDatasets:
         config.load_datasets()
 
 
+class TestLoadDataset:
+    def test_only_named_dataset_built(self, patch_config):
+        with patch(
+            "opentopodata.config.Dataset.from_config",
+            wraps=config.Dataset.from_config,
+        ) as from_config:
+            dataset = config.load_dataset("srtm90subset")
+        assert dataset.name == "srtm90subset"
+        assert from_config.call_count == 1
+
+    def test_missing_dataset(self, patch_config):
+        with pytest.raises(config.ConfigError):
+            config.load_dataset("not-a-dataset")
+
+
 class TestDataset:
     def test_missing_dataset(self):
         with pytest.raises(config.ConfigError):
@@ -182,6 +221,75 @@ class TestDataset:
         dataset = config.Dataset.from_config(name=name, path=SRTM_FOLDER)
         assert isinstance(dataset, config.TiledDataset)
         assert dataset.name == name
+        assert dataset.max_read_threads == config.DEFAULTS["max_read_threads"]
+
+    def test_local_cache(self, tmp_path):
+        dataset = config.Dataset.from_config(
+            "test", SRTM_FOLDER, local_cache_path=str(tmp_path)
+        )
+        assert dataset.tile_cache.cache_dir == str(tmp_path)
+        assert dataset.tile_cache.max_bytes == 10 * 1024**3
+        assert config.Dataset.from_config("test", SRTM_FOLDER).tile_cache is None
+
+    def test_invalid_local_cache_size(self, tmp_path):
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config(
+                "test",
+                SRTM_FOLDER,
+                local_cache_path=str(tmp_path),
+                local_cache_size_gb=0,
+            )
+
+    def test_unzip_cache(self, tmp_path):
+        dataset = config.Dataset.from_config(
+            "test", SRTM_FOLDER, unzip_cache_path=str(tmp_path)
+        )
+        assert isinstance(dataset.tile_cache, tilecache.UnzipCache)
+        assert dataset.tile_cache.max_bytes == 10 * 1024**3
+
+    def test_local_and_unzip_cache(self, tmp_path):
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config(
+                "test",
+                SRTM_FOLDER,
+                local_cache_path=str(tmp_path / "local"),
+                unzip_cache_path=str(tmp_path / "unzip"),
+            )
+
+    def test_in_memory(self):
+        folder = os.path.dirname(ETOPO1_GEOTIFF_PATH)
+        dataset = config.Dataset.from_config("test", folder, in_memory=True)
+        assert dataset.in_memory
+        assert dataset.in_memory_overview is None
+        assert not config.Dataset.from_config("test", folder).in_memory
+
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {"in_memory": "yes"},
+            {"in_memory_overview": 0},
+            {"in_memory": True, "in_memory_overview": -1},
+            {"in_memory": True, "in_memory_overview": 0},
+        ],
+    )
+    def test_invalid_in_memory(self, kwargs):
+        folder = os.path.dirname(ETOPO1_GEOTIFF_PATH)
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config("test", folder, **kwargs)
+
+    def test_in_memory_tiled(self):
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config("test", SRTM_FOLDER, in_memory=True)
+
+    def test_max_read_threads(self):
+        dataset = config.Dataset.from_config("test", SRTM_FOLDER, max_read_threads=3)
+        assert dataset.max_read_threads == 3
+
+    def test_global_max_read_threads(self):
+        path = "tests/data/configs/non-default-values.yaml"
+        with patch("opentopodata.config.CONFIG_PATH", path):
+            datasets = config.load_datasets()
+        assert datasets["srtm90subset"].max_read_threads == 4
 
     def test_filename_tile_regex(self):
         matching_filenames = [
@@ -225,6 +333,82 @@ class TestSingleFileDataset:
         assert all([p == ETOPO1_GEOTIFF_PATH for p in tile_paths])
 
 
+class TestIndexedDataset:
+    @pytest.fixture
+    def vendor_folder(self, tmp_path):
+        utm_folder = "tests/data/datasets/test-srtm90m-subset-utm/"
+        shutil.copy(utm_folder + "N00E010.tif", tmp_path / "dem_west.tif")
+        shutil.copy(utm_folder + "USGS_13_n00e011.tif", tmp_path / "dem_east.tif")
+        return tmp_path
+
+    def test_from_config(self, vendor_folder):
+        dataset = config.Dataset.from_config("test", str(vendor_folder))
+        assert isinstance(dataset, config.IndexedDataset)
+        assert dataset.tile_paths == sorted(dataset.tile_paths)
+
+    def test_location_paths(self, vendor_folder):
+        dataset = config.Dataset.from_config("test", str(vendor_folder))
+        lats = [0.1, 0.9, 0.5, 5, np.nan]
+        lons = [10.99, 11.1, 10.5, 5, 10.5]
+        paths = dataset.location_paths(lats, lons)
+        assert paths == [
+            str(vendor_folder / "dem_west.tif"),
+            str(vendor_folder / "dem_east.tif"),
+            str(vendor_folder / "dem_west.tif"),
+            None,
+            None,
+        ]
+
+    def test_matches_tiled(self, vendor_folder):
+        indexed = config.Dataset.from_config("test", str(vendor_folder))
+        tiled = config.Dataset.from_config(
+            "test", "tests/data/datasets/test-srtm90m-subset-utm/"
+        )
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-0.5, 1.5, 1000)
+        lons = rng.uniform(9.5, 12.5, 1000)
+        indexed_paths = indexed.location_paths(lats, lons)
+        tiled_paths = tiled.location_paths(lats, lons)
+        renamed = {"N00E010.tif": "dem_west.tif", "USGS_13_n00e011.tif": "dem_east.tif"}
+        for indexed_path, tiled_path, lat, lon in zip(
+            indexed_paths, tiled_paths, lats, lons
+        ):
+            if indexed_path is None:
+                continue
+            assert (
+                os.path.basename(indexed_path) == renamed[os.path.basename(tiled_path)]
+            )
+
+    def test_antimeridian(self):
+        # Pacific-centred mercator.
+        boxes = config.IndexedDataset._wgs84_boxes(
+            3832, rasterio.coords.BoundingBox(3.2e6, 0, 3.5e6, 1e5)
+        )
+        assert len(boxes) == 2
+        assert boxes[0][2] == 180
+        assert boxes[1][0] == -180
+
+    def test_invalid_file(self, vendor_folder):
+        (vendor_folder / "readme.txt").write_text("Not a raster.")
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config("test", str(vendor_folder))
+
+
+class TestMaxReprojectionError:
+    @pytest.mark.parametrize("value", [0, -1, "0.1", True])
+    def test_invalid(self, value):
+        with pytest.raises(config.ConfigError):
+            config.Dataset.from_config(
+                "test", SRTM_FOLDER, max_reprojection_error_px=value
+            )
+
+    def test_passed_to_catalog(self):
+        dataset = config.Dataset.from_config(
+            "test", SRTM_FOLDER, max_reprojection_error_px=0.125
+        )
+        assert dataset.catalog.max_error_px == 0.125
+
+
 class TestTiledDataset:
     def test_float_fractional_tile_size(self):
         with pytest.raises(config.ConfigError):
@@ -232,7 +416,7 @@ class TestTiledDataset:
                 name="test",
                 path=SRTM_FOLDER,
                 tile_paths=[],
-                filename_epsg=None,
+                filename_epsg=4326,
                 filename_tile_size=0.25,
             )
 
@@ -242,7 +426,7 @@ class TestTiledDataset:
             name="test",
             path=SRTM_FOLDER,
             tile_paths=[],
-            filename_epsg=None,
+            filename_epsg=4326,
             filename_tile_size=tile_size,
         )
         assert dataset.filename_tile_size == int(tile_size)
@@ -254,11 +438,33 @@ class TestTiledDataset:
             name="test",
             path=SRTM_FOLDER,
             tile_paths=[],
-            filename_epsg=None,
+            filename_epsg=4326,
             filename_tile_size=tile_size,
         )
         assert dataset.filename_tile_size == Decimal(tile_size)
 
+    def test_invalid_filename_epsg(self):
+        with pytest.raises(config.ConfigError):
+            config.TiledDataset(
+                name="test",
+                path=SRTM_FOLDER,
+                tile_paths=[],
+                filename_epsg=0,
+                filename_tile_size=1,
+            )
+
+    def test_pickle(self):
+        dataset = config.Dataset.from_config(
+            name="srtm", path=SRTM_FOLDER, filename_epsg=3035
+        )
+        unpickled = pickle.loads(pickle.dumps(dataset))
+        assert unpickled._filename_transformer is not None
+        lats = [0.1, 50.9]
+        lons = [10.99, 11.1]
+        assert unpickled.location_paths(lats, lons) == dataset.location_paths(
+            lats, lons
+        )
+
     def test_location_paths(self):
         dataset = config.Dataset.from_config(name="srtm", path=SRTM_FOLDER)
         lats = [0.1, 0.9]
@@ -277,6 +483,46 @@ class TestTiledDataset:
         assert len(paths) == 1
         assert paths[0] is None
 
+    @pytest.mark.parametrize("tile_size", [1, 5, "0.25", "2.5"])
+    def test_location_paths_match_decimal_floor(self, tile_size):
+        size = Decimal(tile_size)
+        rng = np.random.default_rng(0)
+        corners = set(
+            (i * size, j * size) for i, j in rng.integers(-8, 8, size=(40, 2))
+        )
+        tile_paths = []
+        for northing, easting in corners:
+            ns = "N" if northing >= 0 else "S"
+            ew = "E" if easting >= 0 else "W"
+            northing_str = str(abs(northing)).replace(".", "x")
+            easting_str = str(abs(easting)).replace(".", "x")
+            tile_paths.append(f"{ns}{northing_str}{ew}{easting_str}.tif")
+        dataset = config.TiledDataset(
+            "test",
+            "",
+            tile_paths=tile_paths,
+            filename_epsg=4326,
+            filename_tile_size=tile_size,
+        )
+
+        # Include points exactly on tile edges.
+        lats = np.concatenate([rng.uniform(-9, 9, 1000) * float(size), [0, -0.0]])
+        lons = np.concatenate([rng.uniform(-9, 9, 1000) * float(size), [0, 0]])
+        lats[:50] = rng.integers(-8, 8, 50) * float(size)
+        lookup = dict(zip(corners, tile_paths))
+        expected = [
+            lookup.get(
+                (utils.decimal_base_floor(y, size), utils.decimal_base_floor(x, size))
+            )
+            for x, y in zip(lons, lats)
+        ]
+        assert dataset.location_paths(lats, lons) == expected
+        assert any(p is not None for p in expected)
+
+    def test_location_paths_nan(self):
+        dataset = config.Dataset.from_config(name="srtm", path=SRTM_FOLDER)
+        assert dataset.location_paths([np.nan, 0.5], [10.5, np.inf]) == [None, None]
+
     @pytest.mark.parametrize(
         "filename,northing,easting",
         [
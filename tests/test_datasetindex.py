@@ -0,0 +1,137 @@
+import os
+from glob import glob
+from unittest.mock import Mock, patch
+
+import pytest
+
+from opentopodata import config, datasetindex
+
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    path = tmp_path / "dataset"
+    (path / "sub" / "deeper").mkdir(parents=True)
+    (path / ".hidden").mkdir()
+    for rel_path in [
+        "a.tif",
+        "sub/b.tif",
+        "sub/deeper/c.tif",
+        ".d.tif",
+        ".hidden/e.tif",
+    ]:
+        (path / rel_path).write_text(rel_path)
+    return str(path) + "/"
+
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "index")
+
+
+class TestDatasetIndex:
+    def test_files_match_glob(self, dataset_path):
+        index = datasetindex.DatasetIndex(dataset_path)
+        paths = glob(os.path.join(dataset_path, "**", "*"), recursive=True)
+        assert index.files() == sorted(p for p in paths if os.path.isfile(p))
+
+    def test_unchanged_folders_not_listed(self, dataset_path, index_dir):
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        files = index.files()
+        index.save()
+
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        with patch("os.scandir", side_effect=AssertionError):
+            assert index.files() == files
+
+    def test_changed_folder_listed(self, dataset_path, index_dir):
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        index.files()
+        index.save()
+
+        new_path = os.path.join(dataset_path, "sub", "new.tif")
+        with open(new_path, "w"):
+            pass
+        os.utime(os.path.dirname(new_path), ns=(0, 1))
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        assert new_path in index.files()
+
+    def test_removed_folder_forgotten(self, dataset_path, index_dir):
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        index.files()
+        os.remove(os.path.join(dataset_path, "sub", "deeper", "c.tif"))
+        os.rmdir(os.path.join(dataset_path, "sub", "deeper"))
+        os.utime(os.path.join(dataset_path, "sub"), ns=(0, 1))
+        assert len(index.files()) == 2
+        assert "sub/deeper" not in index._dirs
+
+    def test_metadata_reused(self, dataset_path, index_dir):
+        path = os.path.join(dataset_path, "a.tif")
+        read_metadata = Mock(return_value={"n_overviews": 2})
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        assert index.metadata(path, read_metadata) == {"n_overviews": 2}
+        index.save([path])
+
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        assert index.metadata(path, read_metadata) == {"n_overviews": 2}
+        assert read_metadata.call_count == 1
+
+        os.utime(path, ns=(0, 1))
+        index.metadata(path, read_metadata)
+        assert read_metadata.call_count == 2
+
+    def test_unused_metadata_dropped(self, dataset_path, index_dir):
+        path = os.path.join(dataset_path, "a.tif")
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        index.metadata(path, lambda p: {})
+        index.save([])
+        assert not index._files
+
+    def test_invalid_index_ignored(self, dataset_path, index_dir):
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        os.makedirs(index_dir)
+        with open(index.index_path, "w") as f:
+            f.write("{")
+        index = datasetindex.DatasetIndex(dataset_path, index_dir)
+        assert len(index.files()) == 3
+
+
+class TestLoadWithIndex:
+    def test_indexed_dataset_not_reopened(self, index_dir):
+        path = "tests/data/datasets/test-srtm90m-subset-utm/"
+        dataset = config.IndexedDataset(
+            "test",
+            path,
+            tile_paths=sorted(glob(path + "*.tif")),
+        )
+
+        # Force an IndexedDataset by faking non-SRTM names.
+        with patch("opentopodata.config.FILENAME_TILE_REGEX", "^$"):
+            first = config.Dataset.from_config(
+                "test", path, dataset_index_path=index_dir
+            )
+            with patch("rasterio.open", side_effect=AssertionError):
+                second = config.Dataset.from_config(
+                    "test", path, dataset_index_path=index_dir
+                )
+        assert isinstance(second, config.IndexedDataset)
+        lats, lons = [0.5, 0.5], [10.5, 11.5]
+        assert second.location_paths(lats, lons) == dataset.location_paths(lats, lons)
+        assert first.location_paths(lats, lons) == dataset.location_paths(lats, lons)
+
+    def test_single_file_not_reopened(self, index_dir):
+        path = "tests/data/datasets/test-etopo1-resampled-1deg/"
+        config.Dataset.from_config("test", path, dataset_index_path=index_dir)
+        with patch("rasterio.open", side_effect=AssertionError):
+            dataset = config.Dataset.from_config(
+                "test", path, dataset_index_path=index_dir
+            )
+        assert isinstance(dataset, config.SingleFileDataset)
+
+    def test_unwritable_index_ignored(self, tmp_path):
+        index_dir = tmp_path / "index"
+        index_dir.write_text("Not a folder.")
+        path = "tests/data/datasets/test-srtm90m-subset/"
+        dataset = config.Dataset.from_config(
+            "test", path, dataset_index_path=str(index_dir)
+        )
+        assert isinstance(dataset, config.TiledDataset)
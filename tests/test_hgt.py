@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+import rasterio
+
+from opentopodata import backend, hgt, utils
+
+
+SRTM_PATH = "tests/data/datasets/test-srtm90m-subset/N00E010.hgt"
+
+
+class TestIsHgt:
+    def test_hgt(self):
+        assert hgt.is_hgt(SRTM_PATH)
+        assert hgt.is_hgt("data/s45w120.HGT")
+
+    def test_not_hgt(self):
+        assert not hgt.is_hgt(SRTM_PATH + ".zip")
+        assert not hgt.is_hgt("data/N00E010.tif")
+        assert not hgt.is_hgt("data/dem.hgt")
+
+
+class TestOpenTile:
+    def test_georeferencing_matches_gdal(self):
+        tile = hgt.open_tile(SRTM_PATH)
+        with rasterio.open(SRTM_PATH) as f:
+            assert tile.transform == f.transform
+            assert tile.bounds == f.bounds
+            assert tile.res == f.res
+            assert tile.crs == f.crs
+            assert (tile.height, tile.width) == f.shape
+            assert tile.nodata == f.nodata
+
+    def test_read_window_matches_gdal(self):
+        window = rasterio.windows.Window(100, 200, 300, 50)
+        tile = hgt.open_tile(SRTM_PATH)
+        with rasterio.open(SRTM_PATH) as f:
+            np.testing.assert_array_equal(
+                tile.read_window(window), backend._read_window(f, window)
+            )
+
+    def test_reused(self):
+        assert hgt.open_tile(SRTM_PATH) is hgt.open_tile(SRTM_PATH)
+
+    def test_remapped_if_discarded(self):
+        tile = hgt.open_tile(SRTM_PATH)
+        utils.MAPPED_FILES.discard([SRTM_PATH])
+        assert hgt.open_tile(SRTM_PATH) is not tile
+
+    def test_invalid_size(self, tmp_path):
+        path = tmp_path / "N00E010.hgt"
+        path.write_bytes(b"\0" * 10)
+        assert hgt.open_tile(str(path)) is None
+
+    def test_missing(self, tmp_path):
+        assert hgt.open_tile(str(tmp_path / "N00E010.hgt")) is None
+
+    def test_negative_corner(self, tmp_path):
+        path = tmp_path / "S12W077.hgt"
+        path.write_bytes(b"\0" * 2 * 11 * 11)
+        tile = hgt.open_tile(str(path))
+        assert tile.bounds.left == pytest.approx(-77 - 0.05)
+        assert tile.bounds.bottom == pytest.approx(-12 - 0.05)
+
+
+class TestSampleHgt:
+    @pytest.mark.parametrize("interpolation", backend.INTERPOLATION_METHODS.keys())
+    def test_matches_gdal(self, interpolation):
+        rng = np.random.default_rng(1)
+        lats = np.concatenate([rng.uniform(-0.01, 1.01, 200), [0, 1, 0.5, 1.5]])
+        lons = np.concatenate([rng.uniform(9.99, 11.01, 200), [10, 11, 10.5, 10.5]])
+
+        z, in_bounds = backend._sample_path(lats, lons, SRTM_PATH, interpolation)
+        with patch("opentopodata.hgt.is_hgt", return_value=False):
+            z_gdal, in_bounds_gdal = backend._sample_path(
+                lats, lons, SRTM_PATH, interpolation
+            )
+        np.testing.assert_array_equal(z, z_gdal)
+        np.testing.assert_array_equal(in_bounds, in_bounds_gdal)
+        assert not in_bounds.all()
+
+    def test_skips_gdal(self):
+        with patch("rasterio.open") as mock_open:
+            backend._sample_path(np.array([0.5]), np.array([10.5]), SRTM_PATH, "cubic")
+        mock_open.assert_not_called()
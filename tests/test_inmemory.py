@@ -0,0 +1,142 @@
+import shutil
+from unittest.mock import Mock, patch
+
+import numpy as np
+import pytest
+import rasterio
+
+from opentopodata import api, backend, config, inmemory
+
+
+ETOPO1_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
+NODATA_PATH = "tests/data/datasets/test-nodata/nodata.geotiff"
+
+
+@pytest.fixture
+def etopo1_with_overview(tmp_path):
+    path = str(tmp_path / "etopo1" / "etopo1.tif")
+    (tmp_path / "etopo1").mkdir()
+    shutil.copy(ETOPO1_PATH, path)
+    with rasterio.open(path, "r+") as f:
+        f.build_overviews([2], rasterio.enums.Resampling.average)
+    return path
+
+
+class TestMemoryRaster:
+    @pytest.mark.parametrize("path", [ETOPO1_PATH, NODATA_PATH])
+    def test_matches_gdal(self, path):
+        raster = inmemory.MemoryRaster(path)
+        with rasterio.open(path) as f:
+            assert raster.transform == f.transform
+            assert raster.bounds == f.bounds
+            assert raster.crs == f.crs
+            window = rasterio.windows.Window(0, 0, f.width, f.height)
+            np.testing.assert_array_equal(
+                raster.read_window(window), backend._read_window(f, window)
+            )
+
+    def test_read_only(self):
+        raster = inmemory.MemoryRaster(ETOPO1_PATH)
+        with pytest.raises(ValueError):
+            raster.z[0, 0] = 0
+
+    def test_overview(self, etopo1_with_overview):
+        raster = inmemory.MemoryRaster(etopo1_with_overview, overview_level=0)
+        with rasterio.open(etopo1_with_overview) as f:
+            assert raster.height == -(-f.height // 2)
+            assert raster.bounds == f.bounds
+
+    def test_load_reused(self):
+        raster = inmemory.load(ETOPO1_PATH)
+        assert inmemory.load(ETOPO1_PATH) is raster
+
+
+class TestSampleInMemory:
+    @pytest.mark.parametrize("interpolation", ["nearest", "bilinear", "cubic"])
+    def test_matches_gdal(self, interpolation):
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-90, 90, 200)
+        lons = rng.uniform(-180, 180, 200)
+        folder = "tests/data/datasets/test-etopo1-resampled-1deg/"
+        dataset = config.Dataset.from_config("etopo1", folder)
+        in_memory_dataset = config.Dataset.from_config("etopo1", folder, in_memory=True)
+        inmemory.load(ETOPO1_PATH)
+
+        z, in_bounds = backend._sample_dataset(lats, lons, dataset, interpolation)
+        with patch("rasterio.open") as mock_open:
+            z_mem, in_bounds_mem = backend._sample_dataset(
+                lats, lons, in_memory_dataset, interpolation
+            )
+        mock_open.assert_not_called()
+        np.testing.assert_array_equal(z_mem, z)
+        np.testing.assert_array_equal(in_bounds_mem, in_bounds)
+
+    def test_info_reused(self):
+        f = inmemory.load(ETOPO1_PATH)
+        with patch("opentopodata.catalog.read_raster_info") as mock_read:
+            backend._sample_raster(np.array([10.0]), np.array([10.0]), f, "nearest")
+        mock_read.assert_not_called()
+        assert f.info.transform == f.transform
+
+    def test_overview(self, etopo1_with_overview):
+        folder = etopo1_with_overview.rsplit("/", 1)[0]
+        dataset = config.Dataset.from_config(
+            "etopo1", folder, in_memory=True, in_memory_overview=0
+        )
+        z, in_bounds = backend._sample_dataset(
+            np.array([10.0]), np.array([10.0]), dataset, "nearest"
+        )
+        assert in_bounds.all()
+        assert np.isfinite(z).all()
+        assert inmemory._RASTERS[etopo1_with_overview].overview_level == 0
+
+
+class TestPreload:
+    def test_preloads_in_memory_datasets(self, tmp_path):
+        config_path = tmp_path / "config.yaml"
+        folder = "tests/data/datasets/test-etopo1-resampled-1deg/"
+        config_path.write_text(
+            f"datasets:\n- name: etopo1\n  path: {folder}\n  in_memory: true\n"
+        )
+        with (
+            patch("opentopodata.config.CONFIG_PATH", str(config_path)),
+            patch.dict("opentopodata.inmemory._RASTERS", clear=True),
+        ):
+            api._preload_in_memory_datasets()
+            assert list(inmemory._RASTERS) == [ETOPO1_PATH]
+
+    @pytest.mark.parametrize("max_rss_bytes", [1000, 10**9])
+    def test_warns_over_reload_limit(self, tmp_path, caplog, max_rss_bytes):
+        config_path = tmp_path / "config.yaml"
+        folder = "tests/data/datasets/test-etopo1-resampled-1deg/"
+        config_path.write_text(
+            f"datasets:\n- name: etopo1\n  path: {folder}\n  in_memory: true\n"
+        )
+        with (
+            patch("opentopodata.config.CONFIG_PATH", str(config_path)),
+            patch.dict("opentopodata.inmemory._RASTERS", clear=True),
+            patch(
+                "opentopodata.api._uwsgi_reload_on_rss_bytes",
+                return_value=max_rss_bytes,
+            ),
+        ):
+            api._preload_in_memory_datasets()
+        assert ("reload-on-rss" in caplog.text) == (max_rss_bytes == 1000)
+
+    @pytest.mark.parametrize(
+        "opt, expected",
+        [
+            ({"reload-on-rss": b"512"}, 512 * 1024**2),
+            ({"reload-on-rss": [b"256", b"512"]}, 512 * 1024**2),
+            ({"reload-on-rss": b"0"}, None),
+            ({}, None),
+        ],
+    )
+    def test_reload_on_rss(self, opt, expected):
+        with patch.dict("sys.modules", {"uwsgi": Mock(opt=opt)}):
+            assert api._uwsgi_reload_on_rss_bytes() == expected
+        assert api._uwsgi_reload_on_rss_bytes() is None
+
+    def test_invalid_config_ignored(self):
+        with patch("opentopodata.config.CONFIG_PATH", "tests/data/configs/missing"):
+            api._preload_in_memory_datasets()
@@ -0,0 +1,129 @@
+import multiprocessing
+import os
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from opentopodata import backend, sharedcache
+
+
+ETOPO1_GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
+MB = 1024**2
+
+
+def _put_block(path, value):
+    cache = sharedcache.SharedBlockCache(path, MB)
+    cache.put_many("a", None, {(0, 0): np.full((4, 4), value)})
+
+
+class TestSharedBlockCache:
+    def test_roundtrip(self, tmp_path):
+        cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), MB)
+        z = np.arange(12, dtype=float).reshape(3, 4)
+        z[0, 0] = np.nan
+        cache.put_many("a", 1, {(2, 3): z})
+        found = cache.get_many("a", 1, [(2, 3), (0, 0)])
+        assert list(found) == [(2, 3)]
+        np.testing.assert_array_equal(found[(2, 3)], z)
+        assert cache.hits == 1
+        assert cache.misses == 1
+
+    def test_modified_file_is_miss(self, tmp_path):
+        cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), MB)
+        cache.put_many("a", 1, {(0, 0): np.zeros((2, 2))})
+        assert not cache.get_many("a", 2, [(0, 0)])
+        assert not cache.get_many("b", 1, [(0, 0)])
+
+    def test_disabled(self, tmp_path):
+        cache = sharedcache.SharedBlockCache()
+        cache.put_many("a", 1, {(0, 0): np.zeros((2, 2))})
+        assert not cache.get_many("a", 1, [(0, 0)])
+        assert not cache.enabled
+
+    def test_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / "cache")
+        cache = sharedcache.SharedBlockCache(path, MB)
+        assert not cache.get_many("a", None, [(0, 0)])
+
+        ctx = multiprocessing.get_context("fork")
+        process = ctx.Process(target=_put_block, args=(path, 7))
+        process.start()
+        process.join()
+        assert process.exitcode == 0
+
+        found = cache.get_many("a", None, [(0, 0)])
+        np.testing.assert_array_equal(found[(0, 0)], np.full((4, 4), 7))
+
+    def test_reopened_after_fork(self, tmp_path):
+        cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), MB)
+        cache.put_many("a", None, {(0, 0): np.zeros((2, 2))})
+        file_before = cache._file
+        with patch("os.getpid", return_value=-1):
+            assert cache.get_many("a", None, [(0, 0)])
+        assert cache._file is not file_before
+
+    def test_oldest_blocks_overwritten(self, tmp_path):
+        cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), MB)
+        z_blocks = {(i, 0): np.full((64, 64), i) for i in range(64)}
+        for block, z in z_blocks.items():
+            cache.put_many("a", None, {block: z})
+
+        found = cache.get_many("a", None, list(z_blocks))
+        assert (0, 0) not in found
+        assert (63, 0) in found
+        assert cache.evictions > 0
+        for block, z in found.items():
+            np.testing.assert_array_equal(z, z_blocks[block])
+
+    def test_overwriting_same_block_not_eviction(self, tmp_path):
+        cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), MB)
+        for i in range(64):
+            cache.put_many("a", None, {(0, 0): np.full((64, 64), i)})
+        found = cache.get_many("a", None, [(0, 0)])
+        np.testing.assert_array_equal(found[(0, 0)], np.full((64, 64), 63))
+        assert cache.evictions == 0
+
+    def test_large_blocks_not_cached(self, tmp_path):
+        cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), MB)
+        cache.put_many("a", None, {(0, 0): np.zeros((512, 512))})
+        assert not cache.get_many("a", None, [(0, 0)])
+
+    def test_layout_change_replaces_file(self, tmp_path):
+        path = str(tmp_path / "cache")
+        old_cache = sharedcache.SharedBlockCache(path, MB)
+        old_cache.put_many("a", None, {(0, 0): np.ones((2, 2))})
+
+        new_cache = sharedcache.SharedBlockCache(path, 2 * MB)
+        assert not new_cache.get_many("a", None, [(0, 0)])
+        new_cache.put_many("a", None, {(0, 1): np.ones((2, 2))})
+
+        # The old mapping is still readable.
+        assert old_cache.get_many("a", None, [(0, 0)])
+        assert os.path.getsize(path) > 2 * MB
+
+
+class TestBackendSharedCache:
+    @pytest.mark.parametrize("interpolation", ["nearest", "cubic"])
+    def test_matches_uncached(self, tmp_path, interpolation):
+        rng = np.random.default_rng(0)
+        lats = rng.uniform(-89, 89, 50)
+        lons = rng.uniform(-179, 179, 50)
+        z_uncached, _ = backend._sample_path(
+            lats, lons, ETOPO1_GEOTIFF_PATH, interpolation
+        )
+
+        shared_cache = sharedcache.SharedBlockCache(str(tmp_path / "cache"), 64 * MB)
+        with (
+            patch("opentopodata.backend.SHARED_BLOCK_CACHE", shared_cache),
+            patch("opentopodata.backend.BLOCK_CACHE", backend.BlockCache(0)),
+        ):
+            z_miss, _ = backend._sample_path(
+                lats, lons, ETOPO1_GEOTIFF_PATH, interpolation
+            )
+            z_hit, _ = backend._sample_path(
+                lats, lons, ETOPO1_GEOTIFF_PATH, interpolation
+            )
+        assert shared_cache.hits > 0
+        np.testing.assert_array_equal(z_miss, z_uncached)
+        np.testing.assert_array_equal(z_hit, z_uncached)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from opentopodata import spatialindex
+
+
+def _brute_force(boxes, xs, ys):
+    matches = [
+        (i, j)
+        for i, (x, y) in enumerate(zip(xs, ys))
+        for j, (left, bottom, right, top) in enumerate(boxes)
+        if left <= x <= right and bottom <= y <= top
+    ]
+    return np.array(matches, dtype=int).reshape(-1, 2)
+
+
+class TestSTRtree:
+    @pytest.mark.parametrize("n_boxes", [0, 1, 15, 16, 17, 300, 5000])
+    def test_matches_brute_force(self, n_boxes):
+        rng = np.random.default_rng(n_boxes)
+        lefts = rng.uniform(-180, 170, n_boxes)
+        bottoms = rng.uniform(-90, 80, n_boxes)
+        sizes = rng.uniform(0.1, 10, (n_boxes, 2))
+        boxes = np.column_stack(
+            [lefts, bottoms, lefts + sizes[:, 0], bottoms + sizes[:, 1]]
+        )
+        xs = rng.uniform(-180, 180, 500)
+        ys = rng.uniform(-90, 90, 500)
+
+        tree = spatialindex.STRtree(boxes)
+        point_indices, box_indices = tree.query_points(xs, ys)
+        expected = _brute_force(boxes, xs, ys)
+        np.testing.assert_array_equal(point_indices, expected[:, 0])
+        np.testing.assert_array_equal(box_indices, expected[:, 1])
+
+    def test_edges_inclusive(self):
+        tree = spatialindex.STRtree([(0, 0, 1, 1), (1, 0, 2, 1)])
+        point_indices, box_indices = tree.query_points([1, 2, 2.5], [1, 0, 0])
+        assert point_indices.tolist() == [0, 0, 1]
+        assert box_indices.tolist() == [0, 1, 1]
+
+    def test_nan(self):
+        tree = spatialindex.STRtree([(0, 0, 1, 1)])
+        point_indices, _ = tree.query_points([np.nan, 0.5], [0.5, np.nan])
+        assert not len(point_indices)
@@ -0,0 +1,156 @@
+import os
+import time
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from opentopodata import tilecache
+
+
+SRTM_PATH = "tests/data/datasets/test-srtm90m-subset/N00E010.hgt"
+SRTM_ZIP_PATH = "tests/data/datasets/test-srtm90m-subset/N00E011.hgt.zip"
+ETOPO1_GEOTIFF_PATH = "tests/data/datasets/test-etopo1-resampled-1deg/ETOPO1_Ice_g_geotiff.resampled-1deg.tif"
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class TestTileCache:
+    def test_copies_file(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        local_path = cache.local_path(SRTM_PATH)
+        assert local_path.startswith(str(tmp_path))
+        assert os.path.basename(local_path) == os.path.basename(SRTM_PATH)
+        assert _read(local_path) == _read(SRTM_PATH)
+
+    def test_reuses_copy(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        local_path = cache.local_path(SRTM_PATH)
+        with patch.object(cache, "_fetch") as mock_fetch:
+            assert cache.local_path(SRTM_PATH) == local_path
+            mock_fetch.assert_not_called()
+
+    def test_shared_between_instances(self, tmp_path):
+        local_path = tilecache.TileCache(str(tmp_path), 10**9).local_path(SRTM_PATH)
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        with patch.object(cache, "_fetch") as mock_fetch:
+            assert cache.local_path(SRTM_PATH) == local_path
+            mock_fetch.assert_not_called()
+
+    def test_evicts_lru(self, tmp_path):
+        srtm_size = os.path.getsize(SRTM_PATH)
+        etopo_size = os.path.getsize(ETOPO1_GEOTIFF_PATH)
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=srtm_size + etopo_size)
+        srtm_local_path = cache.local_path(SRTM_PATH)
+        os.utime(srtm_local_path, (time.time() - 100, time.time() - 100))
+        etopo_local_path = cache.local_path(ETOPO1_GEOTIFF_PATH)
+        assert cache.size() == srtm_size + etopo_size
+
+        cache.max_bytes = srtm_size
+        cache.evict()
+        assert not os.path.exists(srtm_local_path)
+        assert os.path.exists(etopo_local_path)
+
+    def test_keeps_new_file_when_too_big(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=1)
+        local_path = cache.local_path(SRTM_PATH)
+        assert os.path.exists(local_path)
+
+    def test_failed_fetch_leaves_no_files(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        with patch("shutil.copyfileobj", side_effect=OSError):
+            with pytest.raises(OSError):
+                cache.local_path(SRTM_PATH)
+        assert cache.size() == 0
+        assert not os.listdir(tmp_path / tilecache.TMP_DIRNAME)
+
+    def test_stale_tmp_files_removed(self, tmp_path):
+        tmp_dir = tmp_path / tilecache.TMP_DIRNAME
+        tmp_dir.mkdir()
+        stale_path = tmp_dir / "partial"
+        stale_path.write_bytes(b"123")
+        old = time.time() - tilecache.STALE_TMP_AGE_S - 1
+        os.utime(stale_path, (old, old))
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        assert cache.size() == 0
+        assert not stale_path.exists()
+
+    def test_size_not_scanned_on_every_fetch(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        cache.local_path(SRTM_PATH)
+        with patch.object(cache, "_scan") as mock_scan:
+            cache.local_path(ETOPO1_GEOTIFF_PATH)
+            mock_scan.assert_not_called()
+
+    def test_evicts_once_estimate_too_big(self, tmp_path):
+        srtm_size = os.path.getsize(SRTM_PATH)
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=srtm_size)
+        srtm_local_path = cache.local_path(SRTM_PATH)
+        os.utime(srtm_local_path, (time.time() - 100, time.time() - 100))
+        cache.local_path(ETOPO1_GEOTIFF_PATH)
+        assert not os.path.exists(srtm_local_path)
+
+    def test_replace_retried_if_folder_removed(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        real_replace = os.replace
+        calls = []
+
+        def replace(src, dst):
+            if not calls:
+                calls.append(dst)
+                raise FileNotFoundError
+            real_replace(src, dst)
+
+        with patch("os.replace", side_effect=replace):
+            local_path = cache.local_path(SRTM_PATH)
+        assert _read(local_path) == _read(SRTM_PATH)
+
+    def test_discard(self, tmp_path):
+        cache = tilecache.TileCache(str(tmp_path), max_bytes=10**9)
+        local_path = cache.local_path(SRTM_PATH)
+        assert cache.cached_path(SRTM_PATH) == local_path
+        cache.discard(SRTM_PATH)
+        assert not os.path.exists(local_path)
+        assert os.path.exists(SRTM_PATH)
+        assert cache.size() == 0
+
+
+class TestUnzipCache:
+    def test_expands_zip(self, tmp_path):
+        cache = tilecache.UnzipCache(str(tmp_path), max_bytes=10**9)
+        local_path = cache.local_path(SRTM_ZIP_PATH)
+        assert local_path.startswith(str(tmp_path))
+        assert os.path.basename(local_path) == "N00E011.hgt"
+        with zipfile.ZipFile(SRTM_ZIP_PATH) as z:
+            assert _read(local_path) == z.read("N00E011.hgt")
+
+    def test_unzipped_file_read_in_place(self, tmp_path):
+        cache = tilecache.UnzipCache(str(tmp_path), max_bytes=10**9)
+        assert cache.local_path(SRTM_PATH) == SRTM_PATH
+        assert cache.cached_path(SRTM_PATH) == SRTM_PATH
+        assert cache.size() == 0
+
+    def test_discard_unzipped_file_kept(self, tmp_path):
+        cache = tilecache.UnzipCache(str(tmp_path), max_bytes=10**9)
+        cache.discard(SRTM_PATH)
+        assert os.path.exists(SRTM_PATH)
+
+    def test_reuses_copy(self, tmp_path):
+        cache = tilecache.UnzipCache(str(tmp_path), max_bytes=10**9)
+        local_path = cache.local_path(SRTM_ZIP_PATH)
+        with patch.object(cache, "_fetch") as mock_fetch:
+            assert cache.local_path(SRTM_ZIP_PATH) == local_path
+            mock_fetch.assert_not_called()
+
+    def test_ambiguous_zip(self, tmp_path):
+        path = tmp_path / "tiles.zip"
+        with zipfile.ZipFile(path, "w") as z:
+            z.writestr("a.tif", b"a")
+            z.writestr("b.tif", b"b")
+        cache = tilecache.UnzipCache(str(tmp_path / "cache"), max_bytes=10**9)
+        with pytest.raises(ValueError):
+            cache.local_path(str(path))
+        assert cache.size() == 0
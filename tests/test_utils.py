@@ -1,7 +1,11 @@
 from decimal import Decimal
+from unittest.mock import Mock, patch
+
 import pytest
 import numpy as np
 
+import rasterio
+
 from opentopodata import utils
 
 WGS84_LATLON_WKT = 'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]'
@@ -9,6 +13,40 @@ WGS84_LATLON_EPSG = 4326
 NAD83_WKT = 'GEOGCS["NAD83",DATUM["North_American_Datum_1983",SPHEROID["GRS 1980",6378137,298.257222101,AUTHORITY["EPSG","7019"]],AUTHORITY["EPSG","6269"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.01745329251994328,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4269"]]'
 
 
+class TestProjectedLocations:
+    def test_matches_reproject(self):
+        lats = np.array([10.5, 50, -20])
+        lons = np.array([120.8, 10, 30])
+        transformer = utils.latlon_transformer(epsg=3035)
+        xs, ys = utils.ProjectedLocations(lats, lons).project(3035, transformer)
+        xs_expected, ys_expected = utils.reproject_latlons(lats, lons, epsg=3035)
+        np.testing.assert_array_equal(xs, xs_expected)
+        np.testing.assert_array_equal(ys, ys_expected)
+
+    def test_each_location_projected_once(self):
+        transformer = Mock()
+        transformer.transform.side_effect = lambda x, y: (x * 2, y * 2)
+        locations = utils.ProjectedLocations([1, 2, 3, 4], [5, 6, 7, 8])
+
+        xs, ys = locations.take(np.array([1, 2])).project("crs", transformer)
+        assert xs.tolist() == [12, 14]
+        assert ys.tolist() == [4, 6]
+        xs, ys = locations.project("crs", transformer)
+        assert xs.tolist() == [10, 12, 14, 16]
+        xs, ys = locations.take(np.array([3, 0])).project("crs", transformer)
+        assert xs.tolist() == [16, 10]
+
+        converted = [c.args[0].tolist() for c in transformer.transform.call_args_list]
+        assert converted == [[6, 7], [5, 8]]
+
+    def test_nested_take(self):
+        locations = utils.ProjectedLocations([1, 2, 3, 4], [5, 6, 7, 8])
+        subset = locations.take(np.array([3, 2, 1])).take(np.array([0, 2]))
+        assert subset.lats.tolist() == [4, 2]
+        xs, ys = subset.project(WGS84_LATLON_EPSG, None)
+        assert xs.tolist() == [8, 6]
+
+
 class TestReprojectLatlons:
     def test_wgs84_invariance(self):
         lats = [-10, 0, 10]
@@ -67,6 +105,19 @@ class TestReprojectLatlons:
         utils.reproject_latlons(lats, lons, wkt=NAD83_WKT)
         assert NAD83_WKT in utils._TRANSFORMER_CACHE
 
+    def test_cache_bounded(self):
+        with patch.object(utils, "MAX_CACHED_TRANSFORMERS", 2):
+            for epsg in [3035, 32651, 32652]:
+                utils.latlon_transformer(epsg=epsg)
+            assert len(utils._TRANSFORMER_CACHE) <= 2
+            assert "EPSG:32652" in utils._TRANSFORMER_CACHE
+
+    def test_wgs84_transformer(self):
+        assert utils.latlon_transformer(epsg=WGS84_LATLON_EPSG) is None
+        xs, ys = utils.transform_latlons([1, 2], [3, 4], None)
+        assert xs == [3, 4]
+        assert ys == [1, 2]
+
 
 class TestBaseFloor:
     def test_base_1_default(self):
@@ -134,6 +185,19 @@ class TestFillNa:
         assert utils.fill_na(values, na_value) == replaced_values
 
 
+class TestGroupIndices:
+    def test_groups(self):
+        keys = np.array(["b", "a", "b", "c", "a"])
+        unique_keys, groups = utils.group_indices(keys)
+        assert unique_keys.tolist() == ["a", "b", "c"]
+        assert [g.tolist() for g in groups] == [[1, 4], [0, 2], [3]]
+
+    def test_empty(self):
+        unique_keys, groups = utils.group_indices(np.array([], dtype=int))
+        assert len(unique_keys) == 0
+        assert groups == []
+
+
 class TestSamplePointsOnPath:
     def test_two_points(self):
         start = (12.3, -45.6)
@@ -183,3 +247,63 @@ class TestSamplePointsOnPath:
         assert len(rlats) == n_points
         assert len(rlons) == n_points
         assert all(rlon >= lon or rlon <= -lon for rlon in rlons)
+
+
+class TestMtimeLRU:
+    def test_reused(self):
+        lru = utils.MtimeLRU(2)
+        value = lru.get("a", 1, object)
+        assert lru.get("a", 1, object) is value
+
+    def test_reopened_if_mtime_changes(self):
+        lru = utils.MtimeLRU(2)
+        value = lru.get("a", 1, object)
+        assert lru.get("a", 2, object) is not value
+        assert len(lru) == 1
+
+    def test_evicts_by_cost(self):
+        lru = utils.MtimeLRU(3)
+        lru.get("a", 1, object, cost=2)
+        lru.get("b", 1, object, cost=1)
+        lru.get("c", 1, object, cost=1)
+        assert len(lru) == 2
+        lru.resize(1)
+        assert len(lru) == 1
+
+    def test_discard(self):
+        lru = utils.MtimeLRU()
+        value = lru.get("a", 1, object)
+        lru.discard(["a", "b"])
+        assert len(lru) == 0
+        assert lru.get("a", 1, object) is not value
+
+
+class TestAssembleWindow:
+    @pytest.mark.parametrize(
+        "window",
+        [
+            rasterio.windows.Window(0, 0, 10, 7),
+            rasterio.windows.Window(3, 2, 4, 4),
+            rasterio.windows.Window(8, 5, 2, 2),
+            rasterio.windows.Window(4, 0, 1, 1),
+        ],
+    )
+    def test_matches_slice(self, window):
+        z = np.arange(70, dtype=float).reshape(7, 10)
+        tile_shape = (3, 4)
+        tiles = {
+            (r, c): z[r * 3 : (r + 1) * 3, c * 4 : (c + 1) * 4]
+            for r in range(3)
+            for c in range(3)
+        }
+        np.testing.assert_array_equal(
+            utils.assemble_window(window, tile_shape, tiles.__getitem__),
+            z[
+                window.row_off : window.row_off + window.height,
+                window.col_off : window.col_off + window.width,
+            ],
+        )
+
+    def test_window_tiles(self):
+        window = rasterio.windows.Window(3, 2, 4, 4)
+        assert utils.window_tiles(window, (3, 4)) == [(0, 0), (0, 1), (1, 0), (1, 1)]